@@ -20,6 +20,30 @@ function formatHealthLabel(health) {
   return 'Checking';
 }
 
+const JOB_POLL_INTERVAL_MS = 1500;
+const JOB_POLL_TIMEOUT_MS = 10 * 60 * 1000;
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+async function waitForJob(jobId) {
+  const deadline = Date.now() + JOB_POLL_TIMEOUT_MS;
+  while (Date.now() < deadline) {
+    const response = await fetch(`${API_URL}/api/chat/jobs/${encodeURIComponent(jobId)}`);
+    const job = await response.json();
+    if (!response.ok) {
+      throw new Error(job.error || job.detail || 'Failed to read sync status');
+    }
+    if (job.status === 'succeeded') {
+      return job.result || {};
+    }
+    if (job.status === 'failed') {
+      throw new Error(job.error || 'Regulation sync failed');
+    }
+    await sleep(JOB_POLL_INTERVAL_MS);
+  }
+  throw new Error('Regulation sync is still running; check back later');
+}
+
 function formatSources(context = []) {
   return context
     .filter((doc) => doc && (doc.source || doc.url))
@@ -145,12 +169,15 @@ const CustomerQueryChat = () => {
       const response = await fetch(`${API_URL}/api/chat/ingest-crawled`, {
         method: 'POST'
       });
-      const data = await response.json();
+      const accepted = await response.json();
 
       if (!response.ok) {
-        throw new Error(data.error || data.detail || 'Failed to sync regulation data');
+        throw new Error(accepted.error || accepted.detail || 'Failed to sync regulation data');
       }
 
+      // The RAG service queues ingestion as a background job and answers 202 with its id.
+      const data = accepted.job_id ? await waitForJob(accepted.job_id) : accepted;
+
       setMessages((prev) => [
         ...prev,
         {
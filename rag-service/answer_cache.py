@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").strip().lower() in ("1", "true", "yes", "on")
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "600"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "512"))
+
+_TRAILING_PUNCTUATION = re.compile(r"[\s?!.,;:]+$")
+
+AnswerKey = Tuple[str, int, int]
+
+
+def normalize_query(query: str) -> str:
+    """Case- and whitespace-insensitive form so trivially different phrasings share an entry."""
+    collapsed = " ".join(query.split()).lower()
+    return _TRAILING_PUNCTUATION.sub("", collapsed)
+
+
+class AnswerCache:
+    """
+    TTL + LRU cache for /chat results.
+
+    Keys include a corpus version that ingestion bumps, so answers computed
+    against an older corpus are never served after new documents land.
+    """
+
+    def __init__(
+        self,
+        ttl: float = ANSWER_CACHE_TTL,
+        max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+        enabled: bool = ANSWER_CACHE_ENABLED,
+    ) -> None:
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self.enabled = enabled
+        self.corpus_version = 0
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[AnswerKey, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def key(self, rewritten_query: str, limit: int) -> AnswerKey:
+        return (normalize_query(rewritten_query), int(limit), self.corpus_version)
+
+    def get(self, key: AnswerKey) -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is None:
+                self.misses += 1
+                return None
+            expires_at, value = cached
+            if expires_at <= now:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: AnswerKey, value: Dict[str, Any]) -> None:
+        if not self.enabled or key[2] != self.corpus_version:
+            # The corpus changed while this answer was being generated.
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def bump_corpus_version(self) -> int:
+        """Called after every successful ingest; old entries become unreachable and are dropped."""
+        with self._lock:
+            self.corpus_version += 1
+            self._entries.clear()
+            return self.corpus_version
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            size = len(self._entries)
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": size,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "corpus_version": self.corpus_version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+answer_cache = AnswerCache()
@@ -0,0 +1,539 @@
+"""
+Load and micro-benchmarks for the RAG service, runnable without Weaviate or an LLM.
+
+Weaviate and the chat-completions APIs are replaced by in-process stand-ins with
+configurable latency (installed as transports on the shared HTTP pools), and the
+app is driven in-process over ASGI at fixed concurrency levels. An event-loop
+lag probe runs alongside every level, so a handler that blocks the loop shows up
+as lag and collapsed throughput rather than just higher latency.
+
+    python bench.py --output bench.json
+    python bench.py --scenarios chat --concurrency 1,8,32 --llm-latency 0.5
+    python bench.py --compare bench.json   # exits 1 when p95 regressed beyond --tolerance
+
+The JSON report is meant to be committed or archived per commit and diffed.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import base64
+import importlib.util
+import io
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+
+SCENARIOS = ("chat", "ingest", "segment")
+MICRO_BENCHMARKS = ("chunk_text", "build_records", "local_search", "encode_cutout")
+
+WORDS = (
+    "textile labelling regulation fibre composition garment retailer consumer recycled polyester cotton "
+    "product passport durability repairability extended producer responsibility ecolabel size chart "
+    "return policy shipping warranty compliance market surveillance substances REACH microplastics"
+).split()
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile of ``values`` (``q`` in 0..100)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, min(len(ordered), int(round(q / 100.0 * len(ordered) + 0.5))))
+    return ordered[rank - 1]
+
+
+def summarize(seconds: List[float], unit: float = 1000.0) -> Dict[str, float]:
+    """p50/p95/p99/mean/max of ``seconds``, scaled by ``unit`` (milliseconds by default)."""
+    if not seconds:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "mean": 0.0, "max": 0.0}
+    return {
+        "p50": round(percentile(seconds, 50) * unit, 3),
+        "p95": round(percentile(seconds, 95) * unit, 3),
+        "p99": round(percentile(seconds, 99) * unit, 3),
+        "mean": round(sum(seconds) / len(seconds) * unit, 3),
+        "max": round(max(seconds) * unit, 3),
+    }
+
+
+def synthetic_text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def synthetic_image(rng: random.Random, size: int) -> bytes:
+    """A PNG with a noisy background and a shirt-like shape, different on every call."""
+    from PIL import Image, ImageDraw
+
+    background = tuple(rng.randint(170, 255) for _ in range(3))
+    image = Image.new("RGB", (size, size), background)
+    draw = ImageDraw.Draw(image)
+    for _ in range(40):
+        x, y = rng.randint(0, size), rng.randint(0, size)
+        radius = rng.randint(size // 40, size // 10)
+        shade = tuple(max(0, channel - rng.randint(10, 40)) for channel in background)
+        draw.ellipse((x - radius, y - radius, x + radius, y + radius), fill=shade)
+    garment = tuple(rng.randint(0, 140) for _ in range(3))
+    s = size
+    body = [(0.32 * s, 0.22 * s), (0.68 * s, 0.22 * s), (0.72 * s, 0.85 * s), (0.28 * s, 0.85 * s)]
+    left_sleeve = [(0.32 * s, 0.22 * s), (0.14 * s, 0.45 * s), (0.22 * s, 0.5 * s), (0.33 * s, 0.35 * s)]
+    right_sleeve = [(0.68 * s, 0.22 * s), (0.86 * s, 0.45 * s), (0.78 * s, 0.5 * s), (0.67 * s, 0.35 * s)]
+    for polygon in (body, left_sleeve, right_sleeve):
+        draw.polygon(polygon, fill=garment)
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class Latency:
+    """Mean latency with uniform relative jitter, drawn from a seeded generator."""
+
+    def __init__(self, mean: float, jitter: float, rng: random.Random) -> None:
+        self.mean = mean
+        self.jitter = jitter
+        self.rng = rng
+
+    async def wait(self) -> None:
+        if self.mean <= 0:
+            return
+        spread = self.mean * self.jitter
+        await asyncio.sleep(max(0.0, self.rng.uniform(self.mean - spread, self.mean + spread)))
+
+
+class FakeWeaviate:
+    """
+    Just enough of the Weaviate REST/GraphQL API for retrieval and ingestion:
+    readiness, schema, batch writes, BM25-shaped Get queries and id lookups.
+    """
+
+    def __init__(self, collection: str, latency: Latency, corpus: List[Dict[str, str]]) -> None:
+        self.collection = collection
+        self.latency = latency
+        self.corpus = corpus
+        self.objects: Dict[str, Dict[str, Any]] = {}
+        self.vectors: Dict[str, List[float]] = {}
+        self.requests = 0
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        await self.latency.wait()
+        path = request.url.path
+        if path == "/v1/.well-known/ready":
+            return httpx.Response(200)
+        if path.startswith("/v1/schema"):
+            return httpx.Response(200, json={"class": self.collection, "properties": []})
+        if path == "/v1/batch/objects" and request.method == "POST":
+            objects = json.loads(request.content)["objects"]
+            for obj in objects:
+                self.objects[obj["id"]] = obj["properties"]
+                self.vectors[obj["id"]] = obj.get("vector") or []
+            return httpx.Response(200, json=[{"id": obj["id"], "result": {}} for obj in objects])
+        if path == "/v1/batch/objects" and request.method == "DELETE":
+            return httpx.Response(200, json={"results": {"matches": 0, "successful": 0, "failed": 0}})
+        if path == "/v1/graphql":
+            return httpx.Response(200, json={"data": {"Get": {self.collection: self.graphql(request)}}})
+        return httpx.Response(404, json={"error": [{"message": f"{path} not faked"}]})
+
+    def graphql(self, request: httpx.Request) -> List[Dict[str, Any]]:
+        query = json.loads(request.content).get("query", "")
+        if "ContainsAny" in query:
+            ids = json.loads(re.search(r"valueText: (\[.*?\])", query).group(1))
+            with_vector = "vector" in query.split("_additional", 1)[-1]
+            return [
+                {"_additional": {"id": object_id, **({"vector": self.vectors[object_id]} if with_vector else {})}}
+                for object_id in ids
+                if object_id in self.objects
+            ]
+        match = re.search(r"limit: (\d+)", query)
+        limit = int(match.group(1)) if match else 5
+        return [
+            {**doc, "_additional": {"score": str(round(2.0 - index * 0.1, 3))}}
+            for index, doc in enumerate(self.corpus[:limit])
+        ]
+
+
+class FakeChatCompletions:
+    """OpenAI-compatible chat completions, plain and ``stream: true``."""
+
+    def __init__(self, latency: Latency, answer_words: int) -> None:
+        self.latency = latency
+        self.answer_words = answer_words
+        self.requests = 0
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        await self.latency.wait()
+        body = json.loads(request.content)
+        answer = " ".join(WORDS[index % len(WORDS)] for index in range(self.answer_words)) + " [1]"
+        if body.get("stream"):
+            lines = [
+                f"data: {json.dumps({'choices': [{'delta': {'content': word + ' '}}]})}\n\n"
+                for word in answer.split()
+            ]
+            lines.append("data: [DONE]\n\n")
+            return httpx.Response(200, content="".join(lines).encode(), headers={"content-type": "text/event-stream"})
+        return httpx.Response(
+            200,
+            json={"model": body.get("model"), "choices": [{"message": {"role": "assistant", "content": answer}}]},
+        )
+
+
+class LoopLagProbe:
+    """Measures how late a periodic ``asyncio.sleep`` wakes up; sustained lag means something blocks the loop."""
+
+    def __init__(self, interval: float = 0.01) -> None:
+        self.interval = interval
+        self.lags: List[float] = []
+        self._task: Optional["asyncio.Task[None]"] = None
+
+    async def _run(self) -> None:
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, time.perf_counter() - started - self.interval))
+
+    def __enter__(self) -> "LoopLagProbe":
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        if self._task is not None:
+            self._task.cancel()
+
+
+RequestFactory = Callable[[int], Tuple[str, str, Dict[str, Any]]]
+
+
+async def run_level(
+    client: httpx.AsyncClient,
+    make_request: RequestFactory,
+    concurrency: int,
+    requests: int,
+) -> Dict[str, Any]:
+    """Send ``requests`` requests with ``concurrency`` workers pulling from a shared counter."""
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    errors: List[str] = []
+    counter = iter(range(requests))
+
+    async def worker() -> None:
+        for index in counter:
+            method, path, kwargs = make_request(index)
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, path, **kwargs)
+                await response.aread()
+                status = str(response.status_code)
+            except Exception as exc:
+                status = "error"
+                if len(errors) < 5:
+                    errors.append(f"{type(exc).__name__}: {exc}")
+            latencies.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    with LoopLagProbe() as probe:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    ok = sum(count for status, count in statuses.items() if status.startswith("2"))
+    result: Dict[str, Any] = {
+        "concurrency": concurrency,
+        "requests": requests,
+        "ok": ok,
+        "statuses": dict(sorted(statuses.items())),
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(ok / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": summarize(latencies),
+        "loop_lag_ms": summarize(probe.lags),
+    }
+    if errors:
+        result["errors"] = errors
+    return result
+
+
+def chat_requests(rng: random.Random) -> RequestFactory:
+    def make(index: int) -> Tuple[str, str, Dict[str, Any]]:
+        # A unique query per request keeps the answer cache out of the measurement.
+        query = f"{synthetic_text(rng, 8)} #{index}"
+        return "POST", "/chat", {"json": {"query": query, "limit": 5}}
+
+    return make
+
+
+def ingest_requests(rng: random.Random, documents: int, words: int) -> RequestFactory:
+    def make(index: int) -> Tuple[str, str, Dict[str, Any]]:
+        docs = [
+            {"text": synthetic_text(rng, words), "source": f"bench-{index}-{doc}", "category": "bench"}
+            for doc in range(documents)
+        ]
+        return "POST", "/ingest?wait=true", {"json": {"docs": docs}}
+
+    return make
+
+
+def segment_requests(images: Iterator[bytes]) -> RequestFactory:
+    """Each request takes the next pre-generated image, so neither the cutout cache nor single-flight can serve it."""
+
+    def make(index: int) -> Tuple[str, str, Dict[str, Any]]:
+        encoded = base64.b64encode(next(images)).decode("ascii")
+        return "POST", "/segment/cloth-only", {"json": {"image_base64": encoded}}
+
+    return make
+
+
+def time_calls(fn: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    samples: List[float] = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return {"repeat": repeat, **summarize(samples, unit=1_000_000.0)}
+
+
+def run_micro(main: Any, rng: random.Random, names: List[str], repeat: int) -> Dict[str, Any]:
+    """CPU-bound helpers on the request path, timed in microseconds per call."""
+    from local_index import LocalIndex
+
+    results: Dict[str, Any] = {}
+    document = synthetic_text(rng, 20000)
+    docs = [main.IngestDoc(text=synthetic_text(rng, 600), source=f"micro-{i}", category="bench") for i in range(50)]
+    if "chunk_text" in names:
+        results["chunk_text"] = time_calls(lambda: main.chunk_text(document, 800, 100), repeat)
+    if "build_records" in names:
+        results["build_records"] = time_calls(lambda: main.build_records(docs, 800, 100), repeat)
+    if "local_search" in names:
+        with tempfile.TemporaryDirectory() as directory:
+            index = LocalIndex(os.path.join(directory, "micro.idx"))
+            index.replace_records(main.build_records(docs * 20, 800, 100))
+            queries = [synthetic_text(rng, 6) for _ in range(32)]
+            cursor = iter(range(1 << 30))
+            results["local_search"] = time_calls(lambda: index.search(queries[next(cursor) % len(queries)], 5), repeat)
+    if "encode_cutout" in names:
+        from PIL import Image
+
+        from segmentation import DEFAULT_CUTOUT_OPTIONS, encode_cutout
+
+        cutout = Image.open(io.BytesIO(synthetic_image(rng, 768))).convert("RGBA")
+        results["encode_cutout"] = time_calls(lambda: encode_cutout(cutout, DEFAULT_CUTOUT_OPTIONS), max(1, repeat // 10))
+    return results
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True, timeout=5
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+def configure_environment(workdir: str) -> None:
+    """Point every on-disk cache at a scratch directory and enable the OpenAI path before ``main`` is imported."""
+    os.environ.setdefault("WEAVIATE_HOST", "http://weaviate.bench")
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    os.environ.setdefault("RAG_RETRIEVER", "weaviate")
+    os.environ.setdefault("SEGMENTATION_WARMUP", "false")
+    os.environ["LOCAL_INDEX_PATH"] = os.path.join(workdir, "bm25.idx")
+    os.environ["CUTOUT_CACHE_DIR"] = os.path.join(workdir, "cutouts")
+    os.environ["CRAWL_STATE_PATH"] = os.path.join(workdir, "crawl_state.json")
+    os.environ["REGULATIONS_PATH"] = os.path.join(workdir, "fashion_regulations.json")
+
+
+async def run_benchmarks(args: argparse.Namespace) -> Dict[str, Any]:
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory(prefix="rag-bench-") as workdir:
+        configure_environment(workdir)
+        import main
+        from http_clients import http_clients
+
+        corpus = [
+            {"text": synthetic_text(rng, 120), "source": f"corpus-{i}", "url": "", "category": "bench"}
+            for i in range(20)
+        ]
+        weaviate = FakeWeaviate(main.COLLECTION_NAME, Latency(args.weaviate_latency, args.jitter, rng), corpus)
+        llm = FakeChatCompletions(Latency(args.llm_latency, args.jitter, rng), args.answer_words)
+        for name in ("weaviate", "weaviate-ingest"):
+            http_clients.override(name, httpx.AsyncClient(transport=httpx.MockTransport(weaviate.handle)))
+        for name in ("openai", "hf"):
+            http_clients.override(name, httpx.AsyncClient(transport=httpx.MockTransport(llm.handle)))
+
+        levels = [int(value) for value in args.concurrency.split(",") if value.strip()]
+        scenarios: Dict[str, Any] = {}
+        await main.app.router.startup()
+        try:
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+                for scenario in args.scenarios:
+                    if scenario == "segment" and importlib.util.find_spec("rembg") is None:
+                        scenarios[scenario] = {"skipped": "rembg is not installed"}
+                        print("segment: skipped (rembg is not installed)", file=sys.stderr)
+                        continue
+                    if scenario == "chat":
+                        make = chat_requests(rng)
+                    elif scenario == "ingest":
+                        make = ingest_requests(rng, args.ingest_documents, args.ingest_words)
+                    else:
+                        # One image per request, generated up front so encoding stays out of the timed loop.
+                        total = args.warmup + len(levels) * args.segment_requests
+                        make = segment_requests(iter([synthetic_image(rng, args.image_size) for _ in range(total)]))
+                    requests = args.segment_requests if scenario == "segment" else args.requests
+                    # Warm-up: first-call costs (schema check, model load, worker spawn) stay out of the numbers.
+                    warmup = await run_level(client, make, 1, args.warmup)
+                    if warmup["ok"] < warmup["requests"]:
+                        print(
+                            f"WARNING {scenario} warm-up: statuses {warmup['statuses']} {warmup.get('errors', '')}",
+                            file=sys.stderr,
+                        )
+                    scenarios[scenario] = []
+                    for level in levels:
+                        result = await run_level(client, make, level, requests)
+                        scenarios[scenario].append(result)
+                        latency = result["latency_ms"]
+                        print(
+                            f"{scenario} c={level}: {result['throughput_rps']} req/s, p50 {latency['p50']} ms, "
+                            f"p95 {latency['p95']} ms, p99 {latency['p99']} ms, "
+                            f"loop lag p99 {result['loop_lag_ms']['p99']} ms, statuses {result['statuses']}",
+                            file=sys.stderr,
+                        )
+        finally:
+            await main.app.router.shutdown()
+
+        micro = run_micro(main, rng, args.micro, args.micro_repeat) if args.micro else {}
+
+    return {
+        "meta": {
+            "revision": git_revision(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "config": {
+                "seed": args.seed,
+                "concurrency": levels,
+                "requests": args.requests,
+                "segment_requests": args.segment_requests,
+                "weaviate_latency_s": args.weaviate_latency,
+                "llm_latency_s": args.llm_latency,
+                "jitter": args.jitter,
+                "ingest_documents": args.ingest_documents,
+                "ingest_words": args.ingest_words,
+                "image_size": args.image_size,
+            },
+        },
+        "scenarios": scenarios,
+        "micro": micro,
+    }
+
+
+def failed_levels(report: Dict[str, Any]) -> List[str]:
+    """Lines for every level that got non-2xx responses or transport errors."""
+    lines: List[str] = []
+    for scenario, levels in report["scenarios"].items():
+        if not isinstance(levels, list):
+            continue
+        for level in levels:
+            if level["ok"] < level["requests"]:
+                failures = {status: count for status, count in level["statuses"].items() if not status.startswith("2")}
+                lines.append(f"FAILED {scenario} c={level['concurrency']}: {failures} {level.get('errors', '')}".rstrip())
+    return lines
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Lines describing p95 changes against ``baseline``; regressions beyond ``tolerance`` are marked."""
+    lines: List[str] = []
+    for scenario, levels in report["scenarios"].items():
+        if not isinstance(levels, list):
+            continue
+        baseline_levels = baseline.get("scenarios", {}).get(scenario)
+        if not isinstance(baseline_levels, list):
+            continue
+        previous = {level["concurrency"]: level for level in baseline_levels}
+        for level in levels:
+            before = previous.get(level["concurrency"])
+            if not before:
+                continue
+            old, new = before["latency_ms"]["p95"], level["latency_ms"]["p95"]
+            change = (new - old) / old if old else 0.0
+            marker = "REGRESSION " if change > tolerance else ""
+            lines.append(f"{marker}{scenario} c={level['concurrency']}: p95 {old} -> {new} ms ({change:+.0%})")
+    for name, result in report.get("micro", {}).items():
+        before = baseline.get("micro", {}).get(name)
+        if not before:
+            continue
+        old, new = before["p95"], result["p95"]
+        change = (new - old) / old if old else 0.0
+        marker = "REGRESSION " if change > tolerance else ""
+        lines.append(f"{marker}{name}: p95 {old} -> {new} us ({change:+.0%})")
+    return lines
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated subset of %(default)s")
+    parser.add_argument("--concurrency", default="1,4,16", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=200, help="requests per level for chat and ingest")
+    parser.add_argument("--segment-requests", type=int, default=20, help="requests per level for segmentation")
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--weaviate-latency", type=float, default=0.01, help="seconds per fake Weaviate call")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="seconds per fake chat completion")
+    parser.add_argument("--jitter", type=float, default=0.2, help="relative latency jitter (0.2 = +/-20%%)")
+    parser.add_argument("--answer-words", type=int, default=60)
+    parser.add_argument("--ingest-documents", type=int, default=5, help="documents per /ingest request")
+    parser.add_argument("--ingest-words", type=int, default=400, help="words per ingested document")
+    parser.add_argument("--image-size", type=int, default=768)
+    parser.add_argument("--micro", default=",".join(MICRO_BENCHMARKS), help="micro-benchmarks to run ('' for none)")
+    parser.add_argument("--micro-repeat", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--compare", help="baseline report to compare p95 latencies against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative p95 increase with --compare")
+    parser.add_argument("--allow-errors", action="store_true", help="exit 0 even when requests got non-2xx responses")
+    args = parser.parse_args(argv)
+    args.scenarios = [name for name in args.scenarios.split(",") if name]
+    args.micro = [name for name in args.micro.split(",") if name]
+    unknown = set(args.scenarios) - set(SCENARIOS) | set(args.micro) - set(MICRO_BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(sorted(unknown))}")
+    return args
+
+
+def main_cli(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    report = asyncio.run(run_benchmarks(args))
+    payload = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(payload + "\n")
+    else:
+        print(payload)
+
+    failed = failed_levels(report)
+    for line in failed:
+        print(line, file=sys.stderr)
+    if failed and not args.allow_errors:
+        # Latencies of rejected requests measure the error path, not the feature.
+        return 1
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+        lines = compare(report, baseline, args.tolerance)
+        for line in lines:
+            print(line, file=sys.stderr)
+        if any(line.startswith("REGRESSION") for line in lines):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import os
+import re
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "1500"))
+# Rough English average for GPT/Mistral tokenizers; only used to size the budget.
+CONTEXT_CHARS_PER_TOKEN = float(os.getenv("CONTEXT_CHARS_PER_TOKEN", "4"))
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.8"))
+CONTEXT_MIN_OVERLAP = int(os.getenv("CONTEXT_MIN_OVERLAP", "20"))
+# A chunk that does not fit is truncated into the remaining budget only if at least this much is left.
+CONTEXT_MIN_TRUNCATED_TOKENS = int(os.getenv("CONTEXT_MIN_TRUNCATED_TOKENS", "80"))
+
+# Numbering, the "Source:" line and separators that build_context adds around each chunk.
+ENTRY_OVERHEAD_TOKENS = 8
+SHINGLE_WORDS = 3
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def estimate_tokens(text: str) -> int:
+    return int(len(text) / CONTEXT_CHARS_PER_TOKEN + 0.999)
+
+
+def doc_score(doc: Dict[str, Any]) -> float:
+    # Weaviate returns scores as strings; missing scores sort after scored chunks but keep retrieval order.
+    try:
+        return float(doc.get("score"))
+    except (TypeError, ValueError):
+        return float("-inf")
+
+
+def merge_overlap(first: str, second: str, min_overlap: int = CONTEXT_MIN_OVERLAP) -> Optional[str]:
+    """
+    Join two chunks when the end of ``first`` is the start of ``second``, as produced
+    by chunking with ``chunk_overlap``. Returns None when they do not overlap.
+    """
+    if len(second) < min_overlap or len(first) < min_overlap:
+        return None
+    head = second[:min_overlap]
+    position = first.find(head, max(0, len(first) - len(second)))
+    while position != -1:
+        tail = first[position:]
+        if second.startswith(tail):
+            return first + second[len(tail) :]
+        position = first.find(head, position + 1)
+    return None
+
+
+def shingles(text: str) -> Set[Tuple[str, ...]]:
+    words = _TOKEN_PATTERN.findall(text.lower())
+    if len(words) <= SHINGLE_WORDS:
+        return {tuple(words)} if words else set()
+    return {tuple(words[index : index + SHINGLE_WORDS]) for index in range(len(words) - SHINGLE_WORDS + 1)}
+
+
+def is_near_duplicate(candidate: Set[Tuple[str, ...]], kept: Set[Tuple[str, ...]], threshold: float) -> bool:
+    """Containment rather than Jaccard, so a chunk that sits inside a longer merged one also counts."""
+    if not candidate or not kept:
+        return False
+    return len(candidate & kept) / min(len(candidate), len(kept)) >= threshold
+
+
+def merge_adjacent(docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Merge overlapping chunks of the same source and URL; a merged chunk keeps the best score and rank."""
+    merged: List[Dict[str, Any]] = []
+    for doc in docs:
+        current = dict(doc)
+        changed = True
+        while changed:
+            changed = False
+            for index, other in enumerate(merged):
+                if (other.get("source"), other.get("url")) != (current.get("source"), current.get("url")):
+                    continue
+                text = merge_overlap(other["text"], current["text"]) or merge_overlap(current["text"], other["text"])
+                if text is None:
+                    continue
+                best = other if doc_score(other) >= doc_score(current) else current
+                current = {**best, "text": text, "rank": min(other["rank"], current["rank"])}
+                del merged[index]
+                changed = True
+                break
+        merged.append(current)
+    return merged
+
+
+def truncate_to_tokens(text: str, tokens: int) -> str:
+    limit = int(tokens * CONTEXT_CHARS_PER_TOKEN)
+    if len(text) <= limit:
+        return text
+    cut = text.rfind(" ", 0, limit)
+    return text[: cut if cut > 0 else limit].rstrip() + " …"
+
+
+def assemble_context(
+    docs: List[Dict[str, Any]],
+    max_tokens: int = CONTEXT_MAX_TOKENS,
+    dedup_threshold: float = CONTEXT_DEDUP_THRESHOLD,
+) -> List[Dict[str, Any]]:
+    """
+    Turn retrieved chunks into the documents that go into the prompt.
+
+    Chunks that are (nearly) contained in a better-ranked one are dropped, and the
+    rest are taken best score first until ``max_tokens`` is used up; the first
+    chunk that no longer fits is truncated into the remainder if that is worth it.
+    Only then are overlapping selected chunks of one source stitched back
+    together, so a low-scored neighbour can never push a better chunk out of the
+    budget.
+    """
+    ranked = [
+        {**doc, "text": (doc.get("text") or "").strip(), "rank": rank}
+        for rank, doc in enumerate(docs)
+        if (doc.get("text") or "").strip()
+    ]
+    candidates = sorted(ranked, key=lambda doc: (-doc_score(doc), doc["rank"]))
+
+    selected: List[Dict[str, Any]] = []
+    kept_shingles: List[Set[Tuple[str, ...]]] = []
+    remaining = max_tokens
+    for doc in candidates:
+        doc_shingles = shingles(doc["text"])
+        if any(is_near_duplicate(doc_shingles, kept, dedup_threshold) for kept in kept_shingles):
+            continue
+        cost = estimate_tokens(doc["text"]) + ENTRY_OVERHEAD_TOKENS
+        if cost > remaining:
+            if remaining - ENTRY_OVERHEAD_TOKENS >= CONTEXT_MIN_TRUNCATED_TOKENS:
+                doc = {**doc, "text": truncate_to_tokens(doc["text"], remaining - ENTRY_OVERHEAD_TOKENS)}
+                selected.append(doc)
+            break
+        selected.append(doc)
+        kept_shingles.append(doc_shingles)
+        remaining -= cost
+
+    # Merging only removes repeated overlap, so the stitched entries stay within the budget.
+    merged = sorted(merge_adjacent(selected), key=lambda doc: (-doc_score(doc), doc["rank"]))
+    for doc in merged:
+        doc.pop("rank", None)
+    return merged
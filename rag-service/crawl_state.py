@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import difflib
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from typing_extensions import TypedDict
+
+CRAWL_STATE_PATH = os.getenv("CRAWL_STATE_PATH", ".cache/crawl_state.json")
+# Default seconds before a source is re-crawled; SOURCES entries may override it with "max_age".
+CRAWL_MAX_AGE = float(os.getenv("CRAWL_MAX_AGE", "86400"))
+
+
+class ParagraphChange(TypedDict):
+    before: str
+    after: str
+
+
+class CrawledSource(TypedDict):
+    source: str
+    url: str
+    category: str
+    paragraphs: List[str]
+    crawled_at: float
+
+
+class SourceDiff(TypedDict):
+    source: str
+    url: str
+    category: str
+    added: List[str]
+    changed: List[ParagraphChange]
+    removed: List[str]
+    unchanged: int
+
+
+def paragraph_hash(text: str) -> str:
+    return hashlib.sha256(" ".join(text.split()).encode("utf-8")).hexdigest()[:16]
+
+
+def diff_paragraphs(before: List[str], after: List[str]) -> Dict[str, Any]:
+    """
+    Align two paragraph lists by content hash.
+
+    Runs of replaced paragraphs are paired up as changes; anything left over on
+    either side is an addition or removal, so an inserted paragraph does not mark
+    everything after it as changed.
+    """
+    old_hashes = [paragraph_hash(text) for text in before]
+    new_hashes = [paragraph_hash(text) for text in after]
+    added: List[str] = []
+    changed: List[ParagraphChange] = []
+    removed: List[str] = []
+    unchanged = 0
+    matcher = difflib.SequenceMatcher(a=old_hashes, b=new_hashes, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            unchanged += i2 - i1
+            continue
+        old_run, new_run = before[i1:i2], after[j1:j2]
+        paired = min(len(old_run), len(new_run)) if tag == "replace" else 0
+        changed.extend({"before": old, "after": new} for old, new in zip(old_run[:paired], new_run[:paired]))
+        removed.extend(old_run[paired:])
+        added.extend(new_run[paired:])
+    return {"added": added, "changed": changed, "removed": removed, "unchanged": unchanged}
+
+
+def _entry(crawl: CrawledSource) -> Dict[str, Any]:
+    return {
+        "source": crawl["source"],
+        "category": crawl["category"],
+        "crawled_at": crawl["crawled_at"],
+        "paragraphs": [{"hash": paragraph_hash(text), "text": text} for text in crawl["paragraphs"]],
+    }
+
+
+class CrawlState:
+    """
+    Persistent record of what each crawled URL last contained.
+
+    Per URL it keeps the source metadata, the crawl time and the ordered
+    paragraphs with their hashes, which is enough to decide whether a source is
+    due for a re-crawl and to diff a fresh crawl against the last one.
+    """
+
+    def __init__(self, path: str = CRAWL_STATE_PATH, max_age: float = CRAWL_MAX_AGE) -> None:
+        self.path = path
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._urls: Dict[str, Dict[str, Any]] = {}
+        self.load()
+
+    def load(self) -> None:
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        with self._lock:
+            self._urls = data.get("urls", {}) if isinstance(data, dict) else {}
+
+    def save(self) -> None:
+        with self._lock:
+            payload = json.dumps({"urls": self._urls})
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(payload)
+        os.replace(tmp_path, self.path)
+
+    @property
+    def empty(self) -> bool:
+        return not self._urls
+
+    def is_fresh(self, url: str, max_age: Optional[float] = None, now: Optional[float] = None) -> bool:
+        entry = self._urls.get(url)
+        if not entry:
+            return False
+        age_limit = self.max_age if max_age is None else max_age
+        return (now or time.time()) - entry.get("crawled_at", 0) < age_limit
+
+    def diff(self, crawl: CrawledSource) -> SourceDiff:
+        """How ``crawl`` differs from the last recorded crawl of its URL; records nothing."""
+        with self._lock:
+            previous = self._urls.get(crawl["url"], {})
+            before = [item["text"] for item in previous.get("paragraphs", [])]
+        diff = diff_paragraphs(before, crawl["paragraphs"])
+        return {"source": crawl["source"], "url": crawl["url"], "category": crawl["category"], **diff}
+
+    def apply(self, crawls: List[CrawledSource]) -> None:
+        """Record ``crawls`` as the latest content of their URLs (call ``save`` to persist)."""
+        with self._lock:
+            for crawl in crawls:
+                self._urls[crawl["url"]] = _entry(crawl)
+
+    def regulations(self, pending: Optional[List[CrawledSource]] = None) -> List[Dict[str, Any]]:
+        """
+        Current paragraphs of every tracked URL, in the row format of fashion_regulations.json,
+        as they will be once ``pending`` crawls are applied.
+        """
+        rows: List[Dict[str, Any]] = []
+        with self._lock:
+            urls = dict(self._urls)
+        for crawl in pending or []:
+            urls[crawl["url"]] = _entry(crawl)
+        for url, entry in urls.items():
+            crawled_at = time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(entry.get("crawled_at", 0)))
+            for item in entry.get("paragraphs", []):
+                rows.append(
+                    {
+                        "title": entry["source"],
+                        "source": entry["source"],
+                        "category": entry.get("category", "EU Regulation"),
+                        "content": item["text"],
+                        "url": url,
+                        "crawled_at": crawled_at,
+                    }
+                )
+        return rows
+
+    def status(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            entries = list(self._urls.items())
+        return {
+            "path": self.path,
+            "urls": len(entries),
+            "paragraphs": sum(len(entry.get("paragraphs", [])) for _, entry in entries),
+            "fresh_urls": sum(1 for url, _ in entries if self.is_fresh(url, now=now)),
+            "max_age_seconds": self.max_age,
+        }
+
+
+crawl_state = CrawlState()
@@ -1,8 +1,33 @@
+import hashlib
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
 import requests
 from bs4 import BeautifulSoup
 import json
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from crawl_state import CrawledSource, CrawlState, SourceDiff, crawl_state
+
+CRAWL_TIMEOUT = float(os.getenv("CRAWL_TIMEOUT", "5"))
+CRAWL_CONCURRENCY = max(1, int(os.getenv("CRAWL_CONCURRENCY", "8")))
+# Politeness: simultaneous requests and minimum spacing between request starts per host.
+CRAWL_PER_HOST = max(1, int(os.getenv("CRAWL_PER_HOST", "2")))
+CRAWL_HOST_DELAY = float(os.getenv("CRAWL_HOST_DELAY", "0.25"))
+CRAWL_CACHE_DIR = os.getenv("CRAWL_CACHE_DIR", ".cache/crawl")
+# Pages larger than this are parsed in a worker process instead of the fetch thread.
+CRAWL_PARSE_INLINE_BYTES = int(os.getenv("CRAWL_PARSE_INLINE_BYTES", str(256 * 1024)))
+CRAWL_PARSE_WORKERS = max(1, int(os.getenv("CRAWL_PARSE_WORKERS", "2")))
+USER_AGENT = "Mozilla/5.0 (Fashion Compliance Crawler)"
+CRAWL_MAX_PARAGRAPHS = int(os.getenv("CRAWL_MAX_PARAGRAPHS", "3"))
+# Below this many crawled paragraphs the curated FALLBACK_DATA is added.
+MIN_CRAWLED_REGULATIONS = 5
 
 SOURCES = [
     {
@@ -73,15 +98,89 @@ FALLBACK_DATA = [
 ]
 
 
-def fetch_page(url: str) -> Optional[str]:
-    try:
-        headers = {"User-Agent": "Mozilla/5.0 (Fashion Compliance Crawler)"}
-        response = requests.get(url, headers=headers, timeout=5)
-        response.raise_for_status()
-        return response.text
-    except Exception as e:
-        print(f"Error fetching {url}: {e}")
-        return None
+class CrawlCache:
+    """
+    On-disk HTTP cache for crawled pages: one JSON file per URL holding the
+    response validators and the already-parsed paragraphs, so a 304 costs
+    neither a download nor a parse.
+    """
+
+    def __init__(self, directory: str = CRAWL_CACHE_DIR):
+        self.directory = directory
+
+    def _path(self, url: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(url.encode("utf-8")).hexdigest() + ".json")
+
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._path(url), "r") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return entry if entry.get("url") == url else None
+
+    def put(self, url: str, entry: Dict[str, Any]) -> None:
+        path = self._path(url)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({**entry, "url": url}, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Crawl cache write failed for {url}: {e}")
+
+
+class HostLimiter:
+    """Caps concurrent requests per host and spaces out their start times."""
+
+    def __init__(self, per_host: int = CRAWL_PER_HOST, delay: float = CRAWL_HOST_DELAY):
+        self.per_host = per_host
+        self.delay = delay
+        self._lock = threading.Lock()
+        self._slots: Dict[str, threading.Semaphore] = {}
+        self._next_start: Dict[str, float] = {}
+
+    @contextmanager
+    def slot(self, url: str) -> Iterator[None]:
+        host = urlsplit(url).netloc.lower()
+        with self._lock:
+            semaphore = self._slots.setdefault(host, threading.Semaphore(self.per_host))
+        with semaphore:
+            with self._lock:
+                now = time.monotonic()
+                start = max(now, self._next_start.get(host, now))
+                self._next_start[host] = start + self.delay
+            if start > now:
+                time.sleep(start - now)
+            yield
+
+
+def fetch_page(
+    url: str,
+    session: Optional[requests.Session] = None,
+    validators: Optional[Dict[str, str]] = None,
+) -> Tuple[Optional[str], Dict[str, str]]:
+    """
+    GET ``url``, conditionally when ``validators`` (etag / last_modified) are given.
+
+    Returns ``(html, validators)``; ``html`` is None on a 304 and the error is raised
+    for failed requests so the caller can fall back to its cached copy.
+    """
+    headers = {"User-Agent": USER_AGENT}
+    validators = validators or {}
+    if validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+    response = (session or requests).get(url, headers=headers, timeout=CRAWL_TIMEOUT)
+    if response.status_code == 304 and validators:
+        return None, validators
+    response.raise_for_status()
+    return response.text, {
+        "etag": response.headers.get("ETag", ""),
+        "last_modified": response.headers.get("Last-Modified", ""),
+    }
 
 
 def parse_regulations(html: str) -> List[str]:
@@ -90,45 +189,243 @@ def parse_regulations(html: str) -> List[str]:
     return [p.get_text().strip() for p in paragraphs if len(p.get_text().strip()) > 50]
 
 
-def crawl_fashion_regulations() -> List[Dict]:
+class Crawler:
+    """
+    Fetches sources concurrently (bounded overall and per host), revalidates
+    cached pages with conditional requests and parses large pages in a process pool.
+    """
+
+    def __init__(
+        self,
+        cache: Optional[CrawlCache] = None,
+        limiter: Optional[HostLimiter] = None,
+        concurrency: int = CRAWL_CONCURRENCY,
+    ):
+        self.cache = cache or CrawlCache()
+        self.limiter = limiter or HostLimiter()
+        self.concurrency = concurrency
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._parse_lock = threading.Lock()
+        self._parse_pool: Optional[ProcessPoolExecutor] = None
+
+    def parse(self, html: str) -> List[str]:
+        if len(html) <= CRAWL_PARSE_INLINE_BYTES:
+            return parse_regulations(html)
+        with self._parse_lock:
+            if self._parse_pool is None:
+                self._parse_pool = ProcessPoolExecutor(
+                    max_workers=CRAWL_PARSE_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            pool = self._parse_pool
+        return pool.submit(parse_regulations, html).result()
+
+    def crawl_source(self, source: Dict[str, str]) -> Dict[str, Any]:
+        """Return ``{"source", "status", "paragraphs"}``; status is fetched, not_modified, stale or failed."""
+        url = source["url"]
+        cached = self.cache.get(url)
+        validators = (
+            {"etag": cached.get("etag", ""), "last_modified": cached.get("last_modified", "")} if cached else None
+        )
+        try:
+            with self.limiter.slot(url):
+                html, validators = fetch_page(url, self.session, validators)
+        except Exception as e:
+            if cached:
+                print(f"Error fetching {url}: {e} (using cached copy)")
+                return {"source": source, "status": "stale", "paragraphs": cached.get("paragraphs", [])}
+            print(f"Error fetching {url}: {e}")
+            return {"source": source, "status": "failed", "paragraphs": []}
+
+        if html is None:
+            return {"source": source, "status": "not_modified", "paragraphs": cached.get("paragraphs", [])}
+
+        paragraphs = self.parse(html)
+        self.cache.put(url, {**validators, "paragraphs": paragraphs, "fetched_at": datetime.now().isoformat()})
+        return {"source": source, "status": "fetched", "paragraphs": paragraphs}
+
+    def crawl(self, sources: List[Dict[str, str]]) -> List[Dict[str, Any]]:
+        """Crawl all sources in parallel; results keep the order of ``sources``."""
+        if not sources:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(sources))) as pool:
+            return list(pool.map(self.crawl_source, sources))
+
+    def close(self) -> None:
+        self.session.close()
+        if self._parse_pool is not None:
+            self._parse_pool.shutdown(cancel_futures=True)
+            self._parse_pool = None
+
+
+def crawl_fashion_regulations(
+    sources: Optional[List[Dict[str, str]]] = None,
+    cache_dir: Optional[str] = None,
+) -> List[Dict]:
     """Crawl EU fashion regulations; fallback to curated data."""
     regulations = []
-    
-    for source in SOURCES:
-        print(f"Crawling {source['name']}...")
-        html = fetch_page(source["url"])
-        if html:
-            paragraphs = parse_regulations(html)
-            for para in paragraphs[:3]:  # Limit to 3 paragraphs per source
-                regulations.append({
-                    "title": source["name"],
-                    "source": source["name"],
-                    "category": "EU Regulation",
-                    "content": para,
-                    "url": source["url"],
-                    "crawled_at": datetime.now().isoformat(),
-                })
-        else:
-            print(f"  Failed to crawl, using fallback data")
-    
+    started = time.monotonic()
+    crawler = Crawler(cache=CrawlCache(cache_dir) if cache_dir else None)
+    try:
+        results = crawler.crawl(SOURCES if sources is None else sources)
+    finally:
+        crawler.close()
+
+    for result in results:
+        source = result["source"]
+        if result["status"] == "failed":
+            print(f"  Failed to crawl {source['name']}, using fallback data")
+            continue
+        for para in result["paragraphs"][:CRAWL_MAX_PARAGRAPHS]:
+            regulations.append({
+                "title": source["name"],
+                "source": source["name"],
+                "category": "EU Regulation",
+                "content": para,
+                "url": source["url"],
+                "crawled_at": datetime.now().isoformat(),
+            })
+
+    statuses = [result["status"] for result in results]
+    print(
+        f"Crawled {len(results)} sources in {time.monotonic() - started:.2f}s "
+        f"({statuses.count('fetched')} fetched, {statuses.count('not_modified')} not modified, "
+        f"{statuses.count('stale')} stale, {statuses.count('failed')} failed)"
+    )
+
     # If crawling failed, supplement with fallback curated data
-    if len(regulations) < 5:
+    if len(regulations) < MIN_CRAWLED_REGULATIONS:
         regulations.extend(FALLBACK_DATA)
     
     return regulations
 
 
+def fallback_diffs(added: bool) -> List[SourceDiff]:
+    """Curated rows appear or disappear as a whole when the crawl crosses the fallback threshold."""
+    return [
+        {
+            "source": row["source"],
+            "url": row["url"],
+            "category": row["category"],
+            "added": [row["content"]] if added else [],
+            "changed": [],
+            "removed": [] if added else [row["content"]],
+            "unchanged": 0,
+        }
+        for row in FALLBACK_DATA
+    ]
+
+
+def refresh_regulations(
+    filepath: str = "fashion_regulations.json",
+    state: Optional[CrawlState] = None,
+    sources: Optional[List[Dict[str, Any]]] = None,
+    force: bool = False,
+    cache_dir: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Re-crawl only the sources whose last crawl is older than their max age and diff them.
+
+    Returns ``{"regulations", "diffs", "pending", "initial", "crawled", "fresh", "failed"}``
+    where ``diffs`` lists per-URL added / changed / removed paragraphs against the
+    previous crawl. Failed sources keep their previous paragraphs and are retried next
+    time. Nothing is recorded yet: pass the result to ``commit_refresh`` once the diffs
+    are stored, so a refresh whose write failed is diffed and sent again next time.
+    """
+    state = state or crawl_state
+    sources = SOURCES if sources is None else sources
+    initial = state.empty
+    had_fallback = len(state.regulations()) < MIN_CRAWLED_REGULATIONS
+
+    due = [source for source in sources if force or not state.is_fresh(source["url"], source.get("max_age"))]
+    crawler = Crawler(cache=CrawlCache(cache_dir) if cache_dir else None)
+    try:
+        results = crawler.crawl(due)
+    finally:
+        crawler.close()
+
+    if initial and all(result["status"] in ("failed", "stale") for result in results):
+        # Nothing to diff against yet and nothing crawled: keep serving the existing file, without crawling again.
+        return {
+            "regulations": load_regulations(filepath, crawl=False),
+            "diffs": [],
+            "pending": [],
+            "initial": True,
+            "crawled": [],
+            "fresh": [],
+            "failed": [result["source"]["name"] for result in results],
+        }
+
+    diffs: List[SourceDiff] = []
+    pending: List[CrawledSource] = []
+    failed: List[str] = []
+    for result in results:
+        source = result["source"]
+        if result["status"] in ("failed", "stale"):
+            failed.append(source["name"])
+            continue
+        crawl: CrawledSource = {
+            "source": source["name"],
+            "url": source["url"],
+            "category": source.get("category", "EU Regulation"),
+            "paragraphs": result["paragraphs"][:CRAWL_MAX_PARAGRAPHS],
+            "crawled_at": time.time(),
+        }
+        pending.append(crawl)
+        diff = state.diff(crawl)
+        if diff["added"] or diff["changed"] or diff["removed"]:
+            diffs.append(diff)
+
+    regulations = state.regulations(pending)
+    has_fallback = len(regulations) < MIN_CRAWLED_REGULATIONS
+    if has_fallback:
+        regulations.extend(FALLBACK_DATA)
+    if has_fallback != had_fallback and not initial:
+        diffs.extend(fallback_diffs(added=has_fallback))
+
+    return {
+        "regulations": regulations,
+        "diffs": diffs,
+        "pending": pending,
+        "initial": initial,
+        "crawled": [result["source"]["name"] for result in results if result["source"]["name"] not in failed],
+        "fresh": [source["name"] for source in sources if source not in due],
+        "failed": failed,
+    }
+
+
+def commit_refresh(
+    refresh: Dict[str, Any],
+    filepath: str = "fashion_regulations.json",
+    state: Optional[CrawlState] = None,
+) -> None:
+    """Record the crawls of a ``refresh_regulations`` result and rewrite the regulations file from them."""
+    if not refresh["pending"] and not refresh["diffs"]:
+        return
+    state = state or crawl_state
+    state.apply(refresh["pending"])
+    state.save()
+    save_regulations(refresh["regulations"], filepath)
+
+
 def save_regulations(regulations: List[Dict], filepath: str = "fashion_regulations.json"):
     with open(filepath, "w") as f:
         json.dump(regulations, f, indent=2)
     print(f"Saved {len(regulations)} regulations to {filepath}")
 
 
-def load_regulations(filepath: str = "fashion_regulations.json") -> List[Dict]:
+def load_regulations(filepath: str = "fashion_regulations.json", crawl: bool = True) -> List[Dict]:
+    """Read the regulations file; when it is missing, crawl and save it, or with ``crawl=False`` use the curated data."""
     try:
         with open(filepath, "r") as f:
             return json.load(f)
     except FileNotFoundError:
+        if not crawl:
+            print(f"{filepath} not found, using fallback data")
+            return list(FALLBACK_DATA)
         print(f"{filepath} not found, crawling...")
         regs = crawl_fashion_regulations()
         save_regulations(regs, filepath)
@@ -0,0 +1,270 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+CUTOUT_CACHE_ENABLED = os.getenv("CUTOUT_CACHE_ENABLED", "true").strip().lower() in ("1", "true", "yes", "on")
+CUTOUT_CACHE_DIR = os.getenv("CUTOUT_CACHE_DIR", ".cache/cutouts")
+CUTOUT_CACHE_MEMORY_BYTES = int(os.getenv("CUTOUT_CACHE_MEMORY_BYTES", str(64 * 1024 * 1024)))
+CUTOUT_CACHE_DISK_BYTES = int(os.getenv("CUTOUT_CACHE_DISK_BYTES", str(512 * 1024 * 1024)))
+CUTOUT_URL_TTL = float(os.getenv("CUTOUT_URL_TTL", "86400"))
+
+# Bump when the segmentation output changes so stale cutouts are never served.
+CUTOUT_CACHE_VERSION = "1"
+
+# (image_bytes, visible_pixels) in the requested output format; empty when the cutout was too small.
+CutoutEntry = Tuple[bytes, int]
+
+_HEADER = struct.Struct(">Q")
+
+
+class CutoutCache:
+    """
+    Content-addressed cache for cloth cutouts.
+
+    Entries are keyed by a hash of the source image bytes plus the pipeline
+    variant, held in a byte-bounded in-memory LRU and mirrored to disk so they
+    survive restarts. A URL -> key index lets repeat catalog URLs skip the fetch.
+
+    ``get_memory``/``url_record(..., disk=False)`` never touch the filesystem and
+    are safe on the event loop; everything else may read, write or scan the
+    cache directory and should run in a worker thread.
+    """
+
+    def __init__(
+        self,
+        directory: str = CUTOUT_CACHE_DIR,
+        memory_bytes: int = CUTOUT_CACHE_MEMORY_BYTES,
+        disk_bytes: int = CUTOUT_CACHE_DISK_BYTES,
+        url_ttl: float = CUTOUT_URL_TTL,
+        enabled: bool = CUTOUT_CACHE_ENABLED,
+    ) -> None:
+        self.directory = Path(directory)
+        self.memory_limit = max(0, memory_bytes)
+        self.disk_limit = max(0, disk_bytes)
+        self.url_ttl = url_ttl
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, CutoutEntry]" = OrderedDict()
+        self._memory_bytes = 0
+        self._urls: Dict[str, Tuple[Dict[str, str], float]] = {}
+        self._disk_bytes: Optional[int] = None
+        self.stats: Dict[str, int] = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "url_hits": 0,
+            "url_revalidations": 0,
+            "misses": 0,
+            "memory_evictions": 0,
+            "disk_evictions": 0,
+            "disk_errors": 0,
+        }
+
+    def content_key(self, image_bytes: bytes, variant: str = "") -> str:
+        digest = hashlib.sha256()
+        digest.update(f"cutout:{CUTOUT_CACHE_VERSION}:{variant}:".encode("utf-8"))
+        digest.update(image_bytes)
+        return digest.hexdigest()
+
+    # URL fast path -------------------------------------------------------
+
+    def _url_id(self, url: str, variant: str) -> str:
+        return hashlib.sha256(f"{variant}:{url}".encode("utf-8")).hexdigest()
+
+    def url_record(self, url: str, variant: str = "", disk: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        Return ``{"key", "etag", "last_modified", "fresh"}`` for a previously fetched URL.
+
+        Stale records (older than the URL TTL) are still returned so the caller can
+        revalidate them with a conditional request instead of re-downloading.
+        With ``disk=False`` only the in-memory index is consulted.
+        """
+        if not self.enabled or not url:
+            return None
+        url_id = self._url_id(url, variant)
+        now = time.time()
+        with self._lock:
+            cached = self._urls.get(url_id)
+        if cached is None and not disk:
+            return None
+        if cached is None:
+            path = self.directory / f"{url_id}.url"
+            try:
+                fetched_at = path.stat().st_mtime
+                raw = path.read_text(encoding="utf-8").strip()
+            except OSError:
+                return None
+            try:
+                stored = json.loads(raw) if raw.startswith("{") else {"key": raw}
+            except ValueError:
+                return None
+            if not stored.get("key"):
+                return None
+            cached = (stored, fetched_at + self.url_ttl)
+            with self._lock:
+                self._urls[url_id] = cached
+
+        stored, expires_at = cached
+        fresh = expires_at > now
+        if fresh:
+            self.stats["url_hits"] += 1
+        return {
+            "key": stored["key"],
+            "etag": stored.get("etag", ""),
+            "last_modified": stored.get("last_modified", ""),
+            "fresh": fresh,
+        }
+
+    def remember_url(self, url: str, key: str, variant: str = "", etag: str = "", last_modified: str = "") -> None:
+        if not self.enabled or not url:
+            return
+        url_id = self._url_id(url, variant)
+        stored = {"key": key, "etag": etag, "last_modified": last_modified}
+        with self._lock:
+            self._urls[url_id] = (stored, time.time() + self.url_ttl)
+        written = self._write_file(self.directory / f"{url_id}.url", json.dumps(stored).encode("utf-8"))
+        if written:
+            self._trim_disk(written)
+
+    def revalidate_url(self, url: str, key: str, variant: str = "", etag: str = "", last_modified: str = "") -> None:
+        """Origin answered 304 for a stale URL record: keep its key for another TTL."""
+        self.stats["url_revalidations"] += 1
+        self.remember_url(url, key, variant, etag, last_modified)
+
+    # Entry tiers ---------------------------------------------------------
+
+    def get_memory(self, key: str) -> Optional[CutoutEntry]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+            return entry
+
+    def get_disk(self, key: str) -> Optional[CutoutEntry]:
+        if not self.enabled:
+            return None
+        path = self.directory / f"{key}.cut"
+        try:
+            raw = path.read_bytes()
+            (visible,) = _HEADER.unpack_from(raw)
+            entry = (raw[_HEADER.size :], int(visible))
+            os.utime(path)
+        except (OSError, struct.error):
+            self.stats["misses"] += 1
+            return None
+
+        self.stats["disk_hits"] += 1
+        self._remember(key, entry)
+        return entry
+
+    def put(self, key: str, entry: CutoutEntry) -> None:
+        if not self.enabled:
+            return
+        self._remember(key, entry)
+        image_bytes, visible = entry
+        written = self._write_file(self.directory / f"{key}.cut", _HEADER.pack(visible) + image_bytes)
+        if written:
+            self._trim_disk(written)
+
+    def _remember(self, key: str, entry: CutoutEntry) -> None:
+        size = len(entry[0])
+        if size > self.memory_limit:
+            return
+        with self._lock:
+            previous = self._memory.pop(key, None)
+            if previous is not None:
+                self._memory_bytes -= len(previous[0])
+            self._memory[key] = entry
+            self._memory_bytes += size
+            while self._memory_bytes > self.memory_limit and self._memory:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted[0])
+                self.stats["memory_evictions"] += 1
+
+    def _write_file(self, path: Path, data: bytes) -> int:
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, path)
+            return len(data)
+        except OSError as exc:
+            self.stats["disk_errors"] += 1
+            print(f"Cutout cache write failed for {path.name}: {exc}")
+            return 0
+
+    def _disk_files(self) -> List[Tuple[float, int, str]]:
+        """``(mtime, size, name)`` for every cutout and URL index file, in one directory pass."""
+        files: List[Tuple[float, int, str]] = []
+        try:
+            with os.scandir(self.directory) as entries:
+                for item in entries:
+                    if not item.name.endswith((".cut", ".url")):
+                        continue
+                    try:
+                        stat = item.stat()
+                    except OSError:
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, item.name))
+        except OSError:
+            return []
+        return files
+
+    def _trim_disk(self, added: int) -> None:
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = sum(size for _, size, _ in self._disk_files())
+            else:
+                self._disk_bytes += added
+            if self._disk_bytes <= self.disk_limit:
+                return
+
+            # Evict least-recently-used files (mtime is bumped on disk hits) down to 90% of the cap.
+            # URL index files age out with them; a URL whose cutout is gone just falls back to a fetch.
+            target = int(self.disk_limit * 0.9)
+            files = sorted(self._disk_files())
+            total = sum(size for _, size, _ in files)
+            for _, size, name in files:
+                if total <= target:
+                    break
+                try:
+                    (self.directory / name).unlink()
+                except OSError:
+                    continue
+                total -= size
+                self.stats["disk_evictions"] += 1
+                if name.endswith(".url"):
+                    self._urls.pop(name[: -len(".url")], None)
+            self._disk_bytes = total
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            memory_entries = len(self._memory)
+            memory_bytes = self._memory_bytes
+            disk_bytes = self._disk_bytes
+        lookups = self.stats["memory_hits"] + self.stats["disk_hits"] + self.stats["misses"]
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        return {
+            "enabled": self.enabled,
+            "directory": str(self.directory),
+            "memory_entries": memory_entries,
+            "memory_bytes": memory_bytes,
+            "memory_limit_bytes": self.memory_limit,
+            "disk_bytes": disk_bytes,
+            "disk_limit_bytes": self.disk_limit,
+            "hit_rate": round(hits / lookups, 4) if lookups else None,
+            **self.stats,
+        }
+
+
+cutout_cache = CutoutCache()
@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+# Path to a locally stored sentence-transformers model directory; empty disables embeddings.
+EMBEDDING_MODEL_PATH = os.getenv("EMBEDDING_MODEL_PATH", "").strip()
+EMBEDDING_BATCH_SIZE = max(1, int(os.getenv("EMBEDDING_BATCH_SIZE", "32")))
+EMBEDDING_QUERY_CACHE_SIZE = max(0, int(os.getenv("EMBEDDING_QUERY_CACHE_SIZE", "1024")))
+
+
+def normalize_text(text: str) -> str:
+    """
+    Applied to chunks and queries alike so both sides are embedded the same way.
+    Case is kept: uncased models lowercase in their tokenizer, cased ones need it.
+    """
+    return " ".join(text.split())
+
+
+class EmbeddingsUnavailable(RuntimeError):
+    """Raised when embeddings are enabled but the model cannot be loaded."""
+
+
+class EmbeddingModel:
+    """
+    CPU sentence embedder loaded once from a local model directory.
+
+    Chunks are embedded in vectorized batches at ingest time; query vectors are
+    memoized so a repeated question costs one dictionary lookup.
+    """
+
+    def __init__(
+        self,
+        model_path: str = EMBEDDING_MODEL_PATH,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+        query_cache_size: int = EMBEDDING_QUERY_CACHE_SIZE,
+    ) -> None:
+        self.model_path = model_path
+        self.batch_size = batch_size
+        self.query_cache_size = query_cache_size
+        self._lock = threading.Lock()
+        self._model: Any = None
+        self._queries: "OrderedDict[str, Tuple[float, ...]]" = OrderedDict()
+        self.query_hits = 0
+        self.query_misses = 0
+        self.embedded_chunks = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.model_path)
+
+    def model(self) -> Any:
+        if self._model is not None:
+            return self._model
+        with self._lock:
+            if self._model is None:
+                try:
+                    from sentence_transformers import SentenceTransformer
+                except Exception as exc:  # pragma: no cover
+                    raise EmbeddingsUnavailable(f"Embedding dependencies unavailable: {exc}") from exc
+                self._model = SentenceTransformer(self.model_path, device="cpu")
+        return self._model
+
+    def embed_batch(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        vectors = self.model().encode(
+            [normalize_text(text) for text in texts],
+            batch_size=self.batch_size,
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+            show_progress_bar=False,
+        )
+        self.embedded_chunks += len(texts)
+        return vectors.astype("float32").tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        key = normalize_text(text)
+        with self._lock:
+            cached = self._queries.get(key)
+            if cached is not None:
+                self._queries.move_to_end(key)
+                self.query_hits += 1
+                return list(cached)
+        vector = self.embed_batch([key])[0]
+        with self._lock:
+            self.query_misses += 1
+            if self.query_cache_size:
+                self._queries[key] = tuple(vector)
+                while len(self._queries) > self.query_cache_size:
+                    self._queries.popitem(last=False)
+        return vector
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "model_path": self.model_path or None,
+            "loaded": self._model is not None,
+            "embedded_chunks": self.embedded_chunks,
+            "query_cache_hits": self.query_hits,
+            "query_cache_misses": self.query_misses,
+        }
+
+
+embedding_model = EmbeddingModel()
+
+
+def embed_records(records: List[Dict[str, Any]], model: Optional[EmbeddingModel] = None) -> List[List[float]]:
+    """Embed record texts in fixed-size batches so peak memory stays bounded."""
+    model = model or embedding_model
+    vectors: List[List[float]] = []
+    for start in range(0, len(records), model.batch_size):
+        batch = records[start : start + model.batch_size]
+        vectors.extend(model.embed_batch([item["text"] for item in batch]))
+    return vectors
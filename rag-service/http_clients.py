@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import os
+import threading
+from typing import Any, Dict
+
+import httpx
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "10"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+
+
+class HttpClients:
+    """
+    Named, lazily created ``httpx.AsyncClient`` pools shared across requests.
+
+    Each name gets its own connection pool (keep-alive per host), so a burst of
+    image fetches cannot starve connections meant for other upstreams.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+
+    def get(self, name: str, timeout: float, **kwargs: Any) -> httpx.AsyncClient:
+        client = self._clients.get(name)
+        if client is not None and not client.is_closed:
+            return client
+        with self._lock:
+            client = self._clients.get(name)
+            if client is None or client.is_closed:
+                client = httpx.AsyncClient(
+                    timeout=timeout,
+                    limits=httpx.Limits(
+                        max_connections=HTTP_MAX_CONNECTIONS,
+                        max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+                    ),
+                    **kwargs,
+                )
+                self._clients[name] = client
+        return client
+
+    def override(self, name: str, client: httpx.AsyncClient) -> None:
+        """Route every request for ``name`` through ``client`` (e.g. one backed by a stand-in transport)."""
+        with self._lock:
+            self._clients[name] = client
+
+    async def aclose(self) -> None:
+        with self._lock:
+            clients, self._clients = list(self._clients.values()), {}
+        for client in clients:
+            await client.aclose()
+
+
+http_clients = HttpClients()
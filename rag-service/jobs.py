@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+JOB_CONCURRENCY = max(1, int(os.getenv("JOB_CONCURRENCY", "1")))
+JOB_MAX_PENDING = max(1, int(os.getenv("JOB_MAX_PENDING", "16")))
+JOB_RETENTION = float(os.getenv("JOB_RETENTION", "3600"))
+JOB_MAX_RETAINED = max(1, int(os.getenv("JOB_MAX_RETAINED", "200")))
+JOB_RETRY_AFTER = int(os.getenv("JOB_RETRY_AFTER", "5"))
+
+
+class JobQueueFull(RuntimeError):
+    """Raised when too many jobs are already queued or running."""
+
+
+class Job:
+    """One background task plus the progress it reports while running."""
+
+    def __init__(self, kind: str) -> None:
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.progress: Dict[str, Any] = {}
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        # The exception itself, for callers that wait on the job and re-raise it.
+        self.exception: Optional[BaseException] = None
+        self._probe: Optional[Callable[[], Dict[str, Any]]] = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("succeeded", "failed")
+
+    def track(self, probe: Callable[[], Dict[str, Any]]) -> None:
+        """Register a callable whose counters are merged into ``progress`` whenever the job is polled."""
+        self._probe = probe
+
+    def _settle(self, status: str) -> None:
+        if self._probe is not None:
+            self.progress.update(self._probe())
+            self._probe = None
+        self.status = status
+        self.finished_at = time.time()
+
+    def snapshot(self) -> Dict[str, Any]:
+        progress = dict(self.progress)
+        if self._probe is not None:
+            progress.update(self._probe())
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "progress": progress,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+JobFunction = Callable[[Job], Awaitable[Dict[str, Any]]]
+
+
+class JobRunner:
+    """
+    In-process job queue for long ingestion work.
+
+    At most ``concurrency`` jobs run at once and at most ``max_pending`` may be
+    queued or running, so a burst of ingests cannot crowd out chat traffic.
+    Finished jobs are kept for ``retention`` seconds so clients can poll results.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = JOB_CONCURRENCY,
+        max_pending: int = JOB_MAX_PENDING,
+        retention: float = JOB_RETENTION,
+        max_retained: int = JOB_MAX_RETAINED,
+    ) -> None:
+        self.concurrency = concurrency
+        self.max_pending = max_pending
+        self.retention = retention
+        self.max_retained = max_retained
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._tasks: Set["asyncio.Task[None]"] = set()
+        self.submitted = 0
+        self.rejected = 0
+
+    def _prune(self) -> None:
+        cutoff = time.time() - self.retention
+        finished = [job for job in self._jobs.values() if job.done]
+        overflow = max(0, len(self._jobs) - self.max_retained)
+        for job in finished:
+            if (job.finished_at or 0) < cutoff or overflow > 0:
+                del self._jobs[job.id]
+                overflow -= 1
+
+    def active(self) -> int:
+        return sum(1 for job in self._jobs.values() if not job.done)
+
+    def submit(self, kind: str, fn: JobFunction) -> Job:
+        return self._enqueue(kind, fn)[0]
+
+    def _enqueue(self, kind: str, fn: JobFunction) -> Tuple[Job, "asyncio.Task[None]"]:
+        self._prune()
+        if self.active() >= self.max_pending:
+            self.rejected += 1
+            raise JobQueueFull(f"{self.max_pending} jobs are already queued or running")
+        job = Job(kind)
+        self._jobs[job.id] = job
+        self.submitted += 1
+        task = asyncio.get_running_loop().create_task(self._run(job, fn))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job, task
+
+    async def _run(self, job: Job, fn: JobFunction) -> None:
+        async with self._semaphore:
+            job.status = "running"
+            job.started_at = time.time()
+            try:
+                job.result = await fn(job)
+            except asyncio.CancelledError:
+                job.error = "cancelled"
+                job._settle("failed")
+                raise
+            except Exception as exc:
+                # HTTPException carries its message in ``detail``.
+                job.exception = exc
+                job.error = str(getattr(exc, "detail", "") or exc)
+                job._settle("failed")
+                print(f"Job {job.id} ({job.kind}) failed: {job.error}")
+            else:
+                job._settle("succeeded")
+
+    async def run(self, kind: str, fn: JobFunction) -> Dict[str, Any]:
+        """
+        Submit ``fn`` like ``submit`` and wait for its result, re-raising its exception.
+
+        Synchronous requests take the same queue slot and concurrency limit as
+        background jobs. The job keeps running if the waiting caller goes away.
+        """
+        job, task = self._enqueue(kind, fn)
+        await asyncio.shield(task)
+        if job.exception is not None:
+            raise job.exception
+        return job.result or {}
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    async def shutdown(self) -> None:
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def status(self) -> Dict[str, Any]:
+        counts: Dict[str, int] = {"queued": 0, "running": 0, "succeeded": 0, "failed": 0}
+        for job in self._jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {
+            "concurrency": self.concurrency,
+            "max_pending": self.max_pending,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            **counts,
+        }
+
+
+job_runner = JobRunner()
@@ -0,0 +1,242 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from metrics import LLM_ROUTER_EVENTS
+
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", "25"))
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE", "false").strip().lower() in ("1", "true", "yes", "on")
+# Used until a provider has enough samples for a p95; the p95 is clamped to at least LLM_HEDGE_MIN_DELAY.
+LLM_HEDGE_DELAY = float(os.getenv("LLM_HEDGE_DELAY", "3"))
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.5"))
+LLM_HEDGE_MIN_SAMPLES = max(1, int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20")))
+LLM_BREAKER_FAILURES = max(1, int(os.getenv("LLM_BREAKER_FAILURES", "3")))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+
+# ``call(timeout)`` returns the completion text; raising or returning nothing counts as a failure.
+ProviderCall = Callable[[float], Awaitable[Optional[str]]]
+
+
+class Provider:
+    def __init__(self, name: str, call: ProviderCall) -> None:
+        self.name = name
+        self.call = call
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure breaker: after ``threshold`` failures the provider is
+    skipped for ``cooldown`` seconds, then a single trial call decides whether
+    it closes again or stays open for another cooldown.
+    """
+
+    def __init__(self, threshold: int = LLM_BREAKER_FAILURES, cooldown: float = LLM_BREAKER_COOLDOWN) -> None:
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial = False
+        self._lock = threading.Lock()
+        self.opens = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.cooldown else "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self._trial or (self.opened_at is None and self.failures >= self.threshold):
+                self.opened_at = time.monotonic()
+                self.opens += 1
+            self._trial = False
+
+    def release(self) -> None:
+        """A trial call was cancelled before it finished; let the next request try instead."""
+        with self._lock:
+            self._trial = False
+
+
+class LatencyWindow:
+    """Recent successful call durations for one provider."""
+
+    def __init__(self, size: int = 200) -> None:
+        self._samples: Deque[float] = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+class LLMRouter:
+    """
+    Tries chat-completion providers in priority order within one deadline.
+
+    Providers whose breaker is open are skipped. A provider that fails hands
+    over to the next one immediately; with hedging on, the next provider is also
+    started when the current one has not answered within its recent p95, and
+    whichever answers first wins. The deadline bounds the whole call, so a slow
+    cold start can no longer hold a chat for the full HTTP timeout.
+    """
+
+    def __init__(self, deadline: float = LLM_DEADLINE, hedge: bool = LLM_HEDGE_ENABLED) -> None:
+        self.deadline = deadline
+        self.hedge = hedge
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._latencies: Dict[str, LatencyWindow] = {}
+        self.events: Dict[str, int] = {}
+
+    def breaker(self, name: str) -> CircuitBreaker:
+        breaker = self._breakers.get(name)
+        if breaker is None:
+            breaker = self._breakers.setdefault(name, CircuitBreaker())
+        return breaker
+
+    def latency(self, name: str) -> LatencyWindow:
+        window = self._latencies.get(name)
+        if window is None:
+            window = self._latencies.setdefault(name, LatencyWindow())
+        return window
+
+    def _count(self, event: str) -> None:
+        self.events[event] = self.events.get(event, 0) + 1
+        LLM_ROUTER_EVENTS.inc(event=event)
+
+    def hedge_delay(self, name: str) -> float:
+        p95 = self.latency(name).quantile(0.95)
+        return LLM_HEDGE_DELAY if p95 is None else max(LLM_HEDGE_MIN_DELAY, p95)
+
+    def record(self, name: str, seconds: Optional[float]) -> None:
+        """Feed a call's outcome to its breaker and latency window: duration on success, None on failure."""
+        if seconds is None:
+            self.breaker(name).failure()
+        else:
+            self.breaker(name).success()
+            self.latency(name).add(seconds)
+
+    async def _attempt(self, provider: Provider, timeout: float) -> Optional[str]:
+        started = time.perf_counter()
+        try:
+            text = await provider.call(timeout)
+        except asyncio.CancelledError:
+            self.breaker(provider.name).release()
+            raise
+        except Exception as exc:
+            print(f"LLM provider {provider.name} failed: {exc}")
+            text = None
+        text = (text or "").strip()
+        self.record(provider.name, time.perf_counter() - started if text else None)
+        return text or None
+
+    async def complete(
+        self,
+        providers: List[Provider],
+        deadline: Optional[float] = None,
+    ) -> Optional[Tuple[str, str]]:
+        """Return ``(text, provider name)`` from the first provider to answer, or None."""
+        loop = asyncio.get_running_loop()
+        budget = self.deadline if deadline is None else deadline
+        ends_at = loop.time() + budget
+        waiting = list(providers)
+        running: Dict["asyncio.Task[Optional[str]]", Provider] = {}
+
+        def launch() -> bool:
+            while waiting:
+                provider = waiting.pop(0)
+                if not self.breaker(provider.name).allow():
+                    self._count("skipped_open")
+                    continue
+                task = loop.create_task(self._attempt(provider, max(0.1, ends_at - loop.time())))
+                running[task] = provider
+                return True
+            return False
+
+        if not launch():
+            return None
+        first = next(iter(running.values()))
+        hedged = False
+        try:
+            while running:
+                remaining = ends_at - loop.time()
+                if remaining <= 0:
+                    break
+                wait_for = remaining
+                can_hedge = self.hedge and not hedged and waiting
+                if can_hedge:
+                    wait_for = min(remaining, self.hedge_delay(first.name))
+                done, _ = await asyncio.wait(running, timeout=wait_for, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    if can_hedge and wait_for < remaining:
+                        hedged = True
+                        if launch():
+                            self._count("hedged")
+                        continue
+                    break
+                for task in done:
+                    provider = running.pop(task)
+                    text = task.result()
+                    if text:
+                        if provider is not first:
+                            self._count("hedge_won" if hedged else "failover")
+                        return text, provider.name
+                if not running:
+                    launch()
+            if running:
+                self._count("deadline_exceeded")
+                for provider in running.values():
+                    print(f"LLM provider {provider.name} exceeded the {budget:g}s deadline")
+                    self.breaker(provider.name).failure()
+            return None
+        finally:
+            for task in running:
+                task.cancel()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "deadline_seconds": self.deadline,
+            "hedge": self.hedge,
+            "providers": {
+                name: {
+                    "breaker": breaker.state,
+                    "consecutive_failures": breaker.failures,
+                    "opens": breaker.opens,
+                    "p95_seconds": self.latency(name).quantile(0.95),
+                }
+                for name, breaker in self._breakers.items()
+            },
+            **self.events,
+        }
+
+
+llm_router = LLMRouter()
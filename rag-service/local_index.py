@@ -0,0 +1,426 @@
+from __future__ import annotations
+
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import threading
+from array import array
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Any, Dict, FrozenSet, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+LOCAL_INDEX_PATH = os.getenv("LOCAL_INDEX_PATH", ".cache/bm25.idx")
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+# A new segment is merged into the one before it while that one is at most this many times larger.
+LOCAL_INDEX_MERGE_FACTOR = max(1, int(os.getenv("LOCAL_INDEX_MERGE_FACTOR", "4")))
+# Merges never build a segment above this many documents, which bounds the memory a merge needs.
+LOCAL_INDEX_SEGMENT_MAX_DOCS = max(1, int(os.getenv("LOCAL_INDEX_SEGMENT_MAX_DOCS", "50000")))
+# A segment is rewritten without its deleted documents once this share of it is deleted.
+LOCAL_INDEX_COMPACT_RATIO = float(os.getenv("LOCAL_INDEX_COMPACT_RATIO", "0.3"))
+
+_MAGIC = b"BM25IDX2"
+_HEADER = struct.Struct("<8sI")
+_TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+DOC_FIELDS = ("id", "text", "source", "url", "category")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    """
+    Read-only BM25 segment over a memory-mapped file.
+
+    Layout: magic + metadata length, a JSON block (vocabulary -> [posting
+    offset, document frequency] and counts), then uint32 arrays of ``(doc, term
+    frequency)`` postings, document lengths and document offsets, then the
+    documents as concatenated JSON. Only the vocabulary is held in memory;
+    everything else is read through the mmap. Scoring happens in
+    ``search_segments`` so statistics span every segment.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        with path.open("rb") as handle:
+            self._mmap = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, meta_length = _HEADER.unpack_from(self._mmap, 0)
+        if magic != _MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a BM25 index file")
+        meta_start = _HEADER.size
+        meta = json.loads(self._mmap[meta_start : meta_start + meta_length].decode("utf-8"))
+        arrays_start = meta_start + meta_length
+        arrays_start += (-arrays_start) % 4
+        self._vocabulary: Dict[str, List[int]] = meta["vocabulary"]
+        self._count = meta["doc_count"]
+        words = memoryview(self._mmap)[arrays_start : arrays_start + 4 * (meta["postings"] + 2 * self._count + 1)]
+        arrays = words.cast("I")
+        self._postings = arrays[: meta["postings"]]
+        self.doc_lengths = arrays[meta["postings"] : meta["postings"] + self._count]
+        self._offsets = arrays[meta["postings"] + self._count :]
+        self._blob_start = arrays_start + len(words)
+        self.total_length = meta["total_length"]
+
+    def __len__(self) -> int:
+        return self._count
+
+    def document(self, position: int) -> Dict[str, str]:
+        start = self._blob_start + self._offsets[position]
+        end = self._blob_start + self._offsets[position + 1]
+        return json.loads(self._mmap[start:end].decode("utf-8"))
+
+    def doc_freq(self, term: str) -> int:
+        entry = self._vocabulary.get(term)
+        return entry[1] if entry else 0
+
+    def postings(self, term: str) -> Iterator[Tuple[int, int]]:
+        entry = self._vocabulary.get(term)
+        if not entry:
+            return
+        offset, doc_freq = entry
+        for position in range(offset, offset + doc_freq * 2, 2):
+            yield self._postings[position], self._postings[position + 1]
+
+    def close(self) -> None:
+        for name in ("_postings", "doc_lengths", "_offsets"):
+            view = getattr(self, name, None)
+            if isinstance(view, memoryview):
+                view.release()
+        self._mmap.close()
+
+
+class Segment:
+    """One immutable segment file plus the positions of its documents that were deleted since it was written."""
+
+    def __init__(self, name: str, index: BM25Index, deleted: FrozenSet[int] = frozenset()) -> None:
+        self.name = name
+        self.index = index
+        self.deleted = deleted
+
+    @property
+    def live(self) -> int:
+        return len(self.index) - len(self.deleted)
+
+    def live_documents(self) -> Iterator[Tuple[int, Dict[str, str]]]:
+        for position in range(len(self.index)):
+            if position not in self.deleted:
+                yield position, self.index.document(position)
+
+
+def search_segments(segments: Sequence[Segment], query: str, limit: int) -> List[Dict[str, Any]]:
+    """
+    BM25 over all segments as if they were one index. Deleted documents still count
+    towards document frequencies until their segment is rewritten, as in Lucene.
+    """
+    total = sum(len(segment.index) for segment in segments)
+    if not total:
+        return []
+    avg_length = (sum(segment.index.total_length for segment in segments) / total) or 1.0
+    scores: Dict[Tuple[int, int], float] = defaultdict(float)
+    for term in set(tokenize(query)):
+        doc_freq = sum(segment.index.doc_freq(term) for segment in segments)
+        if not doc_freq:
+            continue
+        idf = math.log(1 + (total - doc_freq + 0.5) / (doc_freq + 0.5))
+        for number, segment in enumerate(segments):
+            doc_lengths = segment.index.doc_lengths
+            for doc, freq in segment.index.postings(term):
+                if doc in segment.deleted:
+                    continue
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * doc_lengths[doc] / avg_length)
+                scores[(number, doc)] += idf * freq * (BM25_K1 + 1) / (freq + norm)
+
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[: max(0, limit)]
+    results: List[Dict[str, Any]] = []
+    for (number, doc), score in ranked:
+        stored = segments[number].index.document(doc)
+        results.append(
+            {
+                "text": stored.get("text") or "",
+                "source": stored.get("source") or "unknown",
+                "url": stored.get("url") or "",
+                "category": stored.get("category") or "general",
+                "score": round(score, 6),
+            }
+        )
+    return results
+
+
+def write_index(path: Path, records: Iterable[Dict[str, Any]]) -> int:
+    """Build the index for ``records`` (deduplicated by id) and atomically replace ``path``."""
+    documents: List[Dict[str, str]] = []
+    seen: Dict[str, int] = {}
+    for record in records:
+        doc = {field: str(record.get(field) or "") for field in DOC_FIELDS}
+        if doc["id"] and doc["id"] in seen:
+            documents[seen[doc["id"]]] = doc
+            continue
+        if doc["id"]:
+            seen[doc["id"]] = len(documents)
+        documents.append(doc)
+
+    term_postings: Dict[str, List[int]] = defaultdict(list)
+    doc_lengths: List[int] = []
+    for doc_index, doc in enumerate(documents):
+        tokens = tokenize(doc["text"])
+        doc_lengths.append(len(tokens))
+        for term, freq in Counter(tokens).items():
+            term_postings[term].extend((doc_index, freq))
+
+    postings = array("I")
+    vocabulary: Dict[str, List[int]] = {}
+    for term in sorted(term_postings):
+        pairs = term_postings[term]
+        vocabulary[term] = [len(postings), len(pairs) // 2]
+        postings.extend(pairs)
+
+    encoded = [json.dumps(doc, separators=(",", ":")).encode("utf-8") for doc in documents]
+    offsets = array("I", [0])
+    for blob in encoded:
+        offsets.append(offsets[-1] + len(blob))
+
+    meta = json.dumps(
+        {
+            "vocabulary": vocabulary,
+            "postings": len(postings),
+            "doc_count": len(documents),
+            "total_length": sum(doc_lengths),
+        },
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with tmp_path.open("wb") as handle:
+        handle.write(_HEADER.pack(_MAGIC, len(meta)))
+        handle.write(meta)
+        handle.write(b"\0" * ((-(_HEADER.size + len(meta))) % 4))
+        handle.write(postings.tobytes())
+        handle.write(array("I", doc_lengths).tobytes())
+        handle.write(offsets.tobytes())
+        for blob in encoded:
+            handle.write(blob)
+    os.replace(tmp_path, path)
+    return len(documents)
+
+
+class LocalIndex:
+    """
+    Segmented, append-only BM25 index.
+
+    ``path`` holds a small JSON manifest listing the segment files (kept in
+    ``<path>.d/``) and the deleted positions of each. Adding records writes one
+    segment with just those records, so an ingest costs O(new records) rather
+    than a rewrite of the corpus. Small trailing segments are merged while the
+    one before is at most ``LOCAL_INDEX_MERGE_FACTOR`` times larger, never into a
+    segment above ``LOCAL_INDEX_SEGMENT_MAX_DOCS``; deletions only touch the
+    manifest until a segment is ``LOCAL_INDEX_COMPACT_RATIO`` deleted. Searches
+    read an immutable segment list that is swapped under the lock.
+    """
+
+    def __init__(self, path: str = LOCAL_INDEX_PATH) -> None:
+        self.path = Path(path)
+        self.directory = self.path.with_name(f"{self.path.name}.d")
+        self._lock = threading.Lock()
+        self._segments: Tuple[Segment, ...] = ()
+        self._ids: Dict[str, Tuple[str, int]] = {}
+        self._next = 0
+        self._loaded = False
+        self.searches = 0
+        self.fallback_searches = 0
+        self.merges = 0
+        self.load_error: Optional[str] = None
+        # Set when the index is not maintained on ingest and the corpus has changed since it was built.
+        self.stale = False
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def __len__(self) -> int:
+        return sum(segment.live for segment in self._segments)
+
+    def load(self) -> bool:
+        if not self.path.exists():
+            return False
+        try:
+            with self._lock:
+                self._read()
+        except (OSError, ValueError, KeyError, TypeError) as exc:
+            self.load_error = str(exc)
+            print(f"Local index unavailable ({self.path}): {exc}")
+            return False
+        return True
+
+    def _read(self) -> None:
+        manifest = json.loads(self.path.read_text(encoding="utf-8"))
+        segments = tuple(
+            Segment(entry["file"], BM25Index(self.directory / entry["file"]), frozenset(entry.get("deleted") or ()))
+            for entry in manifest["segments"]
+        )
+        ids: Dict[str, Tuple[str, int]] = {}
+        for segment in segments:
+            for position, doc in segment.live_documents():
+                if doc.get("id"):
+                    ids[doc["id"]] = (segment.name, position)
+        # The previous mappings are released by GC once in-flight searches drop their reference.
+        self._segments, self._ids, self._next = segments, ids, int(manifest["next"])
+        self._loaded = True
+        self.load_error = None
+        self.stale = False
+
+    def _segment_name(self, number: int) -> str:
+        return f"{number:08d}.seg"
+
+    def _write_manifest(self, entries: List[Dict[str, Any]], next_number: int) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        tmp_path.write_text(
+            json.dumps({"version": 1, "next": next_number, "segments": entries}, separators=(",", ":")),
+            encoding="utf-8",
+        )
+        os.replace(tmp_path, self.path)
+
+    def _new_segment(self, documents: List[Dict[str, Any]]) -> Segment:
+        """Write ``documents`` (unique ids) as a new segment file; the caller commits it."""
+        name = self._segment_name(self._next)
+        self._next += 1
+        path = self.directory / name
+        write_index(path, documents)
+        return Segment(name, BM25Index(path))
+
+    def _commit(self, segments: List[Segment]) -> None:
+        """Persist the manifest for ``segments``, swap them in and delete every other file in the segment directory."""
+        self._write_manifest(
+            [{"file": segment.name, "deleted": sorted(segment.deleted)} for segment in segments], self._next
+        )
+        self._segments = tuple(segments)
+        self._loaded = True
+        listed = {segment.name for segment in segments}
+        # Also catches segments merged away within this commit and leftovers of an interrupted write.
+        for entry in os.scandir(self.directory):
+            if entry.name not in listed:
+                try:
+                    os.unlink(entry.path)
+                except OSError:
+                    pass
+
+    def _track(self, segment: Segment) -> None:
+        for position, doc in segment.live_documents():
+            if doc.get("id"):
+                self._ids[doc["id"]] = (segment.name, position)
+
+    def _rewrite(self, group: List[Segment]) -> Segment:
+        merged = self._new_segment([doc for segment in group for _, doc in segment.live_documents()])
+        self._track(merged)
+        self.merges += 1
+        return merged
+
+    def _merge_tail(self, segments: List[Segment]) -> List[Segment]:
+        while len(segments) > 1:
+            older, newer = segments[-2], segments[-1]
+            if older.live > newer.live * LOCAL_INDEX_MERGE_FACTOR:
+                break
+            if older.live + newer.live > LOCAL_INDEX_SEGMENT_MAX_DOCS:
+                break
+            segments[-2:] = [self._rewrite([older, newer])]
+        return segments
+
+    def add_records(self, records: List[Dict[str, Any]]) -> int:
+        """
+        Append ``records`` as a new segment (records whose id is already indexed are skipped).
+
+        Chunk ids are content-derived, so a known id means unchanged content; when
+        nothing is new no file is written. Returns the number of records added.
+        """
+        with self._lock:
+            fresh: Dict[str, Dict[str, Any]] = {}
+            for record in records:
+                record_id = str(record.get("id") or "")
+                if record_id and record_id not in self._ids:
+                    fresh[record_id] = record
+            if not fresh:
+                return 0
+            segment = self._new_segment(list(fresh.values()))
+            self._track(segment)
+            self._commit(self._merge_tail([*self._segments, segment]))
+        return len(fresh)
+
+    def _delete(self, ids: Iterable[str]) -> int:
+        """Mark ``ids`` deleted and rewrite segments that are mostly deleted; call with the lock held."""
+        positions: Dict[str, Set[int]] = defaultdict(set)
+        for record_id in ids:
+            location = self._ids.pop(record_id, None)
+            if location is not None:
+                positions[location[0]].add(location[1])
+        if not positions:
+            return 0
+        segments: List[Segment] = []
+        for segment in self._segments:
+            if segment.name in positions:
+                segment = Segment(segment.name, segment.index, segment.deleted | positions[segment.name])
+                if not segment.live:
+                    continue
+                if len(segment.deleted) >= LOCAL_INDEX_COMPACT_RATIO * len(segment.index):
+                    segment = self._rewrite([segment])
+            segments.append(segment)
+        self._commit(segments)
+        return sum(len(found) for found in positions.values())
+
+    def reconcile(self, keep: Dict[str, Set[str]]) -> int:
+        """Drop documents of each source in ``keep`` whose id is not in its set; returns the number removed."""
+        with self._lock:
+            stale = [
+                doc["id"]
+                for segment in self._segments
+                for _, doc in segment.live_documents()
+                if doc.get("source") in keep and doc.get("id") not in keep[doc["source"]]
+            ]
+            return self._delete(stale)
+
+    def remove_ids(self, ids: Set[str]) -> int:
+        with self._lock:
+            return self._delete(ids)
+
+    def replace_records(self, records: List[Dict[str, Any]]) -> int:
+        with self._lock:
+            documents: Dict[str, Dict[str, Any]] = {}
+            for record in records:
+                documents[str(record.get("id") or len(documents))] = record
+            segment = self._new_segment(list(documents.values()))
+            self._ids = {}
+            self._track(segment)
+            self._commit([segment])
+            self.stale = False
+        return len(documents)
+
+    def search(self, query: str, limit: int) -> List[Dict[str, Any]]:
+        segments = self._segments
+        if not segments:
+            return []
+        self.searches += 1
+        return search_segments(segments, query, limit)
+
+    def status(self) -> Dict[str, Any]:
+        segments = self._segments
+        return {
+            "path": str(self.path),
+            "loaded": self.loaded,
+            "stale": self.stale,
+            "documents": sum(segment.live for segment in segments),
+            "segments": len(segments),
+            "deleted": sum(len(segment.deleted) for segment in segments),
+            "merges": self.merges,
+            "searches": self.searches,
+            "fallback_searches": self.fallback_searches,
+            "load_error": self.load_error,
+        }
+
+
+local_index = LocalIndex()
@@ -1,23 +1,82 @@
 from __future__ import annotations
 
+import asyncio
+import json
 import os
 import re
+import time
 import uuid
-from typing import Any, Dict, List, Optional
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple, TypeVar
 
-import requests
+import httpx
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field, ValidationError
 from typing_extensions import TypedDict
 
-import io
 import base64
 
 from langgraph.graph import END, StateGraph
 
-from crawler import load_regulations
+from answer_cache import answer_cache
+from context_builder import assemble_context
+from crawl_state import crawl_state
+from crawler import commit_refresh, load_regulations, refresh_regulations
+from cutout_cache import CutoutEntry, cutout_cache
+from embeddings import embed_records, embedding_model
+from http_clients import http_clients
+from jobs import JOB_RETRY_AFTER, Job, JobQueueFull, job_runner
+from llm_router import Provider, llm_router
+from local_index import local_index
+from single_flight import SingleFlight
+from metrics import (
+    CACHE_LOOKUPS,
+    HTTP_REQUEST_SECONDS,
+    LLM_REQUEST_SECONDS,
+    RAG_NODE_SECONDS,
+    SEGMENTATION_STAGE_SECONDS,
+    SERVER_TIMING_ENABLED,
+    WEAVIATE_REQUEST_SECONDS,
+    GaugeFunc,
+    finish_request_timing,
+    observe_response,
+    record_timing,
+    registry,
+    server_timing_header,
+    start_request_timing,
+    timed,
+)
+from segmentation import (
+    CUTOUT_MEDIA_TYPES,
+    MIN_VISIBLE_PIXELS,
+    SEGMENTATION_RETRY_AFTER,
+    SEGMENTATION_VARIANT,
+    SEGMENTATION_WARMUP,
+    SEGMENTATION_WORKERS,
+    CutoutOptions,
+    SegmentationBusy,
+    SegmentationTimeout,
+    SegmentationUnavailable,
+    cutout_options_tag,
+    model_registry,
+    segment_cutout_timed,
+    segmentation_pool,
+    supported_cutout_formats,
+)
+from weaviate_batch import (
+    BatchRejected,
+    BatchReport,
+    BatchTooLarge,
+    BatchTransientError,
+    FailedObject,
+    write_objects,
+)
+from weaviate_batch import batch_size as weaviate_batch_size
 
 load_dotenv()
 
@@ -38,6 +97,10 @@ WEAVIATE_HOST = normalize_weaviate_host(
 WEAVIATE_API_KEY = os.getenv("WEAVIATE_API_KEY", "local-dev-key")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+OPENAI_CHAT_COMPLETIONS_URL = os.getenv(
+    "OPENAI_CHAT_COMPLETIONS_URL",
+    "https://api.openai.com/v1/chat/completions",
+).rstrip("/")
 HF_API_TOKEN = os.getenv("HF_API_TOKEN", "") or os.getenv("HUGGINGFACE_API_KEY", "")
 HF_MODEL = os.getenv("HF_MODEL", "mistralai/Mistral-7B-Instruct-v0.2")
 HF_FALLBACK_MODEL = os.getenv("HF_FALLBACK_MODEL", "meta-llama/Llama-3.1-8B-Instruct")
@@ -48,8 +111,33 @@ HF_CHAT_COMPLETIONS_URL = os.getenv(
 HF_WAIT_FOR_MODEL = os.getenv("HF_WAIT_FOR_MODEL", "true").strip().lower() in ("1", "true", "yes", "on")
 COLLECTION_NAME = os.getenv("WEAVIATE_CLASS", "Doc")
 REQUEST_TIMEOUT = float(os.getenv("RAG_REQUEST_TIMEOUT", "20"))
+# weaviate (local index only as fallback), local (embedded BM25 only) or auto (local for small corpora).
+RETRIEVER = os.getenv("RAG_RETRIEVER", "weaviate").strip().lower()
+# Ingests keep the local index current only when it may serve queries; as a mere fallback it is built on demand.
+LOCAL_INDEX_MAINTAINED = RETRIEVER in ("local", "auto")
+LOCAL_INDEX_AUTO_MAX_DOCS = int(os.getenv("LOCAL_INDEX_AUTO_MAX_DOCS", "5000"))
+REGULATIONS_PATH = os.getenv("REGULATIONS_PATH", "fashion_regulations.json")
+CRAWLED_CHUNK_SIZE = 800
+CRAWLED_CHUNK_OVERLAP = 100
+# Weight of the vector side in hybrid search (0 = pure BM25, 1 = pure vector); used when embeddings are on.
+HYBRID_ALPHA = min(1.0, max(0.0, float(os.getenv("HYBRID_ALPHA", "0.5"))))
+# Ingestion: chunks are written to Weaviate in fixed-size batches with a few requests in flight.
+INGEST_BATCH_SIZE = max(1, int(os.getenv("INGEST_BATCH_SIZE", "100")))
+INGEST_CONCURRENCY = max(1, int(os.getenv("INGEST_CONCURRENCY", "4")))
+INGEST_LOCAL_FLUSH_RECORDS = max(1, int(os.getenv("INGEST_LOCAL_FLUSH_RECORDS", "5000")))
+INGEST_MAX_LINE_BYTES = int(os.getenv("INGEST_MAX_LINE_BYTES", str(8 * 1024 * 1024)))
+INGEST_MAX_REPORTED_ERRORS = 10
+RECONCILE_PAGE_SIZE = int(os.getenv("RECONCILE_PAGE_SIZE", "500"))
+CUTOUT_MAX_IMAGE_BYTES = int(os.getenv("CUTOUT_MAX_IMAGE_BYTES", str(15 * 1024 * 1024)))
+CUTOUT_BATCH_MAX_ITEMS = int(os.getenv("CUTOUT_BATCH_MAX_ITEMS", "48"))
+CUTOUT_BATCH_CONCURRENCY = max(1, int(os.getenv("CUTOUT_BATCH_CONCURRENCY", str(SEGMENTATION_WORKERS * 2))))
 
 CLASS_NAME_PATTERN = re.compile(r"^[A-Z][A-Za-z0-9_]*$")
+WORD_PATTERN = re.compile(r"\S+")
+# Fixed namespace for uuid5 chunk ids; changing it re-keys every stored chunk.
+CHUNK_ID_NAMESPACE = uuid.UUID("5d0c3f5e-8a1b-4c36-9f0e-2b7d6a4e1c90")
+
+T = TypeVar("T")
 
 app = FastAPI(title="Fashion RAG Service")
 
@@ -60,9 +148,30 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Retry-After", "Server-Timing", "X-Cutout-Cache", "X-Visible-Pixels"],
 )
 
 
+@app.middleware("http")
+async def observe_requests(request: Request, call_next: Callable[[Request], Awaitable[Response]]) -> Response:
+    """Per-route latency histogram, plus a ``Server-Timing`` breakdown when SERVER_TIMING is on."""
+    token = start_request_timing() if SERVER_TIMING_ENABLED else None
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        elapsed = time.perf_counter() - started
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        HTTP_REQUEST_SECONDS.observe(elapsed, method=request.method, route=route, status=str(status))
+        timings = finish_request_timing(token) if token is not None else None
+    if timings is not None:
+        # Streaming responses send headers first, so they only carry the stages finished by then.
+        response.headers["Server-Timing"] = server_timing_header(timings + [("total", elapsed)])
+    return response
+
+
 @app.get("/")
 async def root():
     return {
@@ -70,11 +179,16 @@ async def root():
         "status": "ok",
         "docs": "/docs",
         "health": "/health",
+        "metrics": "/metrics",
         "endpoints": {
             "chat": {"method": "POST", "path": "/chat"},
+            "chat_stream": {"method": "POST", "path": "/chat/stream"},
             "ingest": {"method": "POST", "path": "/ingest"},
+            "ingest_stream": {"method": "POST", "path": "/ingest/stream"},
             "ingest_crawled": {"method": "POST", "path": "/ingest-crawled"},
+            "job": {"method": "GET", "path": "/jobs/{job_id}"},
             "segment_cloth_only": {"method": "POST", "path": "/segment/cloth-only"},
+            "segment_cloth_only_batch": {"method": "POST", "path": "/segment/cloth-only/batch"},
         },
     }
 
@@ -90,6 +204,8 @@ class IngestRequest(BaseModel):
     docs: List[IngestDoc]
     chunk_size: int = Field(default=800, ge=100, le=2000)
     chunk_overlap: int = Field(default=100, ge=0, le=500)
+    # Treat the request as the complete set of chunks for every source it contains.
+    reconcile: bool = False
 
 
 class ChatRequest(BaseModel):
@@ -100,6 +216,15 @@ class ChatRequest(BaseModel):
 class ClothCutoutRequest(BaseModel):
     imageUrl: str = Field(default="", alias="image_url")
     imageBase64: str = Field(default="", alias="image_base64")
+    # Output shaping; an empty format is negotiated from the Accept header (PNG by default).
+    format: str = ""
+    quality: Optional[int] = Field(default=None, ge=1, le=100)
+    maxDimension: Optional[int] = Field(default=None, alias="max_dimension", ge=32, le=4096)
+    crop: bool = False
+
+
+class ClothCutoutBatchRequest(BaseModel):
+    items: List[ClothCutoutRequest] = Field(min_length=1, max_length=CUTOUT_BATCH_MAX_ITEMS)
 
 
 class RagState(TypedDict):
@@ -117,27 +242,115 @@ def weaviate_headers() -> Dict[str, str]:
     return headers
 
 
-def weaviate_request(method: str, path: str, **kwargs: Any) -> requests.Response:
+def weaviate_operation(method: str, path: str) -> str:
+    """Low-cardinality metric label: the API family without class names or object ids."""
+    parts = path.split("?", 1)[0].strip("/").split("/")
+    family = "/".join(parts[:3]) if parts[:2] == ["v1", "batch"] or parts[1:2] == [".well-known"] else "/".join(parts[:2])
+    return f"{method} /{family}"
+
+
+# Ingestion sets this to its own pool so long batch writes never hold the connections chat queries need.
+weaviate_pool: ContextVar[str] = ContextVar("weaviate_pool", default="weaviate")
+
+
+@contextmanager
+def ingest_connections() -> Iterator[None]:
+    token = weaviate_pool.set("weaviate-ingest")
+    try:
+        yield
+    finally:
+        weaviate_pool.reset(token)
+
+
+async def weaviate_request(method: str, path: str, **kwargs: Any) -> httpx.Response:
     url = f"{WEAVIATE_HOST}{path}"
     headers = kwargs.pop("headers", {})
     merged_headers = weaviate_headers()
     merged_headers.update(headers)
-    return requests.request(
-        method,
-        url,
-        headers=merged_headers,
-        timeout=REQUEST_TIMEOUT,
-        **kwargs,
+    client = http_clients.get(weaviate_pool.get(), timeout=REQUEST_TIMEOUT)
+    return await observe_response(
+        WEAVIATE_REQUEST_SECONDS,
+        "weaviate",
+        client.request(
+            method,
+            url,
+            headers=merged_headers,
+            **kwargs,
+        ),
+        operation=weaviate_operation(method, path),
+    )
+
+
+class CollectionSchemaState:
+    """
+    Remembers that the Weaviate class exists so the hot paths skip the schema GET.
+
+    The flag is only cleared when a query or batch write fails with a missing-class
+    error, after which the next caller re-checks (and re-creates) the schema.
+    """
+
+    def __init__(self) -> None:
+        self.ready = False
+        self.revalidations = 0
+        self.invalidations = 0
+        self._lock = asyncio.Lock()
+
+    async def ensure(self) -> None:
+        if self.ready:
+            return
+        async with self._lock:
+            if self.ready:
+                return
+            self.revalidations += 1
+            await create_collection_if_missing()
+            self.ready = True
+
+    def invalidate(self) -> None:
+        self.ready = False
+        self.invalidations += 1
+
+    def status(self) -> Dict[str, Any]:
+        return {"ready": self.ready, "revalidations": self.revalidations, "invalidations": self.invalidations}
+
+
+collection_state = CollectionSchemaState()
+
+
+def is_missing_class_error(message: str) -> bool:
+    # Whole, case-sensitive class name: "Doc" must not match "document" or a "docs" field path.
+    if not re.search(rf"\b{re.escape(COLLECTION_NAME)}\b", message):
+        return False
+    lowered = message.lower()
+    return any(
+        marker in lowered
+        for marker in ("cannot query field", "not found", "not present", "does not exist", "no such class")
     )
 
 
-def ensure_collection() -> None:
+async def ensure_collection() -> None:
+    await collection_state.ensure()
+
+
+async def with_collection(operation: Callable[[], Awaitable[T]]) -> T:
+    """Run a Weaviate operation, re-validating the schema once if the class has gone missing."""
+    await ensure_collection()
+    try:
+        return await operation()
+    except RuntimeError as exc:
+        if not is_missing_class_error(str(exc)):
+            raise
+        collection_state.invalidate()
+        await ensure_collection()
+        return await operation()
+
+
+async def create_collection_if_missing() -> None:
     if not CLASS_NAME_PATTERN.match(COLLECTION_NAME):
         raise RuntimeError(
             "WEAVIATE_CLASS must start with an uppercase letter and contain only letters, numbers, and underscores."
         )
 
-    exists = weaviate_request("GET", f"/v1/schema/{COLLECTION_NAME}")
+    exists = await weaviate_request("GET", f"/v1/schema/{COLLECTION_NAME}")
     if exists.status_code == 200:
         return
     if exists.status_code != 404:
@@ -155,49 +368,93 @@ def ensure_collection() -> None:
         ],
     }
 
-    created = weaviate_request("POST", "/v1/schema", json=payload)
+    created = await weaviate_request("POST", "/v1/schema", json=payload)
     if created.status_code not in (200, 201):
         raise RuntimeError(f"Failed to create schema: {created.status_code} {created.text}")
 
 
-def chunk_text(text: str, chunk_size: int, chunk_overlap: int) -> List[str]:
-    normalized = " ".join(text.split())
-    if not normalized:
-        return []
+def iter_chunks(text: str, chunk_size: int, chunk_overlap: int) -> Iterator[str]:
+    """
+    Yield the same windows as slicing the whitespace-normalized text, without building it.
 
+    Words are appended to a buffer that never holds much more than one chunk, so a
+    multi-megabyte document costs roughly ``chunk_size`` bytes of working memory.
+    """
     step = max(1, chunk_size - chunk_overlap)
-    chunks: List[str] = []
-    for start in range(0, len(normalized), step):
-        chunk = normalized[start : start + chunk_size].strip()
+    buffer = ""
+    for match in WORD_PATTERN.finditer(text):
+        buffer = f"{buffer} {match.group()}" if buffer else match.group()
+        start = 0
+        while len(buffer) - start > chunk_size:
+            chunk = buffer[start : start + chunk_size].strip()
+            if chunk:
+                yield chunk
+            start += step
+        if start:
+            buffer = buffer[start:]
+    if buffer:
+        chunk = buffer[:chunk_size].strip()
         if chunk:
-            chunks.append(chunk)
-        if start + chunk_size >= len(normalized):
-            break
-    return chunks
+            yield chunk
 
 
-def build_records(docs: List[IngestDoc], chunk_size: int, chunk_overlap: int) -> List[Dict[str, str]]:
-    records: List[Dict[str, str]] = []
+def chunk_text(text: str, chunk_size: int, chunk_overlap: int) -> List[str]:
+    return list(iter_chunks(text, chunk_size, chunk_overlap))
+
+
+def chunk_id(source: str, url: str, text: str) -> str:
+    """Content-derived object id: re-ingesting an unchanged chunk addresses the same Weaviate object."""
+    return str(uuid.uuid5(CHUNK_ID_NAMESPACE, "\x1f".join((source, url, text))))
+
+
+def iter_records(docs: Iterable[IngestDoc], chunk_size: int, chunk_overlap: int) -> Iterator[Dict[str, str]]:
     for doc in docs:
-        for chunk in chunk_text(doc.text, chunk_size, chunk_overlap):
-            records.append(
-                {
-                    "id": str(uuid.uuid4()),
-                    "text": chunk,
-                    "source": doc.source,
-                    "url": doc.url or "",
-                    "category": doc.category,
-                }
-            )
-    return records
+        url = doc.url or ""
+        for chunk in iter_chunks(doc.text, chunk_size, chunk_overlap):
+            yield {
+                "id": chunk_id(doc.source, url, chunk),
+                "text": chunk,
+                "source": doc.source,
+                "url": url,
+                "category": doc.category,
+            }
+
+
+def build_records(docs: List[IngestDoc], chunk_size: int, chunk_overlap: int) -> List[Dict[str, str]]:
+    return list(iter_records(docs, chunk_size, chunk_overlap))
+
+
+async def send_objects(objects: List[Dict[str, Any]]) -> List[Tuple[str, Optional[str]]]:
+    """POST one batch and return per-object ``(id, error)``; request-level failures are classified for retry."""
+    try:
+        response = await weaviate_request("POST", "/v1/batch/objects", json={"objects": objects})
+    except httpx.TimeoutException as exc:
+        raise BatchTooLarge(f"Batch of {len(objects)} timed out: {exc}") from exc
+    except httpx.TransportError as exc:
+        raise BatchTransientError(f"Failed to reach Weaviate: {exc}") from exc
+
+    if response.status_code == 413:
+        raise BatchTooLarge(f"Batch of {len(objects)} rejected as too large")
+    if response.status_code == 429 or response.status_code >= 500:
+        raise BatchTransientError(f"Failed to insert objects: {response.status_code} {response.text}")
+    if response.status_code not in (200, 202):
+        # Surfaces missing-class errors to with_collection, which recreates the schema once.
+        raise BatchRejected(f"Failed to insert objects: {response.status_code} {response.text}")
+
+    payload = response.json()
+    object_results = payload.get("objects", []) if isinstance(payload, dict) else payload
+    results: List[Tuple[str, Optional[str]]] = []
+    for result in object_results:
+        errors = (result.get("result") or {}).get("errors")
+        results.append((str(result.get("id", "")), str(errors) if errors else None))
+    return results
 
 
-def insert_records(records: List[Dict[str, str]]) -> int:
+async def insert_records(records: List[Dict[str, str]]) -> BatchReport:
     if not records:
-        return 0
+        return {"inserted": 0, "failed": [], "retries": 0, "splits": 0}
 
-    ensure_collection()
-    objects = [
+    objects: List[Dict[str, Any]] = [
         {
             "class": COLLECTION_NAME,
             "id": item["id"],
@@ -210,32 +467,363 @@ def insert_records(records: List[Dict[str, str]]) -> int:
         }
         for item in records
     ]
+    if embedding_model.enabled:
+        # The class has no vectorizer, so we supply object vectors ourselves.
+        vectors = await run_in_threadpool(embed_records, records)
+        for obj, vector in zip(objects, vectors):
+            obj["vector"] = vector
+
+    return await with_collection(lambda: write_objects(objects, send_objects))
 
-    response = weaviate_request("POST", "/v1/batch/objects", json={"objects": objects})
-    if response.status_code not in (200, 202):
-        raise RuntimeError(f"Failed to insert objects: {response.status_code} {response.text}")
+
+async def graphql_get(query: str) -> List[Dict[str, Any]]:
+    response = await weaviate_request(
+        "POST",
+        "/v1/graphql",
+        json={"query": query},
+    )
+    if response.status_code != 200:
+        raise RuntimeError(f"Failed to query Weaviate: {response.status_code} {response.text}")
 
     payload = response.json()
-    object_results = payload.get("objects", []) if isinstance(payload, dict) else payload
-    failed = 0
-    for result in object_results:
-        errors = result.get("result", {}).get("errors")
-        if errors:
-            failed += 1
+    errors = payload.get("errors")
+    if errors:
+        raise RuntimeError("; ".join([e.get("message", "Unknown GraphQL error") for e in errors]))
+
+    return payload.get("data", {}).get("Get", {}).get(COLLECTION_NAME) or []
+
+
+async def existing_ids(ids: List[str], require_vector: bool = False) -> Set[str]:
+    """
+    Ids from ``ids`` that are already stored, so unchanged chunks are neither embedded nor re-sent.
+
+    With ``require_vector`` an object stored without a vector (written before
+    embeddings were enabled) does not count, so the next ingest of its chunk
+    embeds it and overwrites it in place.
+    """
+    if not ids:
+        return set()
+    fields = "id vector" if require_vector else "id"
+    graphql_query = f"""
+    {{
+      Get {{
+        {COLLECTION_NAME}(where: {{ path: ["id"], operator: ContainsAny, valueText: {json.dumps(ids)} }}, limit: {len(ids)}) {{
+          _additional {{
+            {fields}
+          }}
+        }}
+      }}
+    }}
+    """
+    try:
+        docs = await with_collection(lambda: graphql_get(graphql_query))
+    except RuntimeError as exc:
+        # Older Weaviate versions lack ContainsAny; writing again is still idempotent.
+        print(f"Existing-chunk lookup failed, re-sending batch: {exc}")
+        return set()
+    stored = [doc.get("_additional") or {} for doc in docs]
+    return {item.get("id") for item in stored if not require_vector or item.get("vector")} - {None}
+
+
+async def stale_ids(keep: Dict[str, Set[str]]) -> List[str]:
+    """Walk the class with a cursor and return ids of ``keep``'s sources that are not in the kept sets."""
+    stale: List[str] = []
+    after = ""
+    while True:
+        cursor = f', after: "{after}"' if after else ""
+        graphql_query = f"""
+        {{
+          Get {{
+            {COLLECTION_NAME}(limit: {RECONCILE_PAGE_SIZE}{cursor}) {{
+              source
+              _additional {{
+                id
+              }}
+            }}
+          }}
+        }}
+        """
+        docs = await graphql_get(graphql_query)
+        for doc in docs:
+            object_id = (doc.get("_additional") or {}).get("id")
+            source = doc.get("source")
+            if object_id and source in keep and object_id not in keep[source]:
+                stale.append(object_id)
+        if len(docs) < RECONCILE_PAGE_SIZE:
+            return stale
+        after = (docs[-1].get("_additional") or {}).get("id") or ""
+        if not after:
+            return stale
+
+
+async def delete_objects(ids: List[str]) -> int:
+    deleted = 0
+    for start in range(0, len(ids), INGEST_BATCH_SIZE):
+        batch = ids[start : start + INGEST_BATCH_SIZE]
+        response = await weaviate_request(
+            "DELETE",
+            "/v1/batch/objects",
+            json={
+                "match": {
+                    "class": COLLECTION_NAME,
+                    "where": {"path": ["id"], "operator": "ContainsAny", "valueTextArray": batch},
+                },
+                "output": "minimal",
+            },
+        )
+        if response.status_code not in (200, 204):
+            raise RuntimeError(f"Failed to delete stale chunks: {response.status_code} {response.text}")
+        results = response.json().get("results", {}) if response.content else {}
+        deleted += int(results.get("successful", len(batch)))
+    return deleted
 
-    if failed:
-        raise RuntimeError(f"Failed to ingest {failed} chunks.")
 
-    return len(records)
+class RecordWriter:
+    """
+    Streams records into Weaviate and the local index without holding the whole ingest.
+
+    Records are grouped into ``batch_size`` batches; up to ``concurrency`` batch
+    writes run at once and ``add`` waits for a slot, so a fast producer is
+    throttled to Weaviate's pace. Each batch first asks which ids already exist
+    and only embeds and sends the rest. When the local index is maintained,
+    every ``local_flush`` records are appended to it as one segment; otherwise
+    it is only marked stale and rebuilt the next time a fallback needs it.
+
+    With ``reconcile`` the ingest is treated as a full snapshot of every source
+    it mentions: after writing, chunks of those sources that were not produced
+    are deleted from both stores.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = INGEST_BATCH_SIZE,
+        concurrency: int = INGEST_CONCURRENCY,
+        local_flush: int = INGEST_LOCAL_FLUSH_RECORDS,
+        reconcile: bool = False,
+    ) -> None:
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.local_flush = local_flush
+        self.reconcile = reconcile
+        self.write_remote = RETRIEVER != "local"
+        self.write_local = LOCAL_INDEX_MAINTAINED
+        self.chunks = 0
+        self.ingested = 0
+        self.skipped = 0
+        self.removed = 0
+        self.batches = 0
+        self.batches_done = 0
+        self.failed = 0
+        self.retries = 0
+        self.splits = 0
+        self.failures: List[FailedObject] = []
+        # Set once anything may have changed in either store; callers use it to invalidate caches.
+        self.dirty = False
+        self._pending: Dict[str, Dict[str, str]] = {}
+        self._local_pending: List[Dict[str, str]] = []
+        self._in_flight: Set["asyncio.Task[Tuple[BatchReport, int]]"] = set()
+        self._produced: Dict[str, Set[str]] = {}
+
+    async def add(self, record: Dict[str, str]) -> None:
+        self.chunks += 1
+        if self.reconcile:
+            self._produced.setdefault(record["source"], set()).add(record["id"])
+        if record["id"] in self._pending:
+            # Identical text repeated within one document maps to the same chunk.
+            self.skipped += 1
+            return
+        self._pending[record["id"]] = record
+        if len(self._pending) >= self.batch_size:
+            await self._flush_batch()
+
+    async def write_all(self, records: Iterable[Dict[str, str]]) -> "RecordWriter":
+        try:
+            for record in records:
+                await self.add(record)
+            await self.close()
+        except BaseException:
+            await self.abort()
+            raise
+        return self
+
+    async def _flush_batch(self) -> None:
+        batch, self._pending = list(self._pending.values()), {}
+        if not batch:
+            return
+        self.batches += 1
+        if self.write_local:
+            self._local_pending.extend(batch)
+            if len(self._local_pending) >= self.local_flush:
+                await self._flush_local()
+        if not self.write_remote:
+            self.batches_done += 1
+            return
+        while len(self._in_flight) >= self.concurrency:
+            done, _ = await asyncio.wait(self._in_flight, return_when=asyncio.FIRST_COMPLETED)
+            self._collect(done)
+        self._in_flight.add(asyncio.ensure_future(self._write_batch(batch)))
+
+    async def _write_batch(self, batch: List[Dict[str, str]]) -> Tuple[BatchReport, int]:
+        known = await existing_ids([record["id"] for record in batch], require_vector=embedding_model.enabled)
+        fresh = [record for record in batch if record["id"] not in known]
+        if fresh:
+            self.dirty = True
+        return await insert_records(fresh), len(batch) - len(fresh)
+
+    async def _flush_local(self) -> None:
+        records, self._local_pending = self._local_pending, []
+        if not records:
+            return
+        added = await run_in_threadpool(local_index.add_records, records)
+        if added:
+            self.dirty = True
+        if not self.write_remote:
+            self.ingested += added
+            self.skipped += len(records) - added
+
+    def _collect(self, done: Iterable["asyncio.Task[Tuple[BatchReport, int]]"]) -> None:
+        for task in done:
+            self._in_flight.discard(task)
+            report, skipped = task.result()
+            self.batches_done += 1
+            self.ingested += report["inserted"]
+            self.skipped += skipped
+            self.failed += len(report["failed"])
+            self.retries += report["retries"]
+            self.splits += report["splits"]
+            room = INGEST_MAX_REPORTED_ERRORS - len(self.failures)
+            if room > 0:
+                self.failures.extend(report["failed"][:room])
+
+    def progress(self) -> Dict[str, Any]:
+        return {
+            "chunks": self.chunks,
+            "batches": self.batches,
+            "batches_done": self.batches_done,
+            "ingested": self.ingested,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "removed": self.removed,
+        }
+
+    def report(self) -> Dict[str, Any]:
+        """Structured outcome: failed objects stay out of Weaviate and are retried by the next ingest."""
+        return {
+            "ingested": self.ingested,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "removed": self.removed,
+            "retries": self.retries,
+            "splits": self.splits,
+            "failures": self.failures,
+        }
+
+    async def close(self) -> None:
+        """Flush the remaining partial batch, wait for every in-flight write, then reconcile."""
+        await self._flush_batch()
+        await self._flush_local()
+        if self._in_flight:
+            done, _ = await asyncio.wait(self._in_flight)
+            self._collect(done)
+        if self.reconcile and self._produced:
+            await self._reconcile()
+        self._mark_local_stale()
+
+    def _mark_local_stale(self) -> None:
+        if self.dirty and not self.write_local:
+            local_index.stale = True
+
+    async def _reconcile(self) -> None:
+        removed_locally = 0
+        if self.write_local:
+            removed_locally = await run_in_threadpool(local_index.reconcile, self._produced)
+        removed_remotely = 0
+        if self.write_remote:
+            stale = await with_collection(lambda: stale_ids(self._produced))
+            if stale:
+                self.dirty = True
+                removed_remotely = await delete_objects(stale)
+        if removed_locally:
+            self.dirty = True
+        self.removed = removed_remotely if self.write_remote else removed_locally
+
+    async def remove(self, ids: List[str]) -> int:
+        """Delete specific chunk ids from both stores (used for delta ingests)."""
+        if not ids:
+            return 0
+        self.dirty = True
+        self._mark_local_stale()
+        removed = 0
+        if self.write_local:
+            removed = await run_in_threadpool(local_index.remove_ids, set(ids))
+        if self.write_remote:
+            removed = await with_collection(lambda: delete_objects(ids))
+        self.removed += removed
+        return removed
+
+    async def abort(self) -> None:
+        self.dirty = True
+        self._mark_local_stale()
+        for task in self._in_flight:
+            task.cancel()
+        await asyncio.gather(*self._in_flight, return_exceptions=True)
+        self._in_flight.clear()
+
+
+def local_retriever_is_primary() -> bool:
+    if RETRIEVER == "local":
+        return True
+    return RETRIEVER == "auto" and 0 < len(local_index) <= LOCAL_INDEX_AUTO_MAX_DOCS
+
+
+async def retrieve_documents(query: str, limit: int) -> List[Dict[str, Any]]:
+    if local_retriever_is_primary():
+        return local_index.search(query, limit)
+    try:
+        return await with_collection(lambda: query_collection(query, limit))
+    except Exception as exc:
+        if not await fallback_index_ready():
+            raise
+        # Weaviate is unreachable or failing; the embedded index holds the same records.
+        print(f"Weaviate retrieval failed, using local index: {exc}")
+        local_index.fallback_searches += 1
+        return local_index.search(query, limit)
+
+
+async def fallback_index_ready() -> bool:
+    """Make sure the local index can stand in for Weaviate, building it from the crawled corpus if needed."""
+    if LOCAL_INDEX_MAINTAINED or (local_index.loaded and not local_index.stale):
+        return len(local_index) > 0
+    if os.path.exists(REGULATIONS_PATH):
+        try:
+            await fallback_index_flight.run("build", build_fallback_index)
+        except Exception as exc:
+            print(f"Unable to build the fallback index: {exc}")
+    return len(local_index) > 0
+
+
+async def build_fallback_index() -> int:
+    records = build_records(
+        regulation_docs(load_regulations(REGULATIONS_PATH)), CRAWLED_CHUNK_SIZE, CRAWLED_CHUNK_OVERLAP
+    )
+    return await run_in_threadpool(local_index.replace_records, records)
 
 
-def retrieve_documents(query: str, limit: int) -> List[Dict[str, Any]]:
-    ensure_collection()
+async def search_clause(query: str) -> str:
     escaped_query = query.replace("\\", "\\\\").replace('"', '\\"')
+    if not embedding_model.enabled:
+        return f'bm25: {{ query: "{escaped_query}" }}'
+    vector = await run_in_threadpool(embedding_model.embed_query, query)
+    vector_literal = ", ".join(f"{value:.6f}" for value in vector)
+    return f'hybrid: {{ query: "{escaped_query}", vector: [{vector_literal}], alpha: {HYBRID_ALPHA:g} }}'
+
+
+async def query_collection(query: str, limit: int) -> List[Dict[str, Any]]:
+    clause = await search_clause(query)
     graphql_query = f"""
     {{
       Get {{
-        {COLLECTION_NAME}(bm25: {{ query: "{escaped_query}" }} limit: {int(limit)}) {{
+        {COLLECTION_NAME}({clause} limit: {int(limit)}) {{
           text
           source
           url
@@ -248,20 +836,7 @@ def retrieve_documents(query: str, limit: int) -> List[Dict[str, Any]]:
     }}
     """
 
-    response = weaviate_request(
-        "POST",
-        "/v1/graphql",
-        json={"query": graphql_query},
-    )
-    if response.status_code != 200:
-        raise RuntimeError(f"Failed to query Weaviate: {response.status_code} {response.text}")
-
-    payload = response.json()
-    errors = payload.get("errors")
-    if errors:
-        raise RuntimeError("; ".join([e.get("message", "Unknown GraphQL error") for e in errors]))
-
-    docs = payload.get("data", {}).get("Get", {}).get(COLLECTION_NAME, [])
+    docs = await graphql_get(graphql_query)
     results: List[Dict[str, Any]] = []
     for doc in docs:
         additional = doc.get("_additional") or {}
@@ -279,7 +854,7 @@ def retrieve_documents(query: str, limit: int) -> List[Dict[str, Any]]:
 
 def build_context(docs: List[Dict[str, Any]]) -> str:
     lines: List[str] = []
-    for index, doc in enumerate(docs, start=1):
+    for index, doc in enumerate(assemble_context(docs), start=1):
         source = doc.get("source") or "unknown"
         url = doc.get("url") or ""
         url_part = f" | URL: {url}" if url else ""
@@ -307,12 +882,58 @@ def fallback_answer(query: str, docs: List[Dict[str, Any]]) -> str:
     )
 
 
-def call_huggingface_completion(system_prompt: str, user_prompt: str) -> Optional[str]:
-    if not HF_API_TOKEN:
-        return None
+def hf_models() -> List[str]:
+    return list(dict.fromkeys(name for name in (HF_MODEL, HF_FALLBACK_MODEL) if name))
 
-    def invoke_router(model_name: str) -> Optional[str]:
-        response = requests.post(
+
+def completion_text(payload: Any) -> str:
+    if not isinstance(payload, dict):
+        return ""
+    choices = payload.get("choices")
+    if isinstance(choices, list) and choices:
+        first_choice = choices[0] if isinstance(choices[0], dict) else {}
+        message = first_choice.get("message") if isinstance(first_choice.get("message"), dict) else {}
+        content = (message.get("content") or "").strip()
+        if content:
+            return content
+    return (payload.get("generated_text") or "").strip()
+
+
+async def openai_completion(system_prompt: str, user_prompt: str, timeout: float) -> str:
+    client = http_clients.get("openai", timeout=REQUEST_TIMEOUT)
+    response = await observe_response(
+        LLM_REQUEST_SECONDS,
+        "llm",
+        client.post(
+            OPENAI_CHAT_COMPLETIONS_URL,
+            headers={
+                "Authorization": f"Bearer {OPENAI_API_KEY}",
+                "Content-Type": "application/json",
+            },
+            json={
+                "model": OPENAI_MODEL,
+                "temperature": 0.1,
+                "messages": [
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt},
+                ],
+            },
+            timeout=timeout,
+        ),
+        provider="openai",
+        model=OPENAI_MODEL,
+    )
+    if response.status_code >= 400:
+        raise RuntimeError(f"{response.status_code} {response.text[:400]}")
+    return completion_text(response.json())
+
+
+async def hf_completion(model_name: str, system_prompt: str, user_prompt: str, timeout: float) -> str:
+    client = http_clients.get("hf", timeout=max(REQUEST_TIMEOUT, 90))
+    response = await observe_response(
+        LLM_REQUEST_SECONDS,
+        "llm",
+        client.post(
             HF_CHAT_COMPLETIONS_URL,
             headers={
                 "Authorization": f"Bearer {HF_API_TOKEN}",
@@ -327,56 +948,38 @@ def call_huggingface_completion(system_prompt: str, user_prompt: str) -> Optiona
                 "temperature": 0.1,
                 "max_tokens": 320,
             },
-            timeout=max(REQUEST_TIMEOUT, 90),
-        )
+            timeout=timeout,
+        ),
+        provider="hf",
+        model=model_name,
+    )
+    if response.status_code >= 400:
+        raise RuntimeError(f"{response.status_code} {(response.text or '')[:400].replace(chr(10), ' ')}")
+    return completion_text(response.json())
 
-        if response.status_code >= 400:
-            body = response.text or ""
-            short_body = body[:400].replace("\n", " ")
-            print(f"HF router error ({model_name}): {response.status_code} {short_body}")
 
-            if response.status_code == 400:
-                try:
-                    payload = response.json()
-                except Exception:
-                    return None
-
-                message = (
-                    payload.get("error", {}).get("message", "")
-                    if isinstance(payload, dict)
-                    else ""
+def llm_providers(system_prompt: str, user_prompt: str) -> List[Provider]:
+    """Configured chat-completion providers in priority order: OpenAI, then the HF router models."""
+    providers: List[Provider] = []
+    if OPENAI_API_KEY:
+        providers.append(
+            Provider(f"openai:{OPENAI_MODEL}", lambda timeout: openai_completion(system_prompt, user_prompt, timeout))
+        )
+    if HF_API_TOKEN:
+        for model_name in hf_models():
+            providers.append(
+                Provider(
+                    f"hf:{model_name}",
+                    lambda timeout, model_name=model_name: hf_completion(model_name, system_prompt, user_prompt, timeout),
                 )
-                if (
-                    "not supported" in message.lower()
-                    and HF_FALLBACK_MODEL
-                    and HF_FALLBACK_MODEL != model_name
-                ):
-                    return invoke_router(HF_FALLBACK_MODEL)
-            return None
-
-        payload = response.json()
-        choices = payload.get("choices")
-        if isinstance(choices, list) and choices:
-            first_choice = choices[0] if isinstance(choices[0], dict) else {}
-            message = first_choice.get("message") if isinstance(first_choice.get("message"), dict) else {}
-            content = (message.get("content") or "").strip()
-            if content:
-                return content
-
-        text = (payload.get("generated_text") or "").strip() if isinstance(payload, dict) else ""
-        return text or None
+            )
+    return providers
 
-    try:
-        return invoke_router(HF_MODEL)
-    except Exception as exc:
-        print(f"HF router exception: {exc}")
-        return None
 
+NO_DOCUMENTS_ANSWER = "No relevant documents were found for this question."
 
-def generate_answer(query: str, docs: List[Dict[str, Any]]) -> str:
-    if not docs:
-        return "No relevant documents were found for this question."
 
+def build_prompts(query: str, docs: List[Dict[str, Any]]) -> Tuple[str, str]:
     system_prompt = (
         "You are a customer support assistant for a fashion retailer. "
         "Answer only from the provided regulatory context. "
@@ -388,59 +991,154 @@ def generate_answer(query: str, docs: List[Dict[str, Any]]) -> str:
         f"Regulatory context:\n{build_context(docs)}\n\n"
         "Return a concise answer with 2-4 bullet points where useful."
     )
+    return system_prompt, user_prompt
 
-    if not OPENAI_API_KEY and HF_API_TOKEN:
-        hf_answer = call_huggingface_completion(system_prompt, user_prompt)
-        return hf_answer or fallback_answer(query, docs)
 
-    if not OPENAI_API_KEY:
-        return fallback_answer(query, docs)
+async def generate_answer(query: str, docs: List[Dict[str, Any]]) -> str:
+    if not docs:
+        return NO_DOCUMENTS_ANSWER
+
+    system_prompt, user_prompt = build_prompts(query, docs)
+    result = await llm_router.complete(llm_providers(system_prompt, user_prompt))
+    return result[0] if result else fallback_answer(query, docs)
+
+
+async def stream_chat_completion(
+    client: httpx.AsyncClient,
+    url: str,
+    token: str,
+    model: str,
+    system_prompt: str,
+    user_prompt: str,
+    timeout: Optional[float] = None,
+    **options: Any,
+) -> AsyncIterator[str]:
+    """
+    Yield content deltas from an OpenAI-compatible ``stream: true`` chat completion.
 
+    ``timeout`` bounds connecting and each read, so a provider that never starts
+    answering gives up after that long rather than the pool's default.
+    """
+    provider = "openai" if url == OPENAI_CHAT_COMPLETIONS_URL else "hf"
+    started = time.perf_counter()
+    status = "error"
     try:
-        response = requests.post(
-            "https://api.openai.com/v1/chat/completions",
+        async with client.stream(
+            "POST",
+            url,
             headers={
-                "Authorization": f"Bearer {OPENAI_API_KEY}",
+                "Authorization": f"Bearer {token}",
                 "Content-Type": "application/json",
             },
             json={
-                "model": OPENAI_MODEL,
+                "model": model,
                 "temperature": 0.1,
+                "stream": True,
                 "messages": [
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": user_prompt},
                 ],
+                **options,
             },
-            timeout=REQUEST_TIMEOUT,
+            timeout=httpx.USE_CLIENT_DEFAULT if timeout is None else timeout,
+        ) as response:
+            status = str(response.status_code)
+            if response.status_code >= 400:
+                body = (await response.aread()).decode("utf-8", "replace")
+                raise RuntimeError(f"{response.status_code} {body[:400]}")
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:") :].strip()
+                if data == "[DONE]":
+                    break
+                try:
+                    chunk = json.loads(data)
+                except ValueError:
+                    continue
+                choices = chunk.get("choices") or [{}]
+                delta = (choices[0].get("delta") or {}).get("content") if isinstance(choices[0], dict) else None
+                if delta:
+                    yield delta
+    finally:
+        # Covers the whole stream, not just time to first token.
+        LLM_REQUEST_SECONDS.observe(time.perf_counter() - started, provider=provider, model=model, status=status)
+
+
+async def stream_answer(query: str, docs: List[Dict[str, Any]]) -> AsyncIterator[str]:
+    """
+    Token-streaming counterpart of generate_answer with the same provider order,
+    breakers and deadline. Streams are not hedged: once a provider starts
+    sending tokens it is committed to.
+    """
+    if not docs:
+        yield NO_DOCUMENTS_ANSWER
+        return
+
+    system_prompt, user_prompt = build_prompts(query, docs)
+    attempts: List[Tuple[str, httpx.AsyncClient, str, str, str, Dict[str, Any]]] = []
+    if OPENAI_API_KEY:
+        client = http_clients.get("openai", timeout=REQUEST_TIMEOUT)
+        attempts.append(
+            (f"openai:{OPENAI_MODEL}", client, OPENAI_CHAT_COMPLETIONS_URL, OPENAI_API_KEY, OPENAI_MODEL, {})
         )
+    if HF_API_TOKEN:
+        client = http_clients.get("hf", timeout=max(REQUEST_TIMEOUT, 90))
+        for model_name in hf_models():
+            attempts.append(
+                (f"hf:{model_name}", client, HF_CHAT_COMPLETIONS_URL, HF_API_TOKEN, model_name, {"max_tokens": 320})
+            )
 
-        if response.status_code >= 400:
-            return fallback_answer(query, docs)
+    ends_at = time.monotonic() + llm_router.deadline
+    for name, client, url, token, model_name, options in attempts:
+        remaining = ends_at - time.monotonic()
+        if remaining <= 0:
+            break
+        if not llm_router.breaker(name).allow():
+            continue
+        produced = False
+        try:
+            deltas = stream_chat_completion(
+                client, url, token, model_name, system_prompt, user_prompt, timeout=remaining, **options
+            )
+            async for delta in deltas:
+                if not produced:
+                    # Time to first token is not comparable with full completions, so only the breaker learns from it.
+                    llm_router.breaker(name).success()
+                produced = True
+                yield delta
+            if produced:
+                return
+            llm_router.breaker(name).failure()
+        except Exception as exc:
+            print(f"Streaming completion error ({model_name}): {exc}")
+            if produced:
+                # Tokens already reached the client; a retry would duplicate them.
+                return
+            llm_router.breaker(name).failure()
+
+    yield fallback_answer(query, docs)
 
-        payload = response.json()
-        content = (
-            payload.get("choices", [{}])[0]
-            .get("message", {})
-            .get("content", "")
-            .strip()
-        )
-        return content or fallback_answer(query, docs)
-    except Exception:
-        return fallback_answer(query, docs)
+
+def rewrite_query(query: str) -> str:
+    return " ".join(query.split())
 
 
 def rewrite_query_node(state: RagState) -> RagState:
-    state["rewritten_query"] = " ".join(state["query"].split())
+    with timed(RAG_NODE_SECONDS, "rewrite", node="rewrite"):
+        state["rewritten_query"] = rewrite_query(state["query"])
     return state
 
 
-def retrieve_node(state: RagState) -> RagState:
-    state["retrieved_docs"] = retrieve_documents(state["rewritten_query"], state["limit"])
+async def retrieve_node(state: RagState) -> RagState:
+    with timed(RAG_NODE_SECONDS, "retrieve", node="retrieve"):
+        state["retrieved_docs"] = await retrieve_documents(state["rewritten_query"], state["limit"])
     return state
 
 
-def generate_node(state: RagState) -> RagState:
-    state["answer"] = generate_answer(state["query"], state["retrieved_docs"])
+async def generate_node(state: RagState) -> RagState:
+    with timed(RAG_NODE_SECONDS, "generate", node="generate"):
+        state["answer"] = await generate_answer(state["query"], state["retrieved_docs"])
     return state
 
 
@@ -459,39 +1157,42 @@ def build_rag_graph():
 
 
 rag_graph = build_rag_graph()
+chat_flight = SingleFlight("chat")
+retrieval_flight = SingleFlight("retrieve")
+fallback_index_flight = SingleFlight("fallback_index")
 
 
 @app.on_event("startup")
-def on_startup() -> None:
+async def on_startup() -> None:
     try:
-        ensure_collection()
+        await ensure_collection()
     except Exception as exc:
         print(f"Startup warning: unable to validate Weaviate collection: {exc}")
 
+    # As a fallback only, the index is built from the crawled corpus the first time Weaviate fails.
+    if LOCAL_INDEX_MAINTAINED and not local_index.load() and os.path.exists(REGULATIONS_PATH):
+        try:
+            await build_fallback_index()
+        except Exception as exc:
+            print(f"Startup warning: unable to build local index: {exc}")
 
-@app.post("/ingest")
-async def ingest(req: IngestRequest):
-    if not req.docs:
-        raise HTTPException(status_code=400, detail="docs is required")
-    if req.chunk_overlap >= req.chunk_size:
-        raise HTTPException(status_code=400, detail="chunk_overlap must be smaller than chunk_size")
-
-    records = build_records(req.docs, req.chunk_size, req.chunk_overlap)
-    if not records:
-        raise HTTPException(status_code=400, detail="No ingestible text found in docs")
-
-    try:
-        ingested = insert_records(records)
-    except Exception as exc:
-        raise HTTPException(status_code=502, detail=f"Ingestion failed: {exc}") from exc
+    if SEGMENTATION_WARMUP:
+        # Workers warm their own models in the background so health checks pass while the ONNX graph loads.
+        try:
+            segmentation_pool.start()
+        except Exception as exc:
+            print(f"Startup warning: unable to start segmentation workers: {exc}")
 
-    return {"ingested": ingested, "documents": len(req.docs), "chunks": len(records)}
 
+@app.on_event("shutdown")
+async def on_shutdown() -> None:
+    await job_runner.shutdown()
+    segmentation_pool.shutdown()
+    model_registry.close()
+    await http_clients.aclose()
 
-@app.post("/ingest-crawled")
-async def ingest_crawled():
-    regulations = load_regulations()
 
+def regulation_docs(regulations: List[Dict[str, Any]]) -> List[IngestDoc]:
     docs: List[IngestDoc] = []
     for row in regulations:
         content = (row.get("content") or "").strip()
@@ -505,50 +1206,430 @@ async def ingest_crawled():
                 category=row.get("category", "general"),
             )
         )
+    return docs
+
+
+def raise_if_nothing_written(writer: RecordWriter, message: str) -> None:
+    """Partial failures are reported in the response body; only a total failure is an error status."""
+    if writer.failed and not writer.ingested and not writer.skipped:
+        first = writer.failures[0]["error"] if writer.failures else "unknown error"
+        raise HTTPException(status_code=502, detail=f"{message}: {writer.failed} chunks failed: {first}")
+
+
+def track_documents(docs: Iterable[IngestDoc], job: Optional[Job]) -> Iterator[IngestDoc]:
+    for done, doc in enumerate(docs, start=1):
+        yield doc
+        if job is not None:
+            job.progress["documents_done"] = done
+
+
+def ingest_job(fn: Callable[[Job], Awaitable[Dict[str, Any]]]) -> Callable[[Job], Awaitable[Dict[str, Any]]]:
+    async def run(job: Job) -> Dict[str, Any]:
+        with ingest_connections():
+            return await fn(job)
+
+    return run
 
-    if not docs:
-        raise HTTPException(status_code=400, detail="No crawled regulation content found")
 
-    records = build_records(docs, chunk_size=800, chunk_overlap=100)
+def queue_full(exc: JobQueueFull) -> HTTPException:
+    return HTTPException(status_code=429, detail=str(exc), headers={"Retry-After": str(JOB_RETRY_AFTER)})
 
+
+def submit_job(kind: str, fn: Callable[[Job], Awaitable[Dict[str, Any]]]) -> JSONResponse:
+    try:
+        job = job_runner.submit(kind, ingest_job(fn))
+    except JobQueueFull as exc:
+        raise queue_full(exc) from exc
+    return JSONResponse(
+        status_code=202,
+        content={"job_id": job.id, "status": job.status, "status_url": f"/jobs/{job.id}"},
+    )
+
+
+async def run_job(kind: str, fn: Callable[[Job], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+    """Run ``fn`` as a job inside the request: same queue and concurrency limit as ``submit_job``."""
     try:
-        ingested = insert_records(records)
+        return await job_runner.run(kind, ingest_job(fn))
+    except JobQueueFull as exc:
+        raise queue_full(exc) from exc
+
+
+async def run_ingest(req: IngestRequest, job: Optional[Job] = None) -> Dict[str, Any]:
+    writer = RecordWriter(reconcile=req.reconcile)
+    if job is not None:
+        job.progress["documents"] = len(req.docs)
+        job.track(writer.progress)
+    try:
+        await writer.write_all(iter_records(track_documents(req.docs, job), req.chunk_size, req.chunk_overlap))
     except Exception as exc:
-        raise HTTPException(status_code=502, detail=f"Crawled ingestion failed: {exc}") from exc
+        raise HTTPException(status_code=502, detail=f"Ingestion failed: {exc}") from exc
+    finally:
+        # Even a failed batch may have written some chunks, so cached answers are stale either way.
+        if writer.dirty:
+            answer_cache.bump_corpus_version()
+
+    if not writer.chunks:
+        raise HTTPException(status_code=400, detail="No ingestible text found in docs")
+    raise_if_nothing_written(writer, "Ingestion failed")
 
     return {
-        "ingested": ingested,
+        **writer.report(),
+        "documents": len(req.docs),
+        "chunks": writer.chunks,
+    }
+
+
+@app.post("/ingest")
+async def ingest(req: IngestRequest, wait: bool = False):
+    """Queue an ingest job and return its id (``202``); ``?wait=true`` waits for the job's result instead."""
+    if not req.docs:
+        raise HTTPException(status_code=400, detail="docs is required")
+    if req.chunk_overlap >= req.chunk_size:
+        raise HTTPException(status_code=400, detail="chunk_overlap must be smaller than chunk_size")
+
+    if wait:
+        return await run_job("ingest", lambda job: run_ingest(req, job))
+    return submit_job("ingest", lambda job: run_ingest(req, job))
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = job_runner.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job id")
+    return job.snapshot()
+
+
+async def iter_ndjson_lines(request: Request) -> AsyncIterator[Tuple[int, bytes]]:
+    """Split the request body on newlines as it arrives; only one partial line is ever buffered."""
+    buffer = bytearray()
+    line_number = 0
+    async for piece in request.stream():
+        buffer.extend(piece)
+        start = 0
+        while True:
+            newline = buffer.find(b"\n", start)
+            if newline < 0:
+                break
+            line_number += 1
+            yield line_number, bytes(buffer[start:newline])
+            start = newline + 1
+        del buffer[:start]
+        if len(buffer) > INGEST_MAX_LINE_BYTES:
+            raise HTTPException(
+                status_code=413,
+                detail=f"NDJSON line {line_number + 1} exceeds {INGEST_MAX_LINE_BYTES} bytes",
+            )
+    if buffer.strip():
+        yield line_number + 1, bytes(buffer)
+
+
+@app.post("/ingest/stream")
+async def ingest_stream(
+    request: Request,
+    chunk_size: int = Query(default=800, ge=100, le=2000),
+    chunk_overlap: int = Query(default=100, ge=0, le=500),
+    reconcile: bool = False,
+):
+    """
+    Ingest an ``application/x-ndjson`` body with one ``IngestDoc`` per line.
+
+    Lines are parsed, chunked and written as they arrive and the local index
+    takes them as new segments, so memory does not grow with the corpus and,
+    beyond one id per chunk, not with the upload. Invalid lines are skipped and
+    reported. The body is consumed as it streams, so the request waits for its
+    job (which takes a job slot like ``/ingest``) instead of returning a job id.
+    """
+    if chunk_overlap >= chunk_size:
+        raise HTTPException(status_code=400, detail="chunk_overlap must be smaller than chunk_size")
+    return await run_job("ingest-stream", lambda job: run_ingest_stream(request, chunk_size, chunk_overlap, reconcile, job))
+
+
+async def run_ingest_stream(
+    request: Request, chunk_size: int, chunk_overlap: int, reconcile: bool, job: Optional[Job] = None
+) -> Dict[str, Any]:
+    writer = RecordWriter(reconcile=reconcile)
+    documents = 0
+    rejected = 0
+    errors: List[Dict[str, Any]] = []
+    if job is not None:
+        job.track(lambda: {**writer.progress(), "documents": documents, "rejected": rejected})
+    try:
+        async for line_number, line in iter_ndjson_lines(request):
+            if not line.strip():
+                continue
+            try:
+                doc = IngestDoc.model_validate_json(line)
+            except ValidationError as exc:
+                rejected += 1
+                if len(errors) < INGEST_MAX_REPORTED_ERRORS:
+                    first = exc.errors()[0]
+                    field = ".".join(str(part) for part in first.get("loc", ())) or "document"
+                    errors.append({"line": line_number, "error": f"{field}: {first.get('msg', 'invalid')}"})
+                continue
+            documents += 1
+            for record in iter_records((doc,), chunk_size, chunk_overlap):
+                await writer.add(record)
+        await writer.close()
+    except HTTPException:
+        await writer.abort()
+        raise
+    except Exception as exc:
+        await writer.abort()
+        raise HTTPException(status_code=502, detail=f"Streaming ingestion failed: {exc}") from exc
+    finally:
+        if writer.dirty:
+            answer_cache.bump_corpus_version()
+
+    if not documents:
+        raise HTTPException(status_code=400, detail="No valid documents found in NDJSON body")
+    raise_if_nothing_written(writer, "Streaming ingestion failed")
+
+    return {
+        **writer.report(),
+        "documents": documents,
+        "chunks": writer.chunks,
+        "batches": writer.batches,
+        "rejected": rejected,
+        "errors": errors,
+    }
+
+
+def diff_docs(diffs: List[Dict[str, Any]], side: str) -> List[IngestDoc]:
+    """Paragraphs on one side of a crawl diff: ``new`` = added + changed-after, ``old`` = removed + changed-before."""
+    docs: List[IngestDoc] = []
+    for diff in diffs:
+        if side == "new":
+            texts = diff["added"] + [change["after"] for change in diff["changed"]]
+        else:
+            texts = diff["removed"] + [change["before"] for change in diff["changed"]]
+        docs.extend(
+            IngestDoc(text=text, source=diff["source"], url=diff["url"], category=diff["category"]) for text in texts
+        )
+    return docs
+
+
+async def run_ingest_crawled(full: bool, job: Optional[Job] = None) -> Dict[str, Any]:
+    if job is not None:
+        job.progress["stage"] = "crawling"
+    # The crawler uses blocking requests; keep it off the event loop.
+    refresh = await run_in_threadpool(refresh_regulations, REGULATIONS_PATH, crawl_state, None, full)
+    diffs = refresh["diffs"]
+    full_ingest = full or refresh["initial"]
+
+    if full_ingest:
+        docs = regulation_docs(refresh["regulations"])
+        if not docs:
+            raise HTTPException(status_code=400, detail="No crawled regulation content found")
+        removed_docs: List[IngestDoc] = []
+    else:
+        docs = diff_docs(diffs, "new")
+        removed_docs = diff_docs(diffs, "old")
+
+    # A full crawl is a snapshot of each source, so chunks that disappeared from it are removed.
+    writer = RecordWriter(reconcile=full_ingest)
+    if job is not None:
+        job.progress.update({"stage": "writing", "documents": len(docs)})
+        job.track(writer.progress)
+    try:
+        await writer.write_all(
+            iter_records(track_documents(docs, job), CRAWLED_CHUNK_SIZE, CRAWLED_CHUNK_OVERLAP)
+        )
+        if removed_docs:
+            kept = {record["id"] for record in iter_records(docs, CRAWLED_CHUNK_SIZE, CRAWLED_CHUNK_OVERLAP)}
+            stale = [
+                record["id"]
+                for record in iter_records(removed_docs, CRAWLED_CHUNK_SIZE, CRAWLED_CHUNK_OVERLAP)
+                if record["id"] not in kept
+            ]
+            await writer.remove(stale)
+    except Exception as exc:
+        raise HTTPException(status_code=502, detail=f"Crawled ingestion failed: {exc}") from exc
+    finally:
+        if writer.dirty:
+            answer_cache.bump_corpus_version()
+
+    raise_if_nothing_written(writer, "Crawled ingestion failed")
+    # Until every object is stored the crawl is not recorded, so the next run diffs and sends it again.
+    committed = not writer.failed
+    if committed:
+        await run_in_threadpool(commit_refresh, refresh, REGULATIONS_PATH, crawl_state)
+    return {
+        **writer.report(),
+        "mode": "full" if full_ingest else "delta",
+        "committed": committed,
         "documents": len(docs),
-        "chunks": len(records),
+        "chunks": writer.chunks,
+        "changes": {
+            "added": sum(len(diff["added"]) for diff in diffs),
+            "changed": sum(len(diff["changed"]) for diff in diffs),
+            "removed": sum(len(diff["removed"]) for diff in diffs),
+        },
+        "crawled": refresh["crawled"],
+        "fresh": refresh["fresh"],
+        "failed_sources": refresh["failed"],
         "source": "crawled_regulations",
     }
 
 
+@app.post("/ingest-crawled")
+async def ingest_crawled(full: bool = False, wait: bool = False):
+    """
+    Re-crawl sources past their max age and push only what changed since the last crawl.
+
+    The first run (no crawl state yet) and ``?full=true`` re-crawl everything and
+    ingest the whole corpus with per-source reconcile instead. Runs as a background
+    job unless ``?wait=true``.
+    """
+    if wait:
+        return await run_job("ingest-crawled", lambda job: run_ingest_crawled(full, job))
+    return submit_job("ingest-crawled", lambda job: run_ingest_crawled(full, job))
+
+
+def is_degraded_answer(query: str, docs: List[Dict[str, Any]], answer: str) -> bool:
+    """True when an LLM is configured but generation fell back to the retrieval-only answer."""
+    return bool(OPENAI_API_KEY or HF_API_TOKEN) and answer == fallback_answer(query, docs)
+
+
 @app.post("/chat")
-async def chat(req: ChatRequest):
+async def chat(req: ChatRequest, response: Response):
     query = req.query.strip()
     if not query:
         raise HTTPException(status_code=400, detail="query is required")
 
-    initial_state: RagState = {
-        "query": query,
-        "limit": req.limit,
-        "rewritten_query": "",
-        "retrieved_docs": [],
-        "answer": "",
-    }
+    cache_key = answer_cache.key(rewrite_query(query), req.limit)
+    cached = answer_cache.get(cache_key)
+    CACHE_LOOKUPS.inc(cache="answer", result="miss" if cached is None else "hit")
+    if cached is not None:
+        response.headers["X-Answer-Cache"] = "hit"
+        return {"query": query, **cached}
+
+    async def answer() -> Dict[str, Any]:
+        initial_state: RagState = {
+            "query": query,
+            "limit": req.limit,
+            "rewritten_query": "",
+            "retrieved_docs": [],
+            "answer": "",
+        }
+        try:
+            result = await rag_graph.ainvoke(initial_state)
+        except Exception as exc:
+            raise HTTPException(status_code=503, detail=f"RAG workflow failed: {exc}") from exc
+
+        payload = {
+            "rewritten_query": result["rewritten_query"],
+            "answer": result["answer"],
+            "context": result["retrieved_docs"],
+        }
+        if not is_degraded_answer(query, result["retrieved_docs"], result["answer"]):
+            answer_cache.put(cache_key, payload)
+        return payload
 
-    try:
-        result = rag_graph.invoke(initial_state)
-    except Exception as exc:
-        raise HTTPException(status_code=503, detail=f"RAG workflow failed: {exc}") from exc
+    # Identical questions arriving together (same cache key) share one retrieval + generation.
+    payload, shared = await chat_flight.run(cache_key, answer)
+    response.headers["X-Answer-Cache"] = "coalesced" if shared else "miss"
+    return {"query": query, **payload}
 
-    return {
-        "query": query,
-        "rewritten_query": result["rewritten_query"],
-        "answer": result["answer"],
-        "context": result["retrieved_docs"],
-    }
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/chat/stream")
+async def chat_stream(req: ChatRequest):
+    """
+    Server-Sent Events variant of /chat.
+
+    Emits ``context`` (retrieved documents) first, then ``token`` events as the
+    LLM produces them, and finally ``done`` with the full answer.
+    """
+    query = req.query.strip()
+    if not query:
+        raise HTTPException(status_code=400, detail="query is required")
+
+    rewritten_query = rewrite_query(query)
+    cache_key = answer_cache.key(rewritten_query, req.limit)
+    cached = answer_cache.get(cache_key)
+    CACHE_LOOKUPS.inc(cache="answer", result="miss" if cached is None else "hit")
+
+    async def events():
+        if cached is not None:
+            yield sse_event(
+                "context",
+                {
+                    "query": query,
+                    "rewritten_query": cached["rewritten_query"],
+                    "context": cached["context"],
+                    "cached": True,
+                },
+            )
+            yield sse_event("token", {"text": cached["answer"]})
+            yield sse_event("done", {"answer": cached["answer"]})
+            return
+
+        try:
+            with timed(RAG_NODE_SECONDS, "retrieve", node="retrieve"):
+                docs, _ = await retrieval_flight.run(
+                    cache_key, lambda: retrieve_documents(rewritten_query, req.limit)
+                )
+        except Exception as exc:
+            yield sse_event("error", {"status": 503, "detail": f"RAG workflow failed: {exc}"})
+            return
+
+        yield sse_event(
+            "context",
+            {"query": query, "rewritten_query": rewritten_query, "context": docs, "cached": False},
+        )
+        parts: List[str] = []
+        started = time.perf_counter()
+        async for delta in stream_answer(query, docs):
+            parts.append(delta)
+            yield sse_event("token", {"text": delta})
+        RAG_NODE_SECONDS.observe(time.perf_counter() - started, node="generate")
+
+        answer = "".join(parts).strip()
+        if not is_degraded_answer(query, docs, answer):
+            answer_cache.put(cache_key, {"rewritten_query": rewritten_query, "answer": answer, "context": docs})
+        yield sse_event("done", {"answer": answer})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+registry.register(
+    GaugeFunc(
+        "rag_segmentation_in_flight",
+        "Cutouts queued or running in the segmentation pool.",
+        lambda: segmentation_pool.status()["in_flight"],
+    )
+)
+registry.register(
+    GaugeFunc(
+        "rag_segmentation_capacity",
+        "Cutouts the segmentation pool accepts before answering 429.",
+        lambda: segmentation_pool.status()["capacity"],
+    )
+)
+registry.register(
+    GaugeFunc(
+        "rag_jobs",
+        "Ingestion jobs by status.",
+        lambda: {(state,): job_runner.status()[state] for state in ("queued", "running")},
+        ("status",),
+    )
+)
+registry.register(
+    GaugeFunc("rag_weaviate_batch_size", "Current adaptive Weaviate batch size.", lambda: weaviate_batch_size.current)
+)
+
+
+@app.get("/metrics")
+async def metrics() -> Response:
+    return Response(registry.render(), media_type="text/plain; version=0.0.4")
 
 
 @app.get("/health")
@@ -558,7 +1639,7 @@ async def health():
     collection_exists = False
 
     try:
-        ready = weaviate_request("GET", "/v1/.well-known/ready")
+        ready = await weaviate_request("GET", "/v1/.well-known/ready")
         # Some Weaviate builds return an empty body with 200 for readiness.
         ready_text = ready.text.strip().lower()
         weaviate_ready = ready.status_code == 200 and (ready_text in ("", "true"))
@@ -566,7 +1647,7 @@ async def health():
         weaviate_error = str(exc)
 
     try:
-        schema = weaviate_request("GET", f"/v1/schema/{COLLECTION_NAME}")
+        schema = await weaviate_request("GET", f"/v1/schema/{COLLECTION_NAME}")
         collection_exists = schema.status_code == 200
     except Exception as exc:
         if not weaviate_error:
@@ -580,17 +1661,68 @@ async def health():
         "collection_exists": collection_exists,
         "weaviate_ready": weaviate_ready,
         "weaviate_error": weaviate_error,
+        "schema_cache": collection_state.status(),
+        "batch_size": weaviate_batch_size.status(),
+        "answer_cache": answer_cache.status(),
+        "retriever": RETRIEVER,
+        "local_index": local_index.status(),
+        "crawl_state": crawl_state.status(),
+        "jobs": job_runner.status(),
+        "llm": llm_router.status(),
+        "embeddings": embedding_model.status(),
+        "segmentation": segmentation_pool.status(),
+        "cutout_cache": cutout_cache.status(),
+        "single_flight": {
+            flight.name: flight.status()
+            for flight in (chat_flight, retrieval_flight, cutout_fetch_flight, segmentation_flight)
+        },
     }
 
 
-def fetch_image_bytes(url: str) -> bytes:
-    response = requests.get(url, timeout=REQUEST_TIMEOUT)
-    if response.status_code >= 400:
-        raise HTTPException(status_code=400, detail=f"Failed to fetch image: HTTP {response.status_code}")
-    content_type = response.headers.get("content-type", "")
-    if not content_type.startswith("image/"):
-        raise HTTPException(status_code=400, detail="URL did not return an image")
-    return response.content
+async def fetch_image_bytes(
+    url: str,
+    validators: Optional[Dict[str, str]] = None,
+) -> Tuple[Optional[bytes], Dict[str, str]]:
+    """
+    Stream an image over the shared pool, enforcing content type and size.
+
+    Returns ``(body, validators)``; ``body`` is None when ``validators`` were sent
+    and the origin replied 304 Not Modified.
+    """
+    headers: Dict[str, str] = {}
+    if validators and validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators and validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+
+    client = http_clients.get("images", timeout=REQUEST_TIMEOUT, follow_redirects=True)
+    try:
+        async with client.stream("GET", url, headers=headers) as response:
+            if response.status_code == 304 and headers:
+                return None, {
+                    "etag": response.headers.get("etag", validators.get("etag", "")),
+                    "last_modified": response.headers.get("last-modified", validators.get("last_modified", "")),
+                }
+            if response.status_code >= 400:
+                raise HTTPException(status_code=400, detail=f"Failed to fetch image: HTTP {response.status_code}")
+            content_type = response.headers.get("content-type", "")
+            if not content_type.startswith("image/"):
+                raise HTTPException(status_code=400, detail="URL did not return an image")
+            declared = response.headers.get("content-length", "")
+            if declared.isdigit() and int(declared) > CUTOUT_MAX_IMAGE_BYTES:
+                raise HTTPException(status_code=413, detail="Image exceeds the size limit")
+
+            body = bytearray()
+            async for chunk in response.aiter_bytes():
+                body.extend(chunk)
+                if len(body) > CUTOUT_MAX_IMAGE_BYTES:
+                    raise HTTPException(status_code=413, detail="Image exceeds the size limit")
+            return bytes(body), {
+                "etag": response.headers.get("etag", ""),
+                "last_modified": response.headers.get("last-modified", ""),
+            }
+    except httpx.HTTPError as exc:
+        raise HTTPException(status_code=400, detail=f"Failed to fetch image: {exc}") from exc
 
 
 def decode_base64_image(data: str) -> bytes:
@@ -601,68 +1733,242 @@ def decode_base64_image(data: str) -> bytes:
         raise HTTPException(status_code=400, detail=f"Invalid base64 image: {exc}")
 
 
-def remove_background_and_face(image_bytes: bytes) -> tuple[Any, int]:
-    # Lazy import so the API can boot quickly even if segmentation deps are heavy.
-    try:
-        import numpy as np
-        from PIL import Image
-        from rembg import remove
-    except Exception as exc:  # pragma: no cover
-        raise HTTPException(status_code=503, detail=f"Segmentation dependencies unavailable: {exc}") from exc
+def encode_data_url(image_bytes: bytes, media_type: str) -> str:
+    with timed(SEGMENTATION_STAGE_SECONDS, "seg_base64", stage="base64"):
+        return f"data:{media_type};base64,{base64.b64encode(image_bytes).decode('ascii')}"
 
-    # Background removal via U2Net (rembg)
-    cutout_bytes = remove(image_bytes)
-    cutout = Image.open(io.BytesIO(cutout_bytes)).convert("RGBA")
 
-    # Optional face removal using MediaPipe Face Detection (lightweight, CPU)
+def accepted_media_types(accept: Optional[str]) -> List[str]:
+    return [part.split(";")[0].strip().lower() for part in (accept or "").split(",") if part.strip()]
+
+
+def wants_binary_cutout(accept: Optional[str]) -> bool:
+    """Raw image bytes when the client asks for an image and not for JSON."""
+    media_types = accepted_media_types(accept)
+    return "application/json" not in media_types and any(value.startswith("image/") for value in media_types)
+
+
+def cutout_options_for(req: ClothCutoutRequest, accept: Optional[str] = None) -> CutoutOptions:
+    supported = supported_cutout_formats()
+    image_format = (req.format or "").strip().lower()
+    if not image_format:
+        media_types = accepted_media_types(accept)
+        image_format = next(
+            (name for name in supported if CUTOUT_MEDIA_TYPES[name] in media_types),
+            "png",
+        )
+    if image_format not in supported:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported cutout format '{image_format}', expected one of: {', '.join(supported)}",
+        )
+    return {
+        "format": image_format,
+        "quality": req.quality if image_format != "png" else None,
+        "max_dimension": req.maxDimension,
+        "crop": req.crop,
+    }
+
+
+def etag_for(key: str) -> str:
+    return f'"{key}"'
+
+
+def etag_matches(if_none_match: Optional[str], key: str) -> bool:
+    if not if_none_match or not key:
+        return False
+    candidates = [value.strip() for value in if_none_match.split(",")]
+    return "*" in candidates or any(
+        value.removeprefix("W/") == etag_for(key) for value in candidates
+    )
+
+
+def not_modified(key: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag_for(key), "X-Cutout-Cache": "hit"})
+
+
+cutout_fetch_flight = SingleFlight("cutout_fetch")
+segmentation_flight = SingleFlight("segmentation")
+
+
+async def segment_with_backpressure(image_bytes: bytes, options: CutoutOptions) -> CutoutEntry:
+    retry_headers = {"Retry-After": str(SEGMENTATION_RETRY_AFTER)}
+    started = time.perf_counter()
     try:
-        import mediapipe as mp
-
-        mp_face = mp.solutions.face_detection.FaceDetection(model_selection=0, min_detection_confidence=0.5)
-        np_img = np.array(cutout.convert("RGB"))
-        results = mp_face.process(np_img)
-        if results.detections:
-            w, h = cutout.size
-            alpha = np.array(cutout.getchannel("A"))
-            for det in results.detections:
-                box = det.location_data.relative_bounding_box
-                x_min = int(max(0, box.xmin) * w)
-                y_min = int(max(0, box.ymin) * h)
-                x_max = int(min(1, box.xmin + box.width) * w)
-                y_max = int(min(1, box.ymin + box.height) * h)
-                alpha[y_min:y_max, x_min:x_max] = 0
-            cutout.putalpha(Image.fromarray(alpha))
-    except Exception:
-        # If face detection fails, proceed with background-only cutout.
-        pass
-
-    alpha = np.array(cutout.getchannel("A"))
-    visible = int(np.count_nonzero(alpha > 0))
-    return cutout, visible
-
-
-def encode_png_base64(image: Any) -> str:
-    buffer = io.BytesIO()
-    image.save(buffer, format="PNG")
-    return base64.b64encode(buffer.getvalue()).decode("ascii")
+        image_bytes, visible, stages = await segmentation_pool.run(segment_cutout_timed, image_bytes, options)
+    except SegmentationBusy as exc:
+        raise HTTPException(status_code=429, detail=str(exc), headers=retry_headers) from exc
+    except SegmentationTimeout as exc:
+        raise HTTPException(status_code=503, detail=str(exc), headers=retry_headers) from exc
+    except SegmentationUnavailable as exc:
+        raise HTTPException(status_code=503, detail=str(exc), headers=retry_headers) from exc
+    # Whatever the worker did not account for was spent waiting for a slot or crossing the process boundary.
+    stages["queue"] = max(0.0, time.perf_counter() - started - sum(stages.values()))
+    for stage, seconds in stages.items():
+        SEGMENTATION_STAGE_SECONDS.observe(seconds, stage=stage)
+        record_timing(f"seg_{stage}", seconds)
+    return image_bytes, visible
+
+
+async def cached_url_record(image_url: str, variant: str) -> Optional[Dict[str, Any]]:
+    record = cutout_cache.url_record(image_url, variant, disk=False)
+    return record if record is not None else await run_in_threadpool(cutout_cache.url_record, image_url, variant)
+
+
+async def cached_cutout(key: str) -> Optional[CutoutEntry]:
+    """Memory tier on the loop; the disk tier (multi-MB reads plus an mtime bump) in a worker thread."""
+    entry = cutout_cache.get_memory(key)
+    return entry if entry is not None else await run_in_threadpool(cutout_cache.get_disk, key)
+
+
+async def resolve_cutout(
+    image_url: str,
+    image_b64: str,
+    options: CutoutOptions,
+    if_none_match: Optional[str] = None,
+) -> Tuple[str, Optional[CutoutEntry], str]:
+    """
+    Return ``(cache_key, entry, cache_status)`` for one cutout request.
+
+    ``entry`` is None when the caller's ``If-None-Match`` already matches.
+    """
+    if not image_url and not image_b64:
+        raise HTTPException(status_code=400, detail="imageUrl or imageBase64 is required")
+
+    variant = f"{SEGMENTATION_VARIANT}|{cutout_options_tag(options)}"
+
+    # Fast path: a catalog URL we have already cut out needs neither a fetch nor a hash.
+    url_record = await cached_url_record(image_url, variant) if not image_b64 else None
+    url_key = url_record["key"] if url_record and url_record["fresh"] else None
+    if url_key and etag_matches(if_none_match, url_key):
+        return url_key, None, "hit"
+
+    entry = await cached_cutout(url_key) if url_key else None
+    if entry is not None:
+        return url_key or "", entry, "hit"
+
+    if image_b64:
+        image_bytes = decode_base64_image(image_b64)
+        validators: Dict[str, str] = {}
+    else:
+        # A stale URL whose cutout is still cached is revalidated with a conditional GET.
+        stale_entry = await cached_cutout(url_record["key"]) if url_record and not url_record["fresh"] else None
+        fetch_key = f"{image_url}|{url_record['key'] if stale_entry else ''}"
+        (fetched, validators), _ = await cutout_fetch_flight.run(
+            fetch_key, lambda: fetch_image_bytes(image_url, url_record if stale_entry else None)
+        )
+        if fetched is None:
+            stale_key = url_record["key"]
+            await run_in_threadpool(cutout_cache.revalidate_url, image_url, stale_key, variant, **validators)
+            if etag_matches(if_none_match, stale_key):
+                return stale_key, None, "hit"
+            return stale_key, stale_entry, "revalidated"
+        image_bytes = fetched
+    key = await run_in_threadpool(cutout_cache.content_key, image_bytes, variant)
+    if not image_b64:
+        await run_in_threadpool(cutout_cache.remember_url, image_url, key, variant, **validators)
+    if etag_matches(if_none_match, key):
+        return key, None, "hit"
+
+    entry = await cached_cutout(key)
+    if entry is not None:
+        return key, entry, "hit"
+
+    async def segment() -> CutoutEntry:
+        segmented = await segment_with_backpressure(image_bytes, options)
+        await run_in_threadpool(cutout_cache.put, key, segmented)
+        return segmented
+
+    # Concurrent requests for the same image and variant wait for one segmentation instead of queueing their own.
+    entry, shared = await segmentation_flight.run(key, segment)
+    return key, entry, "coalesced" if shared else "miss"
 
 
 @app.post("/segment/cloth-only")
-async def cloth_only(req: ClothCutoutRequest):
+async def cloth_only(
+    req: ClothCutoutRequest,
+    accept: Optional[str] = Header(default=None),
+    if_none_match: Optional[str] = Header(default=None),
+):
     image_url = (req.imageUrl or "").strip()
     image_b64 = (req.imageBase64 or "").strip()
+    options = cutout_options_for(req, accept)
 
-    if not image_url and not image_b64:
-        raise HTTPException(status_code=400, detail="imageUrl or imageBase64 is required")
+    key, entry, cache_status = await resolve_cutout(image_url, image_b64, options, if_none_match)
+    CACHE_LOOKUPS.inc(cache="cutout", result=cache_status)
+    if entry is None:
+        return not_modified(key)
 
-    image_bytes = decode_base64_image(image_b64) if image_b64 else fetch_image_bytes(image_url)
-
-    cutout, visible = remove_background_and_face(image_bytes)
-    if visible < 2000:
+    image_bytes, visible = entry
+    if visible < MIN_VISIBLE_PIXELS:
         raise HTTPException(status_code=422, detail="Segmentation too small or empty")
 
-    b64_png = encode_png_base64(cutout)
-    return {
-        "cutout": f"data:image/png;base64,{b64_png}",
-        "visible_pixels": visible,
+    media_type = CUTOUT_MEDIA_TYPES[options["format"]]
+    headers = {
+        "ETag": etag_for(key),
+        "Cache-Control": "no-cache",
+        "Vary": "Accept",
+        "X-Cutout-Cache": cache_status,
     }
+    if wants_binary_cutout(accept):
+        # Skip base64 + JSON entirely: the encoded image goes out as the response body.
+        headers["X-Visible-Pixels"] = str(visible)
+        return Response(content=image_bytes, media_type=media_type, headers=headers)
+
+    return JSONResponse(
+        {
+            "cutout": encode_data_url(image_bytes, media_type),
+            "visible_pixels": visible,
+        },
+        headers=headers,
+    )
+
+
+@app.post("/segment/cloth-only/batch")
+async def cloth_only_batch(req: ClothCutoutBatchRequest):
+    """Stream one NDJSON line per item as soon as its cutout is ready (in completion order)."""
+    semaphore = asyncio.Semaphore(CUTOUT_BATCH_CONCURRENCY)
+
+    async def run_item(index: int, item: ClothCutoutRequest) -> Dict[str, Any]:
+        image_url = (item.imageUrl or "").strip()
+        image_b64 = (item.imageBase64 or "").strip()
+        row: Dict[str, Any] = {"index": index, "imageUrl": image_url}
+        try:
+            options = cutout_options_for(item)
+            async with semaphore:
+                key, entry, cache_status = await resolve_cutout(image_url, image_b64, options)
+            CACHE_LOOKUPS.inc(cache="cutout", result=cache_status)
+        except HTTPException as exc:
+            row.update({"status": exc.status_code, "error": exc.detail})
+            return row
+        except Exception as exc:
+            row.update({"status": 500, "error": f"Segmentation failed: {exc}"})
+            return row
+
+        image_bytes, visible = entry
+        if visible < MIN_VISIBLE_PIXELS:
+            row.update({"status": 422, "error": "Segmentation too small or empty", "visible_pixels": visible})
+            return row
+
+        row.update(
+            {
+                "status": 200,
+                "cutout": encode_data_url(image_bytes, CUTOUT_MEDIA_TYPES[options["format"]]),
+                "visible_pixels": visible,
+                "etag": etag_for(key),
+                "cache": cache_status,
+            }
+        )
+        return row
+
+    async def stream():
+        tasks = [asyncio.create_task(run_item(index, item)) for index, item in enumerate(req.items)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                row = await next_done
+                yield json.dumps(row) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
@@ -0,0 +1,266 @@
+from __future__ import annotations
+
+import math
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, TypeVar, Union
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").strip().lower() in ("1", "true", "yes", "on")
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING", "false").strip().lower() in ("1", "true", "yes", "on")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+R = TypeVar("R")
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Metric(ABC):
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    @abstractmethod
+    def samples(self) -> List[str]:
+        """Exposition lines for this metric, without the HELP and TYPE header."""
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: non-cumulative bucket counts (+Inf last), sum, count.
+        self._series: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        index = len(self.buckets)
+        for position, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = position
+                break
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = ([0] * (len(self.buckets) + 1), [0.0])
+                self._series[key] = series
+            series[0][index] += 1
+            series[1][0] += value
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, (list(counts), total[0])) for key, (counts, total) in self._series.items())
+        lines: List[str] = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class GaugeFunc(Metric):
+    """Gauge read at scrape time, e.g. queue depths that already live on component objects."""
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        read: Callable[[], Union[float, Dict[LabelValues, float]]],
+        labelnames: Sequence[str] = (),
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.read = read
+
+    def samples(self) -> List[str]:
+        try:
+            value = self.read()
+        except Exception as exc:
+            print(f"Metric {self.name} unavailable: {exc}")
+            return []
+        items = value.items() if isinstance(value, dict) else [((), value)]
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(val)}" for key, val in items]
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Any:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+registry = Registry()
+
+HTTP_REQUEST_SECONDS: Histogram = registry.register(
+    Histogram("rag_http_request_duration_seconds", "HTTP request latency by route.", ("method", "route", "status"))
+)
+RAG_NODE_SECONDS: Histogram = registry.register(
+    Histogram("rag_graph_node_duration_seconds", "LangGraph node latency (rewrite, retrieve, generate).", ("node",))
+)
+SEGMENTATION_STAGE_SECONDS: Histogram = registry.register(
+    Histogram(
+        "rag_segmentation_stage_duration_seconds",
+        "Cutout pipeline stage latency (queue, decode, rembg, face_detect, composite, encode, base64).",
+        ("stage",),
+    )
+)
+WEAVIATE_REQUEST_SECONDS: Histogram = registry.register(
+    Histogram(
+        "rag_weaviate_request_duration_seconds",
+        "Weaviate HTTP calls by operation and status.",
+        ("operation", "status"),
+    )
+)
+LLM_REQUEST_SECONDS: Histogram = registry.register(
+    Histogram(
+        "rag_llm_request_duration_seconds",
+        "Chat-completion calls by provider, model and status.",
+        ("provider", "model", "status"),
+    )
+)
+
+LLM_ROUTER_EVENTS: Counter = registry.register(
+    Counter(
+        "rag_llm_router_events_total",
+        "LLM routing events (hedged, hedge_won, failover, skipped_open, deadline_exceeded).",
+        ("event",),
+    )
+)
+COALESCED_REQUESTS: Counter = registry.register(
+    Counter(
+        "rag_single_flight_requests_total",
+        "Requests that started a computation (leader) or joined one already in flight (follower).",
+        ("flight", "role"),
+    )
+)
+CACHE_LOOKUPS: Counter = registry.register(
+    Counter("rag_cache_lookups_total", "Answer and cutout cache lookups by result.", ("cache", "result"))
+)
+
+
+# Server-Timing -----------------------------------------------------------
+
+_request_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_timings", default=None)
+
+
+def start_request_timing() -> Token:
+    return _request_timings.set([])
+
+
+def finish_request_timing(token: Token) -> List[Tuple[str, float]]:
+    timings = _request_timings.get() or []
+    _request_timings.reset(token)
+    return timings
+
+
+def record_timing(name: str, seconds: float) -> None:
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((name, seconds))
+
+
+def server_timing_header(timings: List[Tuple[str, float]]) -> str:
+    """Sum repeated stages (e.g. several Weaviate calls) and format them as ``name;dur=<ms>``."""
+    totals: Dict[str, float] = {}
+    for name, seconds in timings:
+        totals[name] = totals.get(name, 0.0) + seconds
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in totals.items())
+
+
+@contextmanager
+def timed(histogram: Histogram, timing: str, **labels: Any) -> Iterator[None]:
+    """Observe the block's wall time in ``histogram`` and add it to the request's Server-Timing."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        histogram.observe(elapsed, **labels)
+        record_timing(timing, elapsed)
+
+
+async def observe_response(histogram: Histogram, timing: str, call: Awaitable[R], **labels: Any) -> R:
+    """Await an HTTP call and observe it labelled with its status code (``error`` when it raised)."""
+    started = time.perf_counter()
+    status = "error"
+    try:
+        response = await call
+        status = str(getattr(response, "status_code", "ok"))
+        return response
+    finally:
+        elapsed = time.perf_counter() - started
+        histogram.observe(elapsed, status=status, **labels)
+        record_timing(timing, elapsed)
@@ -0,0 +1,462 @@
+from __future__ import annotations
+
+import asyncio
+import functools
+import io
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from typing_extensions import TypedDict
+
+REMBG_MODEL = os.getenv("REMBG_MODEL", "u2net")
+FACE_MIN_CONFIDENCE = float(os.getenv("FACE_MIN_CONFIDENCE", "0.5"))
+SEGMENTATION_WARMUP = os.getenv("SEGMENTATION_WARMUP", "true").strip().lower() in ("1", "true", "yes", "on")
+SEGMENTATION_EXECUTOR = os.getenv("SEGMENTATION_EXECUTOR", "process").strip().lower()
+SEGMENTATION_WORKERS = max(1, int(os.getenv("SEGMENTATION_WORKERS", str(min(2, os.cpu_count() or 1)))))
+SEGMENTATION_QUEUE_SIZE = max(0, int(os.getenv("SEGMENTATION_QUEUE_SIZE", "8")))
+SEGMENTATION_DEADLINE = float(os.getenv("SEGMENTATION_DEADLINE", "30"))
+SEGMENTATION_RETRY_AFTER = max(1, int(os.getenv("SEGMENTATION_RETRY_AFTER", "2")))
+# Longest side of the shared image both models run on; 0 segments at full resolution.
+SEGMENTATION_WORKING_RESOLUTION = max(0, int(os.getenv("SEGMENTATION_WORKING_RESOLUTION", "1024")))
+MIN_VISIBLE_PIXELS = 2000
+
+# Identifies the model settings that shape a cutout; part of every cache key.
+SEGMENTATION_VARIANT = (
+    f"{REMBG_MODEL}:face={FACE_MIN_CONFIDENCE:g}:work={SEGMENTATION_WORKING_RESOLUTION}"
+)
+
+CUTOUT_MEDIA_TYPES = {"png": "image/png", "webp": "image/webp", "avif": "image/avif"}
+
+
+class CutoutOptions(TypedDict):
+    format: str
+    quality: Optional[int]
+    max_dimension: Optional[int]
+    crop: bool
+
+
+DEFAULT_CUTOUT_OPTIONS: CutoutOptions = {"format": "png", "quality": None, "max_dimension": None, "crop": False}
+
+
+class SegmentationUnavailable(RuntimeError):
+    """Raised when the heavy segmentation dependencies cannot be loaded."""
+
+
+class SegmentationBusy(RuntimeError):
+    """Raised when the worker pool queue is full and the request is rejected."""
+
+
+class SegmentationTimeout(RuntimeError):
+    """Raised when a cutout does not finish within the per-request deadline."""
+
+
+class ModelRegistry:
+    """
+    Owns the segmentation models so they are built once per process.
+
+    The rembg ONNX session is shared (onnxruntime sessions are safe to run
+    concurrently), while MediaPipe graphs are not, so each thread gets its own
+    face detector.
+    """
+
+    def __init__(self, rembg_model: str = REMBG_MODEL, face_confidence: float = FACE_MIN_CONFIDENCE) -> None:
+        self.rembg_model = rembg_model
+        self.face_confidence = face_confidence
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._rembg_session: Any = None
+        self._face_detectors: List[Any] = []
+        self._face_unavailable = False
+        self.warmed = False
+        self.warm_error: Optional[str] = None
+
+    def rembg_session(self) -> Any:
+        if self._rembg_session is not None:
+            return self._rembg_session
+        with self._lock:
+            if self._rembg_session is None:
+                try:
+                    from rembg import new_session
+                except Exception as exc:  # pragma: no cover
+                    raise SegmentationUnavailable(f"Segmentation dependencies unavailable: {exc}") from exc
+                self._rembg_session = new_session(self.rembg_model)
+        return self._rembg_session
+
+    def face_detector(self) -> Optional[Any]:
+        if self._face_unavailable:
+            return None
+        detector = getattr(self._local, "face_detector", None)
+        if detector is not None:
+            return detector
+        try:
+            import mediapipe as mp
+
+            detector = mp.solutions.face_detection.FaceDetection(
+                model_selection=0,
+                min_detection_confidence=self.face_confidence,
+            )
+        except Exception as exc:
+            # Face removal is optional; remember the failure instead of retrying per request.
+            print(f"Face detector unavailable, continuing with background-only cutouts: {exc}")
+            self._face_unavailable = True
+            return None
+        self._local.face_detector = detector
+        with self._lock:
+            self._face_detectors.append(detector)
+        return detector
+
+    def warm(self) -> None:
+        """Build both models and push a tiny image through them so the first request is hot."""
+        try:
+            from PIL import Image
+
+            probe = Image.new("RGB", (64, 64), (255, 255, 255))
+            buffer = io.BytesIO()
+            probe.save(buffer, format="PNG")
+            remove_background_and_face(buffer.getvalue(), self)
+            self.warmed = True
+            self.warm_error = None
+        except Exception as exc:
+            self.warm_error = str(exc)
+            raise
+
+    def close(self) -> None:
+        with self._lock:
+            for detector in self._face_detectors:
+                try:
+                    detector.close()
+                except Exception:
+                    pass
+            self._face_detectors = []
+            self._rembg_session = None
+            self._local = threading.local()
+            self.warmed = False
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "rembg_model": self.rembg_model,
+            "rembg_loaded": self._rembg_session is not None,
+            "face_detector_available": not self._face_unavailable,
+            "warmed": self.warmed,
+            "warm_error": self.warm_error,
+        }
+
+
+model_registry = ModelRegistry()
+
+
+class StageTimer:
+    """Accumulates wall time per pipeline stage inside a worker; returned to the parent with the result."""
+
+    def __init__(self) -> None:
+        self.stages: Dict[str, float] = {}
+        self._mark = time.perf_counter()
+
+    def lap(self, stage: str) -> None:
+        now = time.perf_counter()
+        self.stages[stage] = self.stages.get(stage, 0.0) + now - self._mark
+        self._mark = now
+
+
+def remove_background_and_face(
+    image_bytes: bytes,
+    models: Optional[ModelRegistry] = None,
+    working_resolution: Optional[int] = None,
+    timer: Optional[StageTimer] = None,
+) -> Tuple[Any, int]:
+    """
+    Cut the garment out of ``image_bytes`` and blank any detected faces.
+
+    The image is decoded once. When its longest side exceeds the working
+    resolution, rembg and MediaPipe both run on a shared downscaled copy and
+    only the resulting alpha mask is upsampled back onto the original pixels.
+    """
+    timer = timer or StageTimer()
+    models = models or model_registry
+    if working_resolution is None:
+        working_resolution = SEGMENTATION_WORKING_RESOLUTION
+
+    # Lazy import so the API can boot quickly even if segmentation deps are heavy.
+    try:
+        import numpy as np
+        from PIL import Image, ImageOps
+        from rembg import remove
+    except Exception as exc:  # pragma: no cover
+        raise SegmentationUnavailable(f"Segmentation dependencies unavailable: {exc}") from exc
+
+    original = ImageOps.exif_transpose(Image.open(io.BytesIO(image_bytes))).convert("RGBA")
+    working = original
+    if working_resolution and max(original.size) > working_resolution:
+        working = original.copy()
+        working.thumbnail((working_resolution, working_resolution), Image.BILINEAR)
+    timer.lap("decode")
+
+    # Background removal via U2Net (rembg), reusing the registry's ONNX session.
+    working_mask = remove(working, session=models.rembg_session(), only_mask=True).convert("L")
+    transparent = Image.new("RGBA", working.size, (0, 0, 0, 0))
+    working_cutout = Image.composite(working, transparent, working_mask)
+    timer.lap("rembg")
+
+    # Optional face removal using MediaPipe Face Detection (lightweight, CPU)
+    face_boxes: List[Tuple[float, float, float, float]] = []
+    try:
+        detector = models.face_detector()
+        if detector is not None:
+            results = detector.process(np.array(working_cutout.convert("RGB")))
+            for det in results.detections or []:
+                box = det.location_data.relative_bounding_box
+                face_boxes.append(
+                    (max(0, box.xmin), max(0, box.ymin), min(1, box.xmin + box.width), min(1, box.ymin + box.height))
+                )
+    except Exception:
+        # If face detection fails, proceed with background-only cutout.
+        pass
+    timer.lap("face_detect")
+
+    if working is original:
+        mask = working_mask
+    else:
+        mask = working_mask.resize(original.size, Image.BICUBIC)
+        # Bicubic upsampling rings slightly around edges; snap near-empty/near-full values.
+        mask = mask.point(lambda value: 0 if value < 8 else 255 if value > 247 else value)
+
+    alpha = np.array(mask)
+    w, h = original.size
+    for x0, y0, x1, y1 in face_boxes:
+        alpha[int(y0 * h) : int(y1 * h), int(x0 * w) : int(x1 * w)] = 0
+
+    cutout = Image.composite(original, Image.new("RGBA", original.size, (0, 0, 0, 0)), Image.fromarray(alpha))
+    visible = int(np.count_nonzero(alpha > 0))
+    timer.lap("composite")
+    return cutout, visible
+
+
+def encode_png(image: Any) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+@functools.lru_cache(maxsize=1)
+def supported_cutout_formats() -> List[str]:
+    """PNG and WebP ship with Pillow; AVIF needs a Pillow build (or plugin) with an AVIF encoder."""
+    formats = ["png", "webp"]
+    try:
+        from PIL import Image
+
+        if ".avif" in Image.registered_extensions():
+            formats.append("avif")
+    except Exception:  # pragma: no cover
+        pass
+    return formats
+
+
+def cutout_options_tag(options: CutoutOptions) -> str:
+    """Stable string for the output settings, used to keep cache entries per variant apart."""
+    return "fmt={format}:q={quality}:max={max_dimension}:crop={crop}".format(
+        format=options["format"],
+        quality=options["quality"] if options["quality"] is not None else "lossless",
+        max_dimension=options["max_dimension"] or 0,
+        crop=int(bool(options["crop"])),
+    )
+
+
+def shape_cutout(image: Any, options: CutoutOptions) -> Any:
+    """Crop to the alpha bounding box and/or downscale before encoding."""
+    from PIL import Image
+
+    if options["crop"]:
+        bbox = image.getchannel("A").getbbox()
+        if bbox:
+            image = image.crop(bbox)
+    max_dimension = options["max_dimension"]
+    if max_dimension and max(image.size) > max_dimension:
+        image = image.copy()
+        image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+    return image
+
+
+def encode_cutout(image: Any, options: CutoutOptions) -> bytes:
+    image_format = options["format"]
+    if image_format == "png":
+        return encode_png(image)
+
+    buffer = io.BytesIO()
+    quality = options["quality"]
+    if image_format == "webp":
+        if quality is None:
+            image.save(buffer, format="WEBP", lossless=True)
+        else:
+            # exact=False lets the encoder discard RGB under fully transparent pixels.
+            image.save(buffer, format="WEBP", quality=quality, method=4, exact=False)
+    elif image_format == "avif":
+        image.save(buffer, format="AVIF", quality=quality if quality is not None else 90)
+    else:
+        raise ValueError(f"Unsupported cutout format: {image_format}")
+    return buffer.getvalue()
+
+
+def segment_cutout_timed(
+    image_bytes: bytes,
+    options: Optional[CutoutOptions] = None,
+) -> Tuple[bytes, int, Dict[str, float]]:
+    """
+    Worker entry point: cut out the garment, shape it and encode it in the same
+    process, returning the seconds spent in each stage for the parent's metrics.
+    """
+    options = options or DEFAULT_CUTOUT_OPTIONS
+    timer = StageTimer()
+    cutout, visible = remove_background_and_face(image_bytes, timer=timer)
+    if visible < MIN_VISIBLE_PIXELS:
+        return b"", visible, timer.stages
+    encoded = encode_cutout(shape_cutout(cutout, options), options)
+    timer.lap("encode")
+    return encoded, visible, timer.stages
+
+
+def warm_worker_models() -> None:
+    try:
+        model_registry.warm()
+    except Exception as exc:
+        print(f"Segmentation worker warmup failed: {exc}")
+
+
+def _worker_ready() -> bool:
+    return True
+
+
+class SegmentationPool:
+    """
+    Runs CPU-bound segmentation off the event loop.
+
+    Each worker (process or thread) warms its own models through the pool
+    initializer. At most ``workers + queue_size`` cutouts are accepted at once;
+    anything beyond that is rejected immediately so callers can retry later.
+    """
+
+    def __init__(
+        self,
+        kind: str = SEGMENTATION_EXECUTOR,
+        workers: int = SEGMENTATION_WORKERS,
+        queue_size: int = SEGMENTATION_QUEUE_SIZE,
+        deadline: float = SEGMENTATION_DEADLINE,
+        warm: bool = SEGMENTATION_WARMUP,
+    ) -> None:
+        self.kind = "thread" if kind == "thread" else "process"
+        self.workers = workers
+        self.queue_size = queue_size
+        self.deadline = deadline
+        self.warm = warm
+        self._lock = threading.Lock()
+        self._executor: Optional[Executor] = None
+        self._pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.crashes = 0
+
+    @property
+    def capacity(self) -> int:
+        return self.workers + self.queue_size
+
+    def _ensure_executor(self) -> Executor:
+        with self._lock:
+            if self._executor is None:
+                initializer = warm_worker_models if self.warm else None
+                if self.kind == "process":
+                    # spawn avoids forking a parent that may already hold onnxruntime threads.
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                        initializer=initializer,
+                    )
+                else:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.workers,
+                        thread_name_prefix="segmentation",
+                        initializer=initializer,
+                    )
+            return self._executor
+
+    def start(self) -> None:
+        """Spin up every worker now so warmup happens before the first request."""
+        executor = self._ensure_executor()
+        for _ in range(self.workers):
+            executor.submit(_worker_ready)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _reset_broken(self, executor: Executor) -> None:
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+                self.crashes += 1
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _release(self, future: Future) -> None:
+        with self._lock:
+            self._pending -= 1
+            if not future.cancelled() and future.exception() is None:
+                self.completed += 1
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        with self._lock:
+            if self._pending >= self.capacity:
+                self.rejected += 1
+                raise SegmentationBusy("Segmentation queue is full, retry shortly")
+            self._pending += 1
+
+        executor = self._ensure_executor()
+        try:
+            future = executor.submit(fn, *args)
+        except (BrokenProcessPool, RuntimeError) as exc:
+            with self._lock:
+                self._pending -= 1
+            self._reset_broken(executor)
+            raise SegmentationUnavailable(f"Segmentation workers unavailable: {exc}") from exc
+        future.add_done_callback(self._release)
+
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout=self.deadline)
+        except asyncio.TimeoutError as exc:
+            # Cancels the job if it is still queued; a running job finishes in the background.
+            future.cancel()
+            with self._lock:
+                self.timeouts += 1
+            raise SegmentationTimeout(f"Segmentation exceeded {self.deadline:g}s deadline") from exc
+        except BrokenProcessPool as exc:
+            self._reset_broken(executor)
+            raise SegmentationUnavailable(f"Segmentation worker crashed: {exc}") from exc
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            pending = self._pending
+            running = self._executor is not None
+        status: Dict[str, Any] = {
+            "executor": self.kind,
+            "running": running,
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "in_flight": pending,
+            "capacity": self.capacity,
+            "deadline_seconds": self.deadline,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "crashes": self.crashes,
+        }
+        if self.kind == "thread":
+            status["models"] = model_registry.status()
+        return status
+
+
+segmentation_pool = SegmentationPool()
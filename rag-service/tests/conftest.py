@@ -0,0 +1,54 @@
+import json
+import os
+import random
+import sys
+import tempfile
+from pathlib import Path
+
+import httpx
+import pytest
+
+SERVICE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(SERVICE_DIR))
+
+# main.py reads these at import time; keep test runs away from the service's own .cache.
+_STATE_DIR = tempfile.mkdtemp(prefix="rag-tests-")
+os.environ.setdefault("LOCAL_INDEX_PATH", os.path.join(_STATE_DIR, "bm25.idx"))
+os.environ.setdefault("CUTOUT_CACHE_DIR", os.path.join(_STATE_DIR, "cutouts"))
+os.environ.setdefault("CRAWL_STATE_PATH", os.path.join(_STATE_DIR, "crawl_state.json"))
+os.environ.setdefault("REGULATIONS_PATH", os.path.join(_STATE_DIR, "fashion_regulations.json"))
+
+
+class FlakyWeaviate:
+    """The benchmark's Weaviate stand-in, rejecting every batched object while ``failing`` is set."""
+
+    def __init__(self, collection):
+        from bench import FakeWeaviate, Latency
+
+        self.store = FakeWeaviate(collection, Latency(0, 0, random.Random(0)), [])
+        self.failing = False
+
+    @property
+    def objects(self):
+        return self.store.objects
+
+    async def handle(self, request):
+        if self.failing and request.url.path == "/v1/batch/objects" and request.method == "POST":
+            objects = json.loads(request.content)["objects"]
+            error = {"errors": {"error": [{"message": "shard is read-only"}]}}
+            return httpx.Response(200, json=[{"id": obj["id"], "result": error} for obj in objects])
+        return await self.store.handle(request)
+
+
+@pytest.fixture
+def weaviate(monkeypatch):
+    import main
+    import weaviate_batch
+    from http_clients import http_clients
+
+    monkeypatch.setattr(weaviate_batch, "WEAVIATE_BATCH_BACKOFF", 0.0)
+    fake = FlakyWeaviate(main.COLLECTION_NAME)
+    for name in ("weaviate", "weaviate-ingest"):
+        http_clients.override(name, httpx.AsyncClient(transport=httpx.MockTransport(fake.handle)))
+    main.collection_state.invalidate()
+    return fake
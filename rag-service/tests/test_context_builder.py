@@ -0,0 +1,37 @@
+import context_builder
+from context_builder import assemble_context, estimate_tokens
+
+
+def overlapping_chunks(count, size=1000, overlap=100):
+    """Consecutive chunks of one long page, each starting with the last ``overlap`` chars of the previous one."""
+    words = " ".join(f"w{n}" for n in range(count * size // 3))
+    step = size - overlap
+    return [words[start : start + size].strip() for start in range(0, step * count, step)]
+
+
+def test_best_chunk_survives_merging_with_low_scored_neighbours():
+    chunks = overlapping_chunks(9)
+    best = 7
+    chunks[best] = chunks[best][:450] + " ANSWER-TOKEN " + chunks[best][450:]
+    docs = [
+        {"text": text, "source": "page", "url": "https://example.eu/page", "score": 9.0 if n == best else 1.0 - n / 100}
+        for n, text in enumerate(chunks)
+    ]
+
+    entries = assemble_context(docs)
+
+    top = entries[0]
+    assert top["score"] == 9.0
+    assert chunks[best] in top["text"]
+    used = sum(estimate_tokens(entry["text"]) + context_builder.ENTRY_OVERHEAD_TOKENS for entry in entries)
+    assert used <= context_builder.CONTEXT_MAX_TOKENS
+
+
+def test_selected_neighbours_are_still_stitched_together():
+    chunks = overlapping_chunks(3)
+    docs = [{"text": text, "source": "page", "url": "", "score": 1.0} for text in chunks]
+
+    entries = assemble_context(docs)
+
+    assert len(entries) == 1
+    assert all(chunk in entries[0]["text"] for chunk in chunks)
@@ -0,0 +1,168 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import crawler
+from crawler import CrawlCache, Crawler, HostLimiter
+
+PAGE = "<html><body><p>Textile products must carry a label listing their full fibre composition.</p></body></html>"
+PARAGRAPHS = ["Textile products must carry a label listing their full fibre composition."]
+ETAG = '"v1"'
+LAST_MODIFIED = "Wed, 01 Oct 2025 08:00:00 GMT"
+
+
+class Site:
+    """What the stand-in server saw, and how it should answer."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = []
+        self.bodies_sent = 0
+        self.down = False
+        self.delay = 0.0
+        self.active = {}
+        self.peak = {}
+
+
+@pytest.fixture
+def site(monkeypatch):
+    state = Site()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            host = self.headers["Host"].split(":")[0]
+            with state.lock:
+                state.requests.append((self.path, dict(self.headers)))
+                state.active[host] = state.active.get(host, 0) + 1
+                state.peak[host] = max(state.peak.get(host, 0), state.active[host])
+            try:
+                time.sleep(state.delay)
+                self.respond()
+            finally:
+                with state.lock:
+                    state.active[host] -= 1
+
+        def respond(self):
+            if state.down:
+                self.send_response(500)
+                self.end_headers()
+                return
+            # /etag pages only send an ETag, /modified pages only Last-Modified.
+            if self.path.startswith("/etag") and self.headers.get("If-None-Match") == ETAG:
+                self.send_response(304)
+                self.end_headers()
+                return
+            if self.path.startswith("/modified") and self.headers.get("If-Modified-Since") == LAST_MODIFIED:
+                self.send_response(304)
+                self.end_headers()
+                return
+            body = PAGE.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html")
+            self.send_header("Content-Length", str(len(body)))
+            if self.path.startswith("/etag"):
+                self.send_header("ETag", ETAG)
+            if self.path.startswith("/modified"):
+                self.send_header("Last-Modified", LAST_MODIFIED)
+            self.end_headers()
+            self.wfile.write(body)
+            with state.lock:
+                state.bodies_sent += 1
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setenv("NO_PROXY", "127.0.0.1,localhost")
+    state.port = server.server_address[1]
+    yield state
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def parses(monkeypatch):
+    calls = []
+    parse = crawler.parse_regulations
+
+    def counting(html):
+        calls.append(len(html))
+        return parse(html)
+
+    monkeypatch.setattr(crawler, "parse_regulations", counting)
+    return calls
+
+
+def source(site, path, host="127.0.0.1"):
+    return {"name": path, "url": f"http://{host}:{site.port}{path}"}
+
+
+def new_crawler(tmp_path, **kwargs):
+    return Crawler(cache=CrawlCache(str(tmp_path / "crawl")), limiter=HostLimiter(delay=0), **kwargs)
+
+
+@pytest.mark.parametrize(
+    "path, header, value",
+    [("/etag", "If-None-Match", ETAG), ("/modified", "If-Modified-Since", LAST_MODIFIED)],
+)
+def test_not_modified_page_is_neither_downloaded_nor_parsed(site, parses, tmp_path, path, header, value):
+    pages = new_crawler(tmp_path)
+    try:
+        first = pages.crawl([source(site, path)])
+        second = pages.crawl([source(site, path)])
+    finally:
+        pages.close()
+
+    assert first[0]["status"] == "fetched" and first[0]["paragraphs"] == PARAGRAPHS
+    assert header not in site.requests[0][1]
+    assert site.requests[1][1][header] == value
+    assert second[0]["status"] == "not_modified" and second[0]["paragraphs"] == PARAGRAPHS
+    assert site.bodies_sent == 1
+    assert len(parses) == 1
+
+
+def test_disk_cache_is_reused_by_the_next_run(site, parses, tmp_path):
+    first_run = new_crawler(tmp_path)
+    try:
+        first_run.crawl([source(site, "/etag")])
+    finally:
+        first_run.close()
+
+    second_run = new_crawler(tmp_path)
+    try:
+        revalidated = second_run.crawl([source(site, "/etag")])
+        site.down = True
+        unreachable = second_run.crawl([source(site, "/etag")])
+    finally:
+        second_run.close()
+
+    assert site.requests[1][1]["If-None-Match"] == ETAG
+    assert revalidated[0]["status"] == "not_modified" and revalidated[0]["paragraphs"] == PARAGRAPHS
+    # A failed fetch still serves the copy the first run left on disk.
+    assert unreachable[0]["status"] == "stale" and unreachable[0]["paragraphs"] == PARAGRAPHS
+    assert site.bodies_sent == 1
+    assert len(parses) == 1
+
+
+def test_per_host_limit_caps_concurrent_requests_to_one_host(site, tmp_path):
+    site.delay = 0.2
+    sources = [source(site, f"/page-{n}") for n in range(6)] + [
+        source(site, f"/page-{n}", host="localhost") for n in range(6)
+    ]
+    pages = Crawler(
+        cache=CrawlCache(str(tmp_path / "crawl")),
+        limiter=HostLimiter(per_host=2, delay=0),
+        concurrency=12,
+    )
+    try:
+        results = pages.crawl(sources)
+    finally:
+        pages.close()
+
+    assert [result["status"] for result in results] == ["fetched"] * 12
+    # The pool could run all twelve at once; each host is still held to CRAWL_PER_HOST.
+    assert site.peak == {"127.0.0.1": 2, "localhost": 2}
@@ -0,0 +1,24 @@
+import numpy
+
+from embeddings import EmbeddingModel
+
+
+class RecordingModel:
+    def __init__(self):
+        self.seen = []
+
+    def encode(self, texts, **kwargs):
+        self.seen.extend(texts)
+        return numpy.zeros((len(texts), 2))
+
+
+def test_queries_and_chunks_are_normalized_the_same_way():
+    model = EmbeddingModel(model_path="stub")
+    model._model = RecordingModel()
+
+    model.embed_batch(["EU Textile  Regulation\n(2011)"])
+    model.embed_query("  EU Textile Regulation (2011) ")
+    model.embed_query("EU Textile Regulation  (2011)")
+
+    assert model._model.seen == ["EU Textile Regulation (2011)", "EU Textile Regulation (2011)"]
+    assert model.query_hits == 1
@@ -0,0 +1,46 @@
+import asyncio
+
+import numpy
+
+import embeddings
+import main
+from embeddings import EmbeddingModel
+
+
+class ConstantModel:
+    def encode(self, texts, **kwargs):
+        return numpy.ones((len(texts), 4))
+
+
+def ingest(text):
+    request = main.IngestRequest(docs=[main.IngestDoc(text=text, source="eu")])
+    return asyncio.run(main.run_ingest(request))
+
+
+def test_reingest_skips_unchanged_chunks(weaviate):
+    assert ingest("Labels must list fibre composition.")["ingested"] == 1
+    again = ingest("Labels must list fibre composition.")
+    assert again["ingested"] == 0 and again["skipped"] == 1
+
+
+def test_enabling_embeddings_backfills_chunks_stored_without_vectors(weaviate, monkeypatch):
+    assert ingest("Care labels are mandatory.")["ingested"] == 1
+    assert list(weaviate.store.vectors.values()) == [[]]
+
+    model = EmbeddingModel(model_path="stub")
+    model._model = ConstantModel()
+    monkeypatch.setattr(main, "embedding_model", model)
+    monkeypatch.setattr(embeddings, "embedding_model", model)
+
+    backfilled = ingest("Care labels are mandatory.")
+    assert backfilled["ingested"] == 1 and backfilled["skipped"] == 0
+    assert list(weaviate.store.vectors.values()) == [[1.0, 1.0, 1.0, 1.0]]
+    assert ingest("Care labels are mandatory.")["skipped"] == 1
+
+
+def test_missing_class_is_matched_on_the_whole_class_name(monkeypatch):
+    monkeypatch.setattr(main, "COLLECTION_NAME", "Doc")
+    assert main.is_missing_class_error('Cannot query field "Doc" on type "GetObjectsObj".')
+    assert main.is_missing_class_error("class Doc not found")
+    assert not main.is_missing_class_error("document 42 not found")
+    assert not main.is_missing_class_error("property docs.title not found")
@@ -0,0 +1,79 @@
+import asyncio
+import json
+
+import pytest
+from fastapi import HTTPException
+
+import crawler
+import main
+from crawl_state import CrawlState
+
+SOURCE = {"name": "Textile Labelling", "url": "https://example.eu/textiles", "category": "EU Regulation"}
+
+
+@pytest.fixture
+def crawl(monkeypatch, tmp_path):
+    """Serve ``pages["paragraphs"]`` as the only source and keep crawl state and regulations in ``tmp_path``."""
+    pages = {"paragraphs": []}
+
+    def fake_crawl(self, sources):
+        return [{"source": source, "status": "fetched", "paragraphs": list(pages["paragraphs"])} for source in sources]
+
+    state = CrawlState(str(tmp_path / "crawl_state.json"), max_age=0)
+    monkeypatch.setattr(crawler, "SOURCES", [SOURCE])
+    monkeypatch.setattr(crawler, "MIN_CRAWLED_REGULATIONS", 0)
+    monkeypatch.setattr(crawler.Crawler, "crawl", fake_crawl)
+    monkeypatch.setattr(main, "crawl_state", state)
+    monkeypatch.setattr(main, "REGULATIONS_PATH", str(tmp_path / "fashion_regulations.json"))
+    pages["state"] = state
+    return pages
+
+
+def regulations_file():
+    with open(main.REGULATIONS_PATH) as f:
+        return [row["content"] for row in json.load(f)]
+
+
+def test_failed_delta_is_sent_again_on_the_next_run(weaviate, crawl):
+    crawl["paragraphs"] = ["Labels must list fibre composition.", "Care symbols are optional."]
+    first = asyncio.run(main.run_ingest_crawled(False))
+    assert first["mode"] == "full" and first["committed"]
+    stored = set(weaviate.objects)
+
+    crawl["paragraphs"] = ["Labels must list fibre composition.", "Care symbols are mandatory from 2027."]
+    weaviate.failing = True
+    with pytest.raises(HTTPException) as failed:
+        asyncio.run(main.run_ingest_crawled(False))
+    assert failed.value.status_code == 502
+    assert set(weaviate.objects) == stored
+    # Neither the crawl state nor the regulations file moved on.
+    assert regulations_file() == ["Labels must list fibre composition.", "Care symbols are optional."]
+    assert [row["content"] for row in crawl["state"].regulations()] == regulations_file()
+
+    weaviate.failing = False
+    retried = asyncio.run(main.run_ingest_crawled(False))
+    assert retried["mode"] == "delta" and retried["committed"]
+    assert retried["changes"]["changed"] == 1
+    assert retried["ingested"] > 0 and retried["failed"] == 0
+    assert retried["failed_sources"] == []
+    assert any("mandatory" in obj["text"] for obj in weaviate.objects.values())
+    assert regulations_file() == crawl["paragraphs"]
+
+    settled = asyncio.run(main.run_ingest_crawled(False))
+    assert settled["changes"] == {"added": 0, "changed": 0, "removed": 0}
+
+
+def test_failed_initial_crawl_without_regulations_file_does_not_crawl_again(monkeypatch, tmp_path):
+    crawls = []
+
+    def failing_crawl(self, sources):
+        crawls.append(sources)
+        return [{"source": source, "status": "failed", "paragraphs": []} for source in sources]
+
+    monkeypatch.setattr(crawler.Crawler, "crawl", failing_crawl)
+    state = CrawlState(str(tmp_path / "crawl_state.json"), max_age=0)
+    refresh = crawler.refresh_regulations(str(tmp_path / "fashion_regulations.json"), state, [SOURCE])
+
+    assert len(crawls) == 1
+    assert refresh["initial"] and refresh["failed"] == [SOURCE["name"]]
+    assert refresh["regulations"] == crawler.FALLBACK_DATA
@@ -0,0 +1,46 @@
+import asyncio
+import tracemalloc
+
+import main
+from local_index import LocalIndex
+
+UPLOAD_RECORDS = 3000
+
+
+def record(prefix, n):
+    words = " ".join(f"w{(n * 7 + k) % 5000}" for k in range(20))
+    return {"id": f"{prefix}-{n}", "text": f"{prefix} {n} {words}", "source": prefix, "url": "", "category": "bench"}
+
+
+def upload_peak(monkeypatch, tmp_path, corpus_records):
+    """Python heap peak while streaming UPLOAD_RECORDS chunks into a local index that already holds a corpus."""
+    index = LocalIndex(str(tmp_path / f"corpus-{corpus_records}.idx"))
+    index.replace_records([record("corpus", n) for n in range(corpus_records)])
+    monkeypatch.setattr(main, "local_index", index)
+    monkeypatch.setattr(main, "RETRIEVER", "local")
+    monkeypatch.setattr(main, "LOCAL_INDEX_MAINTAINED", True)
+    monkeypatch.setattr("local_index.LOCAL_INDEX_SEGMENT_MAX_DOCS", 1000)
+
+    async def stream():
+        writer = main.RecordWriter(local_flush=250)
+        for n in range(UPLOAD_RECORDS):
+            await writer.add(record("upload", n))
+        await writer.close()
+        return writer
+
+    tracemalloc.start()
+    try:
+        writer = asyncio.run(stream())
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert writer.ingested == UPLOAD_RECORDS
+    assert len(index) == corpus_records + UPLOAD_RECORDS
+    return peak
+
+
+def test_streamed_upload_memory_does_not_grow_with_the_corpus(monkeypatch, tmp_path):
+    small = upload_peak(monkeypatch, tmp_path, 1000)
+    large = upload_peak(monkeypatch, tmp_path, 20000)
+    # Merging the upload into the corpus used to rewrite it, so the peak tracked the corpus size.
+    assert large < small * 1.25 + 512 * 1024, (small, large)
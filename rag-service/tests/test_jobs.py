@@ -0,0 +1,63 @@
+import asyncio
+
+import httpx
+import pytest
+
+import main
+from jobs import JobQueueFull, JobRunner
+
+
+def test_run_waits_for_a_slot_and_reraises():
+    async def scenario():
+        runner = JobRunner(concurrency=1, max_pending=2)
+        release = asyncio.Event()
+
+        async def blocker(job):
+            await release.wait()
+            return {"blocked": True}
+
+        async def broken(job):
+            raise ValueError("bad input")
+
+        background = runner.submit("ingest", blocker)
+        waiting = asyncio.ensure_future(runner.run("ingest", broken))
+        await asyncio.sleep(0.01)
+        assert runner.status()["queued"] == 1 and not waiting.done()
+        with pytest.raises(JobQueueFull):
+            runner.submit("ingest", blocker)
+
+        release.set()
+        with pytest.raises(ValueError):
+            await waiting
+        assert background.result == {"blocked": True}
+
+    asyncio.run(scenario())
+
+
+def test_synchronous_ingests_share_the_job_limit(weaviate, monkeypatch):
+    monkeypatch.setattr(main, "job_runner", JobRunner(concurrency=1, max_pending=1))
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            release = asyncio.Event()
+
+            async def hold(job):
+                await release.wait()
+                return {}
+
+            main.job_runner.submit("ingest", hold)
+            body = b'{"text": "Labels must list fibre composition.", "source": "eu"}\n'
+            stream = await client.post("/ingest/stream", content=body)
+            wait = await client.post("/ingest?wait=true", json={"docs": [{"text": "Care labels.", "source": "eu"}]})
+            assert stream.status_code == wait.status_code == 429
+
+            release.set()
+            await asyncio.sleep(0)
+            stream = await client.post("/ingest/stream", content=body)
+            assert stream.status_code == 200 and stream.json()["ingested"] == 1
+            wait = await client.post("/ingest?wait=true", json={"docs": [{"text": "Care labels.", "source": "eu"}]})
+            assert wait.status_code == 200 and wait.json()["ingested"] == 1
+            assert main.job_runner.status()["succeeded"] == 3
+
+    asyncio.run(scenario())
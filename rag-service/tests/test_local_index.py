@@ -0,0 +1,61 @@
+from local_index import LocalIndex, write_index
+
+
+def records(prefix, count, source="s", text="cotton shirt"):
+    return [{"id": f"{prefix}-{n}", "text": f"{text} {prefix} {n}", "source": source} for n in range(count)]
+
+
+def test_add_records_appends_without_rewriting_existing_segments(tmp_path):
+    index = LocalIndex(str(tmp_path / "bm25.idx"))
+    index.replace_records(records("base", 1000))
+    base = sorted(index.directory.iterdir())
+    base_mtime = base[0].stat().st_mtime_ns
+
+    assert index.add_records(records("new", 10)) == 10
+    assert index.add_records(records("new", 10)) == 0
+
+    assert len(index) == 1010
+    assert index.status()["segments"] == 2
+    assert base[0].exists() and base[0].stat().st_mtime_ns == base_mtime
+    assert index.search("new 3", 1)[0]["text"] == "cotton shirt new 3"
+
+
+def test_small_segments_merge_but_never_past_the_cap(tmp_path, monkeypatch):
+    monkeypatch.setattr("local_index.LOCAL_INDEX_SEGMENT_MAX_DOCS", 100)
+    index = LocalIndex(str(tmp_path / "bm25.idx"))
+    for batch in range(30):
+        index.add_records(records(f"b{batch}", 10))
+
+    status = index.status()
+    assert status["documents"] == 300
+    assert status["merges"] > 0
+    assert 3 <= status["segments"] <= 8
+    assert len(list(index.directory.iterdir())) == status["segments"]
+
+
+def test_deletes_are_persisted_and_compacted(tmp_path):
+    path = tmp_path / "bm25.idx"
+    index = LocalIndex(str(path))
+    index.replace_records(records("keep", 20, source="a") + records("drop", 20, source="b", text="wool coat"))
+
+    assert index.remove_ids({"drop-0"}) == 1
+    assert index.status()["deleted"] == 1
+    assert index.reconcile({"b": {"drop-1"}}) == 18
+    # More than the compaction ratio was deleted, so the segment was rewritten without them.
+    assert index.status()["deleted"] == 0
+
+    reopened = LocalIndex(str(path))
+    assert reopened.load()
+    assert len(reopened) == 21
+    assert [hit["text"] for hit in reopened.search("wool", 5)] == ["wool coat drop 1"]
+
+
+def test_unreadable_index_is_not_loaded_and_can_be_rebuilt(tmp_path):
+    path = tmp_path / "bm25.idx"
+    write_index(path, records("old", 5))
+
+    index = LocalIndex(str(path))
+    assert not index.load()
+    assert index.load_error
+    assert index.replace_records(records("new", 3)) == 3
+    assert LocalIndex(str(path)).load()
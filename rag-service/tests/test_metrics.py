@@ -0,0 +1,24 @@
+import pytest
+
+from metrics import Counter, Metric
+
+
+def test_metric_subclasses_must_implement_samples():
+    class Incomplete(Metric):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete("incomplete", "no samples")
+
+
+def test_counter_renders_labelled_samples():
+    counter = Counter("test_events_total", "Events.", ("kind",))
+    counter.inc(kind="a")
+    counter.inc(2, kind="b")
+
+    assert counter.render().splitlines() == [
+        "# HELP test_events_total Events.",
+        "# TYPE test_events_total counter",
+        'test_events_total{kind="a"} 1',
+        'test_events_total{kind="b"} 2',
+    ]
@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import random
+import threading
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from typing_extensions import TypedDict
+
+WEAVIATE_BATCH_MAX_SIZE = max(1, int(os.getenv("WEAVIATE_BATCH_MAX_SIZE", "100")))
+WEAVIATE_BATCH_MIN_SIZE = max(1, int(os.getenv("WEAVIATE_BATCH_MIN_SIZE", "5")))
+WEAVIATE_BATCH_MAX_RETRIES = max(0, int(os.getenv("WEAVIATE_BATCH_MAX_RETRIES", "4")))
+WEAVIATE_BATCH_BACKOFF = float(os.getenv("WEAVIATE_BATCH_BACKOFF", "0.5"))
+WEAVIATE_BATCH_BACKOFF_MAX = float(os.getenv("WEAVIATE_BATCH_BACKOFF_MAX", "8"))
+
+# Consecutive clean sends before a shrunken batch size is allowed to grow again.
+_GROW_AFTER = 4
+
+
+class BatchTooLarge(RuntimeError):
+    """Weaviate rejected or timed out on a batch; the same objects should be sent in smaller batches."""
+
+
+class BatchTransientError(RuntimeError):
+    """The whole batch request failed in a way that may succeed on retry (429, 5xx, connection errors)."""
+
+
+class BatchRejected(RuntimeError):
+    """The whole batch request failed permanently (4xx other than 413/429)."""
+
+
+class FailedObject(TypedDict):
+    id: str
+    source: str
+    error: str
+    attempts: int
+
+
+class BatchReport(TypedDict):
+    inserted: int
+    failed: List[FailedObject]
+    retries: int
+    splits: int
+
+
+# ``send(objects)`` returns ``(object id, error or None)`` for every object in the batch.
+SendBatch = Callable[[List[Dict[str, Any]]], Awaitable[List[Tuple[str, Optional[str]]]]]
+
+
+class AdaptiveBatchSize:
+    """
+    Batch size shared by every writer: halved on 413/timeouts, doubled back
+    toward the maximum after a run of clean sends.
+    """
+
+    def __init__(self, maximum: int = WEAVIATE_BATCH_MAX_SIZE, minimum: int = WEAVIATE_BATCH_MIN_SIZE) -> None:
+        self.maximum = maximum
+        self.minimum = min(minimum, maximum)
+        self.current = maximum
+        self._clean_sends = 0
+        self._lock = threading.Lock()
+        self.shrinks = 0
+        self.grows = 0
+
+    def shrink(self, attempted: int) -> int:
+        with self._lock:
+            self._clean_sends = 0
+            target = max(self.minimum, attempted // 2)
+            if target < self.current:
+                self.current = target
+                self.shrinks += 1
+            return self.current
+
+    def succeeded(self) -> None:
+        with self._lock:
+            if self.current >= self.maximum:
+                return
+            self._clean_sends += 1
+            if self._clean_sends >= _GROW_AFTER:
+                self._clean_sends = 0
+                self.current = min(self.maximum, self.current * 2)
+                self.grows += 1
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "current": self.current,
+            "minimum": self.minimum,
+            "maximum": self.maximum,
+            "shrinks": self.shrinks,
+            "grows": self.grows,
+        }
+
+
+batch_size = AdaptiveBatchSize()
+
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter, capped at ``WEAVIATE_BATCH_BACKOFF_MAX``."""
+    ceiling = min(WEAVIATE_BATCH_BACKOFF_MAX, WEAVIATE_BATCH_BACKOFF * (2 ** max(0, attempt - 1)))
+    return random.uniform(0, ceiling)
+
+
+def failure(obj: Dict[str, Any], error: str, attempts: int) -> FailedObject:
+    source = str((obj.get("properties") or {}).get("source") or "")
+    return {"id": obj["id"], "source": source, "error": error, "attempts": attempts}
+
+
+async def write_objects(
+    objects: List[Dict[str, Any]],
+    send: SendBatch,
+    sizer: Optional[AdaptiveBatchSize] = None,
+    max_retries: int = WEAVIATE_BATCH_MAX_RETRIES,
+) -> BatchReport:
+    """
+    Send ``objects`` through ``send`` in adaptive sub-batches, retrying only what failed.
+
+    Objects that come back with per-object errors are re-queued with backoff until
+    they exhaust ``max_retries`` and are then reported as failed; the rest of the
+    ingest carries on. ``BatchTooLarge`` splits the batch without spending an
+    attempt (until the minimum size is reached). ``BatchTransientError`` retries the
+    whole sub-batch and is re-raised once retries are exhausted, since it means
+    Weaviate itself is unavailable. Object ids are deterministic, so resending an
+    object whose first write actually landed (e.g. after a timeout) is harmless.
+    """
+    sizer = sizer or batch_size
+    report: BatchReport = {"inserted": 0, "failed": [], "retries": 0, "splits": 0}
+    pending: Deque[Tuple[Dict[str, Any], int]] = deque((obj, 0) for obj in objects)
+
+    while pending:
+        size = min(sizer.current, len(pending))
+        chunk = [pending.popleft() for _ in range(size)]
+        attempt = max(attempts for _, attempts in chunk)
+        try:
+            results = await send([obj for obj, _ in chunk])
+        except BatchTooLarge as exc:
+            if size > sizer.minimum:
+                sizer.shrink(size)
+                report["splits"] += 1
+                pending.extendleft(reversed(chunk))
+                continue
+            if attempt >= max_retries:
+                report["failed"].extend(failure(obj, str(exc), attempts + 1) for obj, attempts in chunk)
+                continue
+            report["retries"] += 1
+            await asyncio.sleep(backoff_delay(attempt + 1))
+            pending.extendleft(reversed([(obj, attempts + 1) for obj, attempts in chunk]))
+            continue
+        except BatchTransientError:
+            if attempt >= max_retries:
+                raise
+            report["retries"] += 1
+            await asyncio.sleep(backoff_delay(attempt + 1))
+            pending.extendleft(reversed([(obj, attempts + 1) for obj, attempts in chunk]))
+            continue
+
+        sizer.succeeded()
+        errors = {object_id: error for object_id, error in results if error}
+        retry: List[Tuple[Dict[str, Any], int]] = []
+        for obj, attempts in chunk:
+            error = errors.get(obj["id"])
+            if not error:
+                report["inserted"] += 1
+            elif attempts >= max_retries:
+                report["failed"].append(failure(obj, error, attempts + 1))
+            else:
+                retry.append((obj, attempts + 1))
+        if retry:
+            report["retries"] += 1
+            await asyncio.sleep(backoff_delay(max(attempts for _, attempts in retry)))
+            pending.extend(retry)
+
+    return report
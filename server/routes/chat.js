@@ -71,10 +71,16 @@ router.get('/health', async (_req, res) => {
 });
 
 router.post('/ingest-crawled', async (_req, res) => {
+  // Returns 202 with a job id right away; poll /jobs/:id for progress.
   const result = await callRag('/ingest-crawled', { method: 'POST' });
   res.status(result.status).json(result.data);
 });
 
+router.get('/jobs/:id', async (req, res) => {
+  const result = await callRag(`/jobs/${encodeURIComponent(req.params.id)}`);
+  res.status(result.status).json(result.data);
+});
+
 router.post('/', async (req, res) => {
   const query = typeof req.body?.query === 'string' ? req.body.query.trim() : '';
   const limit = Number.isInteger(req.body?.limit) ? req.body.limit : 5;
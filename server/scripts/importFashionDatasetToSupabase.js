@@ -40,6 +40,9 @@ let s3Client = null;
 const FASHION_DATASET_DIR = process.env.FASHION_DATASET_DIR || path.join(process.cwd(), 'data/fashion-product-images-dataset');
 const STYLES_CSV_PATH = process.env.FASHION_STYLES_CSV || path.join(FASHION_DATASET_DIR, 'styles.csv');
 const IMAGES_DIR = process.env.FASHION_IMAGES_DIR || path.join(FASHION_DATASET_DIR, 'images');
+// Written by precutFashionDatasetImages.py; mirrors IMAGES_DIR with <stem>_cutout.png files.
+const CUTOUTS_DIR = process.env.FASHION_CUTOUTS_DIR || path.join(FASHION_DATASET_DIR, 'cutouts');
+const FASHION_USE_CUTOUTS = String(process.env.FASHION_USE_CUTOUTS || 'true').toLowerCase() !== 'false';
 
 const FASHION_SOURCE = process.env.FASHION_SOURCE || 'fashion-product-images-kaggle';
 const FASHION_DATASET_NAME = process.env.FASHION_DATASET_NAME || 'Fashion Product Images Dataset';
@@ -219,6 +222,24 @@ function findImageFileById(id) {
   return null;
 }
 
+function findCutoutFile(image) {
+  if (!FASHION_USE_CUTOUTS) {
+    return null;
+  }
+  const relative = path.relative(IMAGES_DIR, image.fullPath);
+  const stem = path.basename(relative, path.extname(relative));
+  const filename = `${stem}_cutout.png`;
+  const fullPath = path.join(CUTOUTS_DIR, path.dirname(relative), filename);
+  if (!fs.existsSync(fullPath)) {
+    return null;
+  }
+  return {
+    fullPath,
+    filename,
+    ext: '.png'
+  };
+}
+
 function toPublicObjectPath(filename) {
   return `catalog/${filename}`;
 }
@@ -317,7 +338,11 @@ async function uploadImageToSupabaseS3({ localPath, objectPath, contentType }) {
   await s3Client.send(command);
 }
 
-function toProductPayload({ row, sourceId, publicUrl }) {
+function toCutoutObjectPath(filename) {
+  return `catalog/cutouts/${filename}`;
+}
+
+function toProductPayload({ row, sourceId, publicUrl, cutoutUrl = '' }) {
   if (!publicUrl) {
     throw new Error('Missing product image public URL (set PRODUCT_IMAGE_PUBLIC_BASE_URL or use Supabase public storage)');
   }
@@ -352,7 +377,8 @@ function toProductPayload({ row, sourceId, publicUrl }) {
     source: FASHION_SOURCE,
     sourceId,
     license: 'Kaggle Dataset License',
-    image: publicUrl,
+    // The try-on view skips segmentation for *_cutout.png images; the grid keeps showing the original photo.
+    image: cutoutUrl || publicUrl,
     thumbnail: publicUrl,
     color: colorToHex(baseColour),
     metadata: {
@@ -429,6 +455,7 @@ async function main() {
   console.log('[fashion-import] starting Kaggle -> Supabase import');
   console.log(`[fashion-import] styles file: ${STYLES_CSV_PATH}`);
   console.log(`[fashion-import] images dir: ${IMAGES_DIR}`);
+  console.log(`[fashion-import] cutouts dir: ${FASHION_USE_CUTOUTS ? CUTOUTS_DIR : 'disabled'}`);
   console.log(`[fashion-import] source: ${FASHION_SOURCE}`);
   console.log(`[fashion-import] upload mode: ${PRODUCT_IMAGE_S3_UPLOAD_ENABLED ? 's3' : 'storage-rest'}`);
   if (PRODUCT_IMAGE_S3_UPLOAD_ENABLED) {
@@ -440,6 +467,7 @@ async function main() {
   let scanned = 0;
   let included = 0;
   let uploaded = 0;
+  let cutouts = 0;
   let skipped = 0;
   let imported = 0;
 
@@ -464,6 +492,9 @@ async function main() {
 
     const objectPath = toPublicObjectPath(image.filename);
     const publicUrl = FASHION_IMPORT_METADATA ? buildPublicUrl(objectPath) : '';
+    const cutout = findCutoutFile(image);
+    const cutoutObjectPath = cutout ? toCutoutObjectPath(cutout.filename) : '';
+    const cutoutUrl = cutout && FASHION_IMPORT_METADATA ? buildPublicUrl(cutoutObjectPath) : '';
 
     if (FASHION_UPLOAD_IMAGES) {
       await uploadImageToSupabase({
@@ -472,10 +503,18 @@ async function main() {
         contentType: getContentType(image.ext)
       });
       uploaded += 1;
+      if (cutout) {
+        await uploadImageToSupabase({
+          localPath: cutout.fullPath,
+          objectPath: cutoutObjectPath,
+          contentType: getContentType(cutout.ext)
+        });
+        cutouts += 1;
+      }
     }
 
     if (FASHION_IMPORT_METADATA) {
-      const product = toProductPayload({ row, sourceId, publicUrl });
+      const product = toProductPayload({ row, sourceId, publicUrl, cutoutUrl });
       batch.push(product);
     } else {
       // Keep accounting consistent when metadata import is disabled.
@@ -501,6 +540,7 @@ async function main() {
   console.log(`[fashion-import] scanned=${scanned}`);
   console.log(`[fashion-import] included=${included}`);
   console.log(`[fashion-import] uploaded=${uploaded}`);
+  console.log(`[fashion-import] cutouts=${cutouts}`);
   console.log(`[fashion-import] imported=${imported}`);
   console.log(`[fashion-import] skipped=${skipped}`);
 }
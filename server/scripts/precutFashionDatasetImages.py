@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Pre-compute garment cutouts for the Kaggle fashion dataset so try-on never has to segment on the request path.
+
+Runs the same rembg + MediaPipe pipeline as the RAG service (rag-service/segmentation.py) over every image in
+data/fashion-product-images-dataset/images using all CPU cores. Each cutout mirrors its source's path under
+the output directory (images/a/123.jpg -> cutouts/a/123_cutout.png), so same-named images in different
+folders never collide. importFashionDatasetToSupabase.js picks these files up as the product image, which
+CameraFeed.js already treats as pre-cut.
+
+A manifest records each source image's size, mtime and hash, so reruns only process new or changed images.
+Interrupted runs resume where they stopped.
+
+Requires:
+  - python3
+  - pip install -r rag-service/requirements.txt
+
+Example:
+  python3 server/scripts/precutFashionDatasetImages.py
+  python3 server/scripts/precutFashionDatasetImages.py --workers 4 --limit 500
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(REPO_ROOT / "rag-service"))
+
+from segmentation import (  # noqa: E402
+    MIN_VISIBLE_PIXELS,
+    SEGMENTATION_VARIANT,
+    encode_png,
+    remove_background_and_face,
+    warm_worker_models,
+)
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".webp"}
+MANIFEST_NAME = "manifest.json"
+
+
+def iter_images(images_dir: Path) -> Iterator[Path]:
+    for path in sorted(images_dir.rglob("*")):
+        if path.suffix.lower() in IMAGE_SUFFIXES and path.is_file() and not path.name.endswith("_cutout.png"):
+            yield path
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as handle:
+        for block in iter(lambda: handle.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_manifest(path: Path) -> Dict[str, Dict[str, Any]]:
+    try:
+        payload = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    if payload.get("variant") != SEGMENTATION_VARIANT:
+        # Different model settings produce different cutouts; start over.
+        print(f"[precut] manifest variant changed ({payload.get('variant')} -> {SEGMENTATION_VARIANT}), reprocessing")
+        return {}
+    entries = payload.get("images")
+    return entries if isinstance(entries, dict) else {}
+
+
+def save_manifest(path: Path, entries: Dict[str, Dict[str, Any]]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".json.tmp")
+    tmp_path.write_text(
+        json.dumps({"variant": SEGMENTATION_VARIANT, "images": entries}, indent=1, sort_keys=True),
+        encoding="utf-8",
+    )
+    os.replace(tmp_path, path)
+
+
+def cutout_rel_path(rel: str) -> str:
+    """Output path, relative to the cutouts directory, for a source image relative to the images directory."""
+    source = Path(rel)
+    return source.with_name(f"{source.stem}_cutout.png").as_posix()
+
+
+def needs_processing(source: Path, entry: Optional[Dict[str, Any]], out_dir: Path, retry_errors: bool) -> bool:
+    if not entry:
+        return True
+    if entry.get("status") == "error":
+        return retry_errors
+    if entry.get("status") == "ok" and not (out_dir / entry.get("output", "")).is_file():
+        return True
+
+    stat = source.stat()
+    if entry.get("size") == stat.st_size and entry.get("mtime_ns") == stat.st_mtime_ns:
+        return False
+    # Timestamp changed (e.g. re-copied by the downloader); only redo if the bytes changed too.
+    return entry.get("sha256") != file_sha256(source)
+
+
+def precut_image(source: str, destination: str, output: str) -> Dict[str, Any]:
+    """Worker: segment one image and write its cutout. Runs inside a pool process."""
+    source_path = Path(source)
+    stat = source_path.stat()
+    image_bytes = source_path.read_bytes()
+    record: Dict[str, Any] = {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha256": hashlib.sha256(image_bytes).hexdigest(),
+        "output": output,
+    }
+    try:
+        cutout, visible = remove_background_and_face(image_bytes)
+    except Exception as exc:
+        record.update({"status": "error", "error": str(exc)})
+        return record
+
+    record["visible_pixels"] = visible
+    if visible < MIN_VISIBLE_PIXELS:
+        record["status"] = "too_small"
+        return record
+
+    destination_path = Path(destination)
+    destination_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = destination_path.with_name(f"{destination_path.name}.tmp")
+    tmp_path.write_bytes(encode_png(cutout))
+    os.replace(tmp_path, destination_path)
+    record["status"] = "ok"
+    return record
+
+
+def run_pool(
+    jobs: List[Tuple[str, Path]],
+    out_dir: Path,
+    workers: int,
+    manifest: Dict[str, Dict[str, Any]],
+    manifest_path: Path,
+    flush_every: int,
+) -> Dict[str, int]:
+    counts = {"ok": 0, "too_small": 0, "error": 0}
+    pending: Dict[Future, str] = {}
+    job_iter = iter(jobs)
+    window = workers * 4
+    done_since_flush = 0
+    started = time.time()
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=warm_worker_models) as executor:
+        while True:
+            while len(pending) < window:
+                job = next(job_iter, None)
+                if job is None:
+                    break
+                rel, source = job
+                output = cutout_rel_path(rel)
+                pending[executor.submit(precut_image, str(source), str(out_dir / output), output)] = rel
+            if not pending:
+                break
+
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                rel = pending.pop(future)
+                try:
+                    record = future.result()
+                except Exception as exc:
+                    record = {"status": "error", "error": str(exc)}
+                manifest[rel] = record
+                counts[record["status"]] += 1
+                done_since_flush += 1
+                if record["status"] == "error":
+                    print(f"[precut] error {rel}: {record.get('error')}", file=sys.stderr)
+
+            if done_since_flush >= flush_every:
+                save_manifest(manifest_path, manifest)
+                done_since_flush = 0
+                processed = sum(counts.values())
+                rate = processed / max(time.time() - started, 1e-6)
+                print(f"[precut] {processed}/{len(jobs)} images ({rate:.1f}/s)")
+
+    save_manifest(manifest_path, manifest)
+    return counts
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Pre-compute _cutout.png files for the Kaggle fashion dataset")
+    parser.add_argument(
+        "--images",
+        default="data/fashion-product-images-dataset/images",
+        help="Source images directory in repo (default: data/fashion-product-images-dataset/images)",
+    )
+    parser.add_argument(
+        "--out",
+        default="data/fashion-product-images-dataset/cutouts",
+        help="Output directory for cutouts and manifest (default: data/fashion-product-images-dataset/cutouts)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Worker processes, each holding its own models (default: all cores)",
+    )
+    parser.add_argument("--limit", type=int, default=0, help="Only process the first N pending images (0 = all)")
+    parser.add_argument("--retry-errors", action="store_true", help="Reprocess images that failed previously")
+    parser.add_argument("--flush-every", type=int, default=200, help="Write the manifest every N images")
+    args = parser.parse_args()
+
+    images_dir = (REPO_ROOT / args.images).resolve()
+    out_dir = (REPO_ROOT / args.out).resolve()
+    if not images_dir.is_dir():
+        print(f"ERROR: images directory not found: {images_dir}", file=sys.stderr)
+        print("Run server/scripts/downloadFashionDatasetFromKaggleHub.py first.", file=sys.stderr)
+        return 2
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = out_dir / MANIFEST_NAME
+    manifest = load_manifest(manifest_path)
+
+    print(f"[precut] scanning {images_dir}")
+    jobs: List[Tuple[str, Path]] = []
+    total = 0
+    for source in iter_images(images_dir):
+        total += 1
+        rel = source.relative_to(images_dir).as_posix()
+        if needs_processing(source, manifest.get(rel), out_dir, args.retry_errors):
+            jobs.append((rel, source))
+    if args.limit > 0:
+        jobs = jobs[: args.limit]
+
+    print(f"[precut] {total} images, {len(jobs)} new or changed, variant {SEGMENTATION_VARIANT}")
+    if not jobs:
+        print("[precut] nothing to do")
+        return 0
+
+    workers = max(1, args.workers)
+    print(f"[precut] processing with {workers} workers -> {out_dir}")
+    counts = run_pool(jobs, out_dir, workers, manifest, manifest_path, max(1, args.flush_every))
+
+    print(f"[precut] complete: {counts['ok']} cutouts, {counts['too_small']} too small, {counts['error']} errors")
+    print(f"[precut] manifest: {manifest_path}")
+    return 1 if counts["error"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())